@@ -64,6 +64,15 @@ def run_parser():
         type=str,
         help="The Path to the folder which all output files will be placed.",
     )
+    PARSER.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="If True and the last Run folder in root_output_folder did not \
+        complete, resume it from its checkpoint.json rather than starting a new Run. \
+        Seeds and mutants already made are reused, and ligands with finished 3D_SDFs \
+        and PDBs are not converted again. Default is False.",
+    )
     PARSER.add_argument(
         "--source_compound_file",
         "-s",
@@ -167,6 +176,16 @@ def run_parser():
         multithreading: mpi, multithreading, or serial. serial will override \
         number_of_processors and force it to be on a single processor.",
     )
+    PARSER.add_argument(
+        "--persistent_worker_pool",
+        action="store_true",
+        default=False,
+        help="If True in multithreading mode, the worker processes are started once \
+        and reused for mutation and filtering rather than restarting them for \
+        every batch of jobs. The supervised worker processes which run 3D \
+        conversion are likewise started once and reused by every generation; \
+        only a worker whose ligand stalls is killed and replaced. Default is False.",
+    )
 
     # Populations settings
     PARSER.add_argument(
@@ -176,6 +195,24 @@ def run_parser():
         help="The number of ligands which will be created via mutation in each \
         generation besides the first.",
     )
+    PARSER.add_argument(
+        "--dedup_by_inchikey",
+        action="store_true",
+        default=False,
+        help="If True, mutants are deduplicated by InChIKey rather than by SMILES \
+        string, so the same compound made via different reactions is only kept once. \
+        This is slower than deduplicating by SMILES. Default is False.",
+    )
+    PARSER.add_argument(
+        "--streaming_chunk_size",
+        type=int,
+        default=0,
+        help="If greater than 0, mutants are made in chunks of this size. Each \
+        chunk is appended to the output .smi files and converted to 3D as soon as it \
+        is made, so memory use stays constant and downstream docking can start \
+        before mutation finishes. Default is 0, which makes every mutant before \
+        saving or converting any.",
+    )
 
     ####### FILTER VARIABLES
     PARSER.add_argument(
@@ -259,6 +296,34 @@ def run_parser():
         Must be a list of lists \
         [[name_filter1, Path/to/name_filter1.py],[name_filter2, Path/to/name_filter2.py]]",
     )
+    PARSER.add_argument(
+        "--filter_cache_size",
+        type=int,
+        default=100000,
+        help="Max number of filter results each processor keeps in memory. \
+        Ligands already in the cache are not filtered again. Entries are keyed by \
+        canonical SMILES and the chosen filters. The least recently used entries \
+        are evicted once the cache is full. Use 0 to turn off the cache. \
+        Default is 100000.",
+    )
+    PARSER.add_argument(
+        "--filter_cache_file",
+        type=str,
+        default=None,
+        help="PATH to an SQLite file which stores the filter results of every \
+        processor, so they can be shared between runs. Results are looked up in \
+        it when they are not in memory. The file is created if it does not exist. \
+        Use a new file if a custom filter is changed. Default is None \
+        (results are only kept in memory).",
+    )
+    PARSER.add_argument(
+        "--filter_cache_max_disk_entries",
+        type=int,
+        default=10000000,
+        help="Max number of filter results stored in filter_cache_file. When it \
+        is exceeded the least recently used entries are evicted. \
+        Default is 10000000.",
+    )
 
     # gypsum # max variance is the number of conformers made per ligand
     PARSER.add_argument(
@@ -322,6 +387,67 @@ def run_parser():
         how long it takes to run. If increasing gypsum settings it is best to increase \
         the gypsum_timeout_limit. Default gypsum_timeout_limit is 15 seconds",
     )
+    PARSER.add_argument(
+        "--gypsum_batch_size",
+        type=int,
+        default=1,
+        help="Number of ligands converted to 3D per Gypsum-DL job. Batching \
+        ligands sets up Gypsum-DL once per batch rather than once per ligand and \
+        writes one submission .smi file per batch. Each ligand of a batch may run \
+        for gypsum_timeout_limit seconds. If a ligand times out the rest of its \
+        batch is retried straight away; if a batch fails its unfinished ligands \
+        are retried one at a time. Default is 1 (one ligand per job).",
+    )
+    PARSER.add_argument(
+        "--gypsum_tautomer_backend",
+        choices=["molvs", "rdkit"],
+        default="molvs",
+        help="The backend Gypsum-DL uses to enumerate tautomers. molvs uses the \
+        bundled pure-Python MolVS TautomerEnumerator. rdkit uses RDKit's C++ \
+        rdMolStandardize.TautomerEnumerator with the same MolVS transforms, and \
+        checks each tautomer's aromatic rings and chiral centers in the same pass. \
+        It is faster but NOT equivalent to molvs: it does not make tautomers which \
+        move a hydrogen off of a charged atom and keeps the stereochemistry of \
+        double bonds not involved in the tautomerization, so some molecules get \
+        different tautomers. A warning is printed when it is selected. Default is \
+        molvs.",
+    )
+    PARSER.add_argument(
+        "--conformer_cache_file",
+        type=str,
+        default=None,
+        help="PATH to an SQLite file which caches the 3D .sdf output of \
+        Gypsum-DL. Ligands found in the cache skip Gypsum-DL. The file is created \
+        if it does not exist and can be shared between runs. Entries are keyed by \
+        canonical SMILES plus the pH range, pka_precision, gypsum_thoroughness and \
+        max_variants_per_compound. Default is None (no cache).",
+    )
+    PARSER.add_argument(
+        "--conformer_cache_max_size_mb",
+        type=float,
+        default=1024,
+        help="Max size in MB of the .sdf data stored in the conformer cache. \
+        When it is exceeded the least recently used entries are evicted. \
+        Default is 1024.",
+    )
+    PARSER.add_argument(
+        "--output_format_3d",
+        choices=["pdb", "sharded_sdf"],
+        default="pdb",
+        help="How the 3D output is stored. pdb writes one .sdf file per ligand to \
+        3D_SDFs and one .pdb file per pose to PDBs. sharded_sdf instead appends \
+        every pose to a few large .sdf files in 3D_SDF_Shards, with an index \
+        (shard_index.tsv) of the shard, byte offset and length of each pose, so \
+        poses can be read with SDFShardReader without a file per pose. \
+        Default is pdb.",
+    )
+    PARSER.add_argument(
+        "--ligands_per_shard",
+        type=int,
+        default=1000,
+        help="Max number of ligands per .sdf shard when output_format_3d is \
+        sharded_sdf. Default is 1000.",
+    )
 
     # mpi mode pre-Run so there are python cache files without EOF Errors
     PARSER.add_argument(
@@ -0,0 +1,347 @@
+"""
+This script compares the two backends Gypsum-DL can use to make tautomers
+(--gypsum_tautomer_backend molvs or rdkit) on sets of source compounds.
+
+Each compound is desalted and protonated exactly as Gypsum-DL does before
+it makes tautomers. The tautomers of every protonation state are then made
+with both backends, including the removal of tautomers which break an
+aromatic ring or change the number of chiral centers. For every .smi file
+this prints the time each backend took, how many protonation states got the
+same set of tautomers from both backends and how many tautomers only one
+backend made.
+
+The steps are run in serial, so the times compare the work done per
+molecule. In a parallel run the rdkit backend also saves the two extra
+parallel passes the molvs backend uses to check the tautomers.
+
+Example submit:
+
+python SMILESClickChem/accessory_scripts/benchmark_tautomer_backends.py \
+--source_compound_files SMILESClickChem/source_compounds/naphthalene_smiles.smi \
+SMILESClickChem/source_compounds/PARPi.smi \
+--max_compounds_per_file 500
+"""
+import __future__
+
+import os
+import io
+import sys
+import glob
+import time
+import random
+import argparse
+import contextlib
+
+from rdkit import RDLogger
+
+# Disable the unnecessary RDKit warnings
+RDLogger.DisableLog("rdApp.*")
+
+# The tautomers must be made by the same code SMILESClickChem runs so we
+# import Gypsum-DL from the SMILESClickChem package
+SMILESCLICKCHEM_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GYPSUM_DIR = os.path.join(
+    SMILESCLICKCHEM_DIR, "smilesclickchem", "operators", "convert_files", "gypsum_dl"
+)
+sys.path.append(GYPSUM_DIR)
+
+from gypsum_dl.MolContainer import MolContainer
+from gypsum_dl.Steps.SMILES.DeSaltOrigSmiles import desalt_orig_smi
+from gypsum_dl.Steps.SMILES.AddHydrogens import add_hydrogens
+from gypsum_dl.Steps.SMILES.MakeTautomers import enumerate_tauts
+from gypsum_dl.Steps.SMILES.MakeTautomers import TAUTOMER_BACKENDS
+
+
+def get_usable_format(infile, max_compounds):
+    """
+    Read up to max_compounds SMILES and names from an .smi file. If the file
+    has more compounds a random sample is taken.
+
+    Inputs:
+    :param str infile: the PATH of a formatted .smi file
+    :param int max_compounds: the max number of compounds to read
+
+    Returns:
+    :returns: list usable_list_of_smiles: list of [SMILES, name] pairs
+    """
+    usable_list_of_smiles = []
+    with open(infile) as smiles_file:
+        for line in smiles_file:
+            parts = line.replace("\t", " ").split()
+            if len(parts) < 2:
+                continue
+            usable_list_of_smiles.append([parts[0], parts[1]])
+
+    if len(usable_list_of_smiles) > max_compounds:
+        usable_list_of_smiles = random.sample(usable_list_of_smiles, max_compounds)
+
+    return usable_list_of_smiles
+
+
+def make_protonated_containers(list_of_smiles, vars):
+    """
+    Make the Gypsum-DL MolContainers of a list of compounds, desalted and
+    protonated as they are before Gypsum-DL makes tautomers.
+
+    Inputs:
+    :param list list_of_smiles: list of [SMILES, name] pairs
+    :param dict vars: Dictionary of User variables
+
+    Returns:
+    :returns: list contnrs: the MolContainers
+    """
+    contnrs = []
+    for smiles, name in list_of_smiles:
+        contnr = MolContainer(smiles, name, len(contnrs), {})
+        if contnr.orig_smi_canonical is None:
+            continue
+        contnrs.append(contnr)
+
+    desalt_orig_smi(contnrs, 1, "serial", None)
+    add_hydrogens(
+        contnrs,
+        vars["min_ph"],
+        vars["max_ph"],
+        vars["pka_precision"],
+        vars["max_variants_per_compound"],
+        3,
+        1,
+        "serial",
+        None,
+    )
+
+    return contnrs
+
+
+def run_backend(contnrs, tautomer_backend, vars):
+    """
+    Make the tautomers of every protonation state in a list of MolContainers
+    with one backend.
+
+    Inputs:
+    :param list contnrs: the MolContainers
+    :param str tautomer_backend: either "molvs" or "rdkit"
+    :param dict vars: Dictionary of User variables
+
+    Returns:
+    :returns: float run_time: the time taken in seconds
+    :returns: dict tautomers_by_mol: keys are (container index, genealogy of
+        the protonation state) and items are the set of SMILES of its
+        tautomers
+    """
+    # Gypsum-DL logs every tautomer it makes or discards
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.time()
+        taut_data = enumerate_tauts(
+            contnrs,
+            vars["max_variants_per_compound"],
+            1,
+            "serial",
+            False,
+            None,
+            tautomer_backend,
+        )
+        run_time = time.time() - start_time
+
+    tautomers_by_mol = {}
+    for contnr in contnrs:
+        for mol in contnr.mols:
+            tautomers_by_mol[(contnr.contnr_idx, tuple(mol.genealogy))] = set([])
+
+    for taut in taut_data:
+        # The genealogy of a tautomer is that of the protonation state it was
+        # made from, plus the tautomer itself if it is a new molecule
+        parent_genealogy = taut.genealogy
+        if len(parent_genealogy) > 0 and parent_genealogy[-1].endswith("(tautomer)"):
+            parent_genealogy = parent_genealogy[:-1]
+
+        key = (taut.contnr_idx, tuple(parent_genealogy))
+        tautomers_by_mol.setdefault(key, set([])).add(taut.smiles())
+
+    return run_time, tautomers_by_mol
+
+
+def compare_backends(infile, vars):
+    """
+    Time both backends on the compounds of an .smi file and compare the
+    tautomers they make.
+
+    Inputs:
+    :param str infile: the PATH of a formatted .smi file
+    :param dict vars: Dictionary of User variables
+
+    Returns:
+    :returns: dict results: the times and agreement of the backends
+    """
+    list_of_smiles = get_usable_format(infile, vars["max_compounds_per_file"])
+    with contextlib.redirect_stdout(io.StringIO()):
+        contnrs = make_protonated_containers(list_of_smiles, vars)
+
+    run_times = {}
+    tautomers = {}
+    for tautomer_backend in TAUTOMER_BACKENDS:
+        run_times[tautomer_backend], tautomers[tautomer_backend] = run_backend(
+            contnrs, tautomer_backend, vars
+        )
+
+    molvs_tautomers = tautomers["molvs"]
+    rdkit_tautomers = tautomers["rdkit"]
+    keys = set(molvs_tautomers.keys()) | set(rdkit_tautomers.keys())
+    num_same = 0
+    num_only_molvs = 0
+    num_only_rdkit = 0
+    num_shared = 0
+    for key in keys:
+        molvs_set = molvs_tautomers.get(key, set([]))
+        rdkit_set = rdkit_tautomers.get(key, set([]))
+        if molvs_set == rdkit_set:
+            num_same = num_same + 1
+        num_shared = num_shared + len(molvs_set & rdkit_set)
+        num_only_molvs = num_only_molvs + len(molvs_set - rdkit_set)
+        num_only_rdkit = num_only_rdkit + len(rdkit_set - molvs_set)
+
+    return {
+        "file": os.path.basename(infile),
+        "num_compounds": len(contnrs),
+        "num_mols": len(keys),
+        "molvs_time": run_times["molvs"],
+        "rdkit_time": run_times["rdkit"],
+        "num_same": num_same,
+        "num_shared": num_shared,
+        "num_only_molvs": num_only_molvs,
+        "num_only_rdkit": num_only_rdkit,
+    }
+
+
+def print_results(list_of_results):
+    """
+    Print a table of the results of every .smi file.
+
+    Inputs:
+    :param list list_of_results: the dict of results of each .smi file
+    """
+    header = "{:<32}{:>10}{:>8}{:>10}{:>10}{:>9}{:>10}{:>8}{:>8}{:>8}".format(
+        "file", "compounds", "mols", "molvs_s", "rdkit_s", "speedup",
+        "same_set", "shared", "molvs", "rdkit"
+    )
+    print(header)
+    print("-" * len(header))
+    for results in list_of_results:
+        if results["rdkit_time"] > 0:
+            speedup = results["molvs_time"] / results["rdkit_time"]
+        else:
+            speedup = 0.0
+        print(
+            "{:<32}{:>10}{:>8}{:>10.2f}{:>10.2f}{:>8.1f}x{:>9.1f}%{:>8}{:>8}{:>8}".format(
+                results["file"][:31],
+                results["num_compounds"],
+                results["num_mols"],
+                results["molvs_time"],
+                results["rdkit_time"],
+                speedup,
+                100.0 * results["num_same"] / max(results["num_mols"], 1),
+                results["num_shared"],
+                results["num_only_molvs"],
+                results["num_only_rdkit"],
+            )
+        )
+    print("")
+    print("compounds: compounds read; mols: protonation states given tautomers")
+    print("same_set: protonation states given the same tautomers by both backends")
+    print("shared/molvs/rdkit: tautomers made by both, only molvs or only rdkit")
+
+
+def run_main(vars):
+    """
+    This runs the benchmark on every .smi file.
+
+    Inputs:
+    :param dict vars: Dictionary of User variables
+    """
+    list_of_results = []
+    for infile in vars["source_compound_files"]:
+        random.seed(vars["seed"])
+        print("Benchmarking {}".format(infile))
+        list_of_results.append(compare_backends(infile, vars))
+
+    print("")
+    print_results(list_of_results)
+#
+def get_arguments_from_argparse(args_dict):
+    """
+    This function handles the arg parser arguments for the script.
+
+    Inputs:
+    :param dict args_dict: dictionary of parameters
+    Returns:
+    :returns: dict args_dict: dictionary of parameters
+    """
+    if len(args_dict["source_compound_files"]) == 0:
+        source_dir = os.path.join(SMILESCLICKCHEM_DIR, "source_compounds")
+        args_dict["source_compound_files"] = sorted(
+            glob.glob(os.path.join(source_dir, "*.smi"))
+        )
+
+    for infile in args_dict["source_compound_files"]:
+        if os.path.isfile(infile) is False:
+            raise ValueError("source_compound_files must be PATHs to .smi files")
+
+    if args_dict["max_compounds_per_file"] < 1:
+        raise ValueError("max_compounds_per_file must be an int greater than 0.")
+    if args_dict["max_variants_per_compound"] < 1:
+        raise ValueError("max_variants_per_compound must be an int greater than 0.")
+
+    return args_dict
+#
+
+
+# Argument parsing
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument(
+    "--source_compound_files",
+    type=str,
+    nargs="*",
+    default=[],
+    help="PATHs to the .smi files to benchmark. Default is every .smi file \
+    in SMILESClickChem/source_compounds/.",
+)
+PARSER.add_argument(
+    "--max_compounds_per_file",
+    type=int,
+    default=500,
+    help="Max number of compounds to take from each .smi file. Larger files \
+    are randomly sampled. Default is 500.",
+)
+PARSER.add_argument(
+    "--max_variants_per_compound",
+    type=int,
+    default=3,
+    help="Max number of tautomers made per protonation state, as \
+    SMILESClickChem passes to Gypsum-DL. Default is 3.",
+)
+PARSER.add_argument(
+    "--min_ph", type=float, default=6.4, help="Minimum pH to consider."
+)
+PARSER.add_argument(
+    "--max_ph", type=float, default=8.4, help="Maximum pH to consider."
+)
+PARSER.add_argument(
+    "--pka_precision",
+    type=float,
+    default=1.0,
+    help="Size of pH substructure ranges. See Dimorphite-DL publication for \
+    details.",
+)
+PARSER.add_argument(
+    "--seed",
+    type=int,
+    default=0,
+    help="Seed for sampling compounds and for the random choices of \
+    Dimorphite-DL. Default is 0.",
+)
+
+
+ARGS_DICT = vars(PARSER.parse_args())
+ARGS_DICT = get_arguments_from_argparse(ARGS_DICT)
+run_main(ARGS_DICT)
+print("done")
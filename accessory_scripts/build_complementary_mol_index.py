@@ -0,0 +1,315 @@
+"""
+This script will build a precomputed reactivity index for a complementary
+molecule library.
+
+Every compound in the complementary_mol_directory is sanitized and
+deprotanated exactly as SMILESClickChem does during Mutation. Compounds
+which fail, or which no longer match the SMARTS of their own functional
+group, are excluded. For every compound which passes, the deprotanated mol
+is stored as an RDKit mol binary along with the names of every functional
+group SMARTS it matches.
+
+The index is saved as complementary_mol_index.pkl. When this file is found
+within the complementary_mol_directory SMILESClickChem samples only from the
+index, so every complementary molecule drawn is a valid reactant.
+
+Rebuild the index whenever the .smi files or the functional group SMARTS
+are changed. Groups whose .smi file contents or SMARTS have changed since the
+index was built are sampled from the .smi file instead.
+
+Example submit:
+
+python SMILESClickChem/accessory_scripts/build_complementary_mol_index.py \
+--function_group_library \
+SMILESClickChem/smilesclickchem/operators/mutation/smiles_click_chem/reaction_libraries/all_rxns/All_Rxns_functional_groups.json \
+--complementary_mol_directory \
+SMILESClickChem/smilesclickchem/operators/mutation/smiles_click_chem/reaction_libraries/all_rxns/complementary_mol_dir
+"""
+import __future__
+
+import os
+import sys
+import json
+import argparse
+
+import rdkit
+import rdkit.Chem as Chem
+
+# Disable the unnecessary RDKit warnings
+rdkit.RDLogger.DisableLog("rdApp.*")
+
+import support_scripts.Multiprocess as mp
+
+# The index must be built with the same sanitization and file format used
+# by SMILESClickChem so we import them from the SMILESClickChem package
+SMILESCLICKCHEM_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(SMILESCLICKCHEM_DIR)
+
+import smilesclickchem.operators.convert_files.gypsum_dl.gypsum_dl.MolObjectHandling as MOH
+from smilesclickchem.operators.mutation.smiles_click_chem.complementary_mol_store import (
+    write_complementary_mol_index,
+    get_source_file_signature,
+    COMPLEMENTARY_MOL_INDEX_FILENAME,
+)
+
+
+def get_usable_format(infile):
+    """
+    This code takes a string for an file which is formatted as an .smi file. It
+    opens the file and reads in the components into a usable list.
+
+    Inputs:
+    :param str infile: the string of the PATHname of a formatted .smi file to
+        be read into the program
+
+    Returns:
+    :returns: list usable_list_of_smiles: list of SMILES and their associated
+        information formatted into a list which is usable by the rest of
+        SMILESClickChem
+    """
+    usable_list_of_smiles = []
+
+    if os.path.exists(infile) is False:
+        print("\nFile of Source compounds does not exist: {}\n".format(infile))
+        raise Exception("File of Source compounds does not exist")
+
+    with open(infile) as smiles_file:
+        for line in smiles_file:
+            parts = line.replace("\t", " ").split()
+            if len(parts) < 2:
+                continue
+            usable_list_of_smiles.append([parts[0], parts[1]])
+
+    return usable_list_of_smiles
+#
+def make_functional_group_mols(functional_group_dict):
+    """
+    Convert every functional group SMARTS to a query mol.
+
+    Inputs:
+    :param dict functional_group_dict: Dictionary of functional group names
+        and their SMARTS
+
+    Returns:
+    :returns: dict functional_group_mols: Dictionary of functional group names
+        and their query mols
+    """
+    functional_group_mols = {}
+    for group in functional_group_dict.keys():
+        group_mol = Chem.MolFromSmarts(str(functional_group_dict[group]))
+        if group_mol is None:
+            printout = "Functional group {} has an invalid SMARTS".format(group)
+            print(printout)
+            raise Exception(printout)
+        functional_group_mols[group] = group_mol
+
+    return functional_group_mols
+#
+def index_chunk_of_mols(mol_info_list, fun_group, functional_group_dict):
+    """
+    Sanitize, deprotanate and substructure match a chunk of complementary
+    molecules from a single functional group.
+
+    This mirrors the checks made on a complementary molecule in
+    SmilesClickChem.run_smiles_click.
+
+    Inputs:
+    :param list mol_info_list: list of [SMILES, name] lists
+    :param str fun_group: the functional group the molecules are from
+    :param dict functional_group_dict: Dictionary of functional group names
+        and their SMARTS
+
+    Returns:
+    :returns: list indexed_mols: a list with one entry per input molecule.
+        Each entry is None if the molecule failed; otherwise it is a list of
+        [SMILES, name, mol binary, list of matched functional groups]
+    """
+    functional_group_mols = make_functional_group_mols(functional_group_dict)
+    own_group_mol = functional_group_mols[fun_group]
+
+    indexed_mols = []
+    for mol_info in mol_info_list:
+        comp_mol = Chem.MolFromSmiles(mol_info[0], sanitize=False)
+        comp_mol = MOH.check_sanitization(comp_mol)
+        if comp_mol is None:
+            indexed_mols.append(None)
+            continue
+
+        comp_mol = MOH.try_deprotanation(comp_mol)
+        if comp_mol is None:
+            indexed_mols.append(None)
+            continue
+
+        if comp_mol.HasSubstructMatch(own_group_mol) is False:
+            comp_mol = MOH.try_deprotanation(comp_mol)
+            if comp_mol is None or comp_mol.HasSubstructMatch(own_group_mol) is False:
+                indexed_mols.append(None)
+                continue
+
+        matched_groups = [
+            group for group in functional_group_mols.keys()
+            if comp_mol.HasSubstructMatch(functional_group_mols[group])
+        ]
+        indexed_mols.append(
+            [mol_info[0], mol_info[1], comp_mol.ToBinary(), matched_groups]
+        )
+
+    return indexed_mols
+#
+def run_main(vars):
+    """
+    This builds and saves the reactivity index.
+
+    Inputs:
+    :param dict vars: Dictionary of User variables
+    """
+    complementary_mol_dir = vars["complementary_mol_directory"]
+    number_of_processors = vars["number_of_processors"]
+    chunk_size = vars["chunk_size"]
+
+    with open(vars["function_group_library"], "r") as func_dict_file:
+        functional_group_dict = json.load(func_dict_file)
+    functional_group_dict = {
+        str(key): str(functional_group_dict[key]) for key in functional_group_dict.keys()
+    }
+
+    # Check SMARTS before farming out jobs
+    make_functional_group_mols(functional_group_dict)
+
+    job_input = []
+    source_file_signatures = {}
+    for fun_group in functional_group_dict.keys():
+        smi_file = "{}{}.smi".format(complementary_mol_dir, fun_group)
+        if os.path.isfile(smi_file) is False:
+            printout = "Could not find the following .smi file for "
+            printout = printout + "complementary molecules: {}".format(smi_file)
+            print(printout)
+            raise Exception(printout)
+
+        source_file_signatures[fun_group] = get_source_file_signature(smi_file)
+        mol_info_list = get_usable_format(smi_file)
+        for i in range(0, len(mol_info_list), chunk_size):
+            job_input.append(
+                tuple([mol_info_list[i:i + chunk_size], fun_group, functional_group_dict])
+            )
+
+    print("Indexing {} chunks of complementary molecules".format(len(job_input)))
+    output = mp.multi_threading(job_input, number_of_processors, index_chunk_of_mols)
+
+    index_by_group = {}
+    for fun_group in functional_group_dict.keys():
+        index_by_group[fun_group] = {
+            "smiles": [],
+            "names": [],
+            "mol_binaries": [],
+            "matched_groups": [],
+            "smarts": functional_group_dict[fun_group],
+            "source_file": source_file_signatures[fun_group],
+        }
+
+    num_failed_by_group = {}
+    for job, indexed_mols in zip(job_input, output):
+        fun_group = job[1]
+        group_info = index_by_group[fun_group]
+        for indexed_mol in indexed_mols:
+            if indexed_mol is None:
+                num_failed_by_group[fun_group] = num_failed_by_group.get(fun_group, 0) + 1
+                continue
+            group_info["smiles"].append(indexed_mol[0])
+            group_info["names"].append(indexed_mol[1])
+            group_info["mol_binaries"].append(indexed_mol[2])
+            group_info["matched_groups"].append(indexed_mol[3])
+
+    for fun_group in num_failed_by_group.keys():
+        printout = "{} compounds from {} ".format(num_failed_by_group[fun_group], fun_group)
+        printout = printout + "failed to sanitize or match their functional group"
+        print(printout)
+
+    write_complementary_mol_index(vars["output_file"], index_by_group)
+
+    num_indexed = sum([len(index_by_group[x]["smiles"]) for x in index_by_group.keys()])
+    print("Indexed {} complementary molecules".format(num_indexed))
+    print("Index saved to: {}".format(vars["output_file"]))
+#
+def get_arguments_from_argparse(args_dict):
+    """
+    This function handles the arg parser arguments for the script.
+
+    Inputs:
+    :param dict args_dict: dictionary of parameters
+    Returns:
+    :returns: dict args_dict: dictionary of parameters
+    """
+    if os.path.isfile(args_dict["function_group_library"]) is False:
+        raise ValueError(
+            "function_group_library must be the PATH to a .json file of functional groups"
+        )
+
+    if os.path.isdir(args_dict["complementary_mol_directory"]) is False:
+        raise ValueError(
+            "complementary_mol_directory must be the PATH to a directory of .smi files"
+        )
+    args_dict["complementary_mol_directory"] = os.path.abspath(
+        args_dict["complementary_mol_directory"]
+    ) + os.sep
+
+    if args_dict["output_file"] == "":
+        args_dict["output_file"] = (
+            args_dict["complementary_mol_directory"] + COMPLEMENTARY_MOL_INDEX_FILENAME
+        )
+    args_dict["output_file"] = os.path.abspath(args_dict["output_file"])
+
+    if args_dict["chunk_size"] < 1:
+        raise ValueError("chunk_size must be an int greater than 0.")
+
+    return args_dict
+#
+
+
+# Argument parsing
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument(
+    "--function_group_library",
+    type=str,
+    default="",
+    required=True,
+    help="This PATH for a dictionary of functional groups to be used for Mutation.",
+)
+PARSER.add_argument(
+    "--complementary_mol_directory",
+    type=str,
+    default="",
+    required=True,
+    help="This PATH to the directory containing all the molecules being used \
+    to react with. Each .smi file should be named with the same title as the \
+    functional groups described in function_group_library +.smi",
+)
+PARSER.add_argument(
+    "--output_file",
+    type=str,
+    default="",
+    help="PATH to save the index to. Default is to save it within the \
+    complementary_mol_directory as complementary_mol_index.pkl, which is \
+    where SMILESClickChem will look for it.",
+)
+PARSER.add_argument(
+    "--chunk_size",
+    type=int,
+    default=1000,
+    help="Number of compounds to handle per job. Default is 1000.",
+)
+# processors and multithread mode
+PARSER.add_argument(
+    "--number_of_processors",
+    "-p",
+    type=int,
+    default=-1,
+    help="Number of processors to use for parallel calculations. \
+    Set to -1 for all available CPUs.",
+)
+
+
+ARGS_DICT = vars(PARSER.parse_args())
+ARGS_DICT = get_arguments_from_argparse(ARGS_DICT)
+run_main(ARGS_DICT)
+print("done")
@@ -0,0 +1,268 @@
+"""ConformerCache Class
+
+An on-disk cache of the 3D .sdf output of Gypsum-DL, shared between runs.
+"""
+import __future__
+
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+
+import rdkit
+import rdkit.Chem as Chem
+
+# Disable the unnecessary RDKit warnings
+rdkit.RDLogger.DisableLog("rdApp.*")
+
+# Change this whenever a change to the 3D conversion would change its output,
+# so entries made by older versions are no longer used.
+CONFORMER_CACHE_VERSION = 1
+
+# Fraction of the max size the cache is reduced to when it is over its max
+# size. Evicting a little extra means eviction doesn't run on every insert.
+CONFORMER_CACHE_EVICT_TO_FRACTION = 0.9
+
+
+class ConformerCache(object):
+    """
+    This class stores the 3D .sdf output of Gypsum-DL in a single SQLite
+    file. Entries are keyed by the canonical isomeric SMILES of a ligand plus
+    every Gypsum-DL parameter which changes the output, so a ligand made again
+    in a later generation or run is not reconverted.
+
+    The .sdf text is stored compressed. When the cache grows past its max
+    size the least recently used entries are evicted.
+    """
+
+    def __init__(self, cache_file, max_size_mb, gypsum_settings):
+        """
+        init for ConformerCache. The cache file is created if it does not
+        exist, and evicted down to max_size_mb if it is larger.
+
+        Inputs:
+        :param str cache_file: the path to the SQLite cache file
+        :param float max_size_mb: the max size of the stored .sdf data in MB
+        :param dict gypsum_settings: the Gypsum-DL settings which change the
+            3D output. ie) {"min_ph": 6.4, "max_ph": 8.4, "pka_precision": 1.0,
+            "thoroughness": 3, "max_variants_per_compound": 3}
+        """
+        self.cache_file = cache_file
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.settings_key = json.dumps(
+            {"version": CONFORMER_CACHE_VERSION, "settings": gypsum_settings},
+            sort_keys=True,
+        )
+
+        self.connection = sqlite3.connect(cache_file, timeout=60)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS conformers ("
+            + "key TEXT PRIMARY KEY, "
+            + "sdf BLOB NOT NULL, "
+            + "size INTEGER NOT NULL, "
+            + "last_used REAL NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS conformers_last_used "
+            + "ON conformers (last_used)"
+        )
+        self.connection.commit()
+
+        # The max size may be smaller than when the cache was last used
+        self.evict()
+
+    def get_key(self, smiles_string):
+        """
+        Make the cache key of a ligand.
+
+        Inputs:
+        :param str smiles_string: the SMILES string of the ligand
+
+        Returns:
+        :returns: str key: the sha256 hex digest of the canonical isomeric
+            SMILES of the ligand and the Gypsum-DL settings
+        """
+        mol = Chem.MolFromSmiles(smiles_string)
+        if mol is not None:
+            smiles_string = Chem.MolToSmiles(mol, isomericSmiles=True)
+
+        key_string = smiles_string + "\t" + self.settings_key
+        return hashlib.sha256(key_string.encode("utf-8")).hexdigest()
+
+    def get_many(self, list_of_smiles):
+        """
+        Look up many ligands at once. Every hit is marked as recently used.
+
+        Inputs:
+        :param list list_of_smiles: list of SMILES strings
+
+        Returns:
+        :returns: dict sdf_by_smiles: Keys are the SMILES strings which were
+            found in the cache and items are their .sdf text
+        """
+        keys_by_smiles = {
+            smiles_string: self.get_key(smiles_string)
+            for smiles_string in list_of_smiles
+        }
+
+        sdf_by_key = {}
+        unique_keys = list(set(keys_by_smiles.values()))
+        # Query in groups to stay under SQLite's max number of variables
+        for i in range(0, len(unique_keys), 500):
+            group = unique_keys[i:i + 500]
+            rows = self.connection.execute(
+                "SELECT key, sdf FROM conformers WHERE key IN ({})".format(
+                    ",".join(["?"] * len(group))
+                ),
+                group,
+            ).fetchall()
+            for key, sdf in rows:
+                sdf_by_key[key] = zlib.decompress(sdf).decode("utf-8")
+
+        current_time = time.time()
+        self.connection.executemany(
+            "UPDATE conformers SET last_used = ? WHERE key = ?",
+            [(current_time, key) for key in sdf_by_key.keys()],
+        )
+        self.connection.commit()
+
+        return {
+            smiles_string: sdf_by_key[key]
+            for smiles_string, key in keys_by_smiles.items()
+            if key in sdf_by_key
+        }
+
+    def put_many(self, sdf_by_smiles):
+        """
+        Add many ligands to the cache, then evict the least recently used
+        entries if the cache is over its max size.
+
+        Inputs:
+        :param dict sdf_by_smiles: Keys are SMILES strings and items are
+            their .sdf text
+        """
+        if len(sdf_by_smiles) == 0:
+            return
+
+        current_time = time.time()
+        rows = []
+        for smiles_string, sdf_text in sdf_by_smiles.items():
+            sdf = zlib.compress(sdf_text.encode("utf-8"))
+            rows.append(
+                (self.get_key(smiles_string), sqlite3.Binary(sdf), len(sdf), current_time)
+            )
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO conformers (key, sdf, size, last_used) "
+            + "VALUES (?, ?, ?, ?)",
+            rows,
+        )
+        self.connection.commit()
+
+        self.evict()
+
+    def get_size(self):
+        """
+        Returns:
+        :returns: int size: the size in bytes of all stored .sdf data
+        """
+        size = self.connection.execute(
+            "SELECT SUM(size) FROM conformers"
+        ).fetchone()[0]
+        if size is None:
+            return 0
+
+        return size
+
+    def evict(self):
+        """
+        If the cache is over its max size, delete the least recently used
+        entries until it is under CONFORMER_CACHE_EVICT_TO_FRACTION of its
+        max size.
+        """
+        size = self.get_size()
+        if size <= self.max_size:
+            return
+
+        target_size = int(self.max_size * CONFORMER_CACHE_EVICT_TO_FRACTION)
+        keys_to_delete = []
+        for key, entry_size in self.connection.execute(
+            "SELECT key, size FROM conformers ORDER BY last_used ASC"
+        ):
+            if size <= target_size:
+                break
+            keys_to_delete.append((key,))
+            size = size - entry_size
+
+        self.connection.executemany(
+            "DELETE FROM conformers WHERE key = ?", keys_to_delete
+        )
+        self.connection.commit()
+        print(
+            "Evicted {} ligands from the conformer cache".format(len(keys_to_delete))
+        )
+
+    def close(self):
+        """
+        Close the connection to the cache file.
+        """
+        self.connection.close()
+
+
+def rename_sdf_text(sdf_text, new_name):
+    """
+    Set the name (the title line) of every molecule in the text of an .sdf
+    file.
+
+    Inputs:
+    :param str sdf_text: the text of an .sdf file
+    :param str new_name: the new name
+
+    Returns:
+    :returns: str sdf_text: the text of the .sdf file with the new name
+    """
+    blocks = sdf_text.split("$$$$\n")
+    renamed_blocks = []
+    for block in blocks:
+        if block.strip() == "":
+            renamed_blocks.append(block)
+            continue
+        lines = block.split("\n")
+        lines[0] = new_name
+        renamed_blocks.append("\n".join(lines))
+
+    return "$$$$\n".join(renamed_blocks)
+
+
+def make_conformer_cache(vars):
+    """
+    Make the ConformerCache of a run.
+
+    Inputs:
+    :param dict vars: User variables which will govern how the programs runs
+
+    Returns:
+    :returns: ConformerCache conformer_cache: the cache or None if no
+        conformer_cache_file was provided
+    """
+    if vars["conformer_cache_file"] is None:
+        return None
+
+    gypsum_settings = {
+        "min_ph": vars["min_ph"],
+        "max_ph": vars["max_ph"],
+        "pka_precision": vars["pka_precision"],
+        "thoroughness": vars["gypsum_thoroughness"],
+        "max_variants_per_compound": vars["max_variants_per_compound"],
+    }
+
+    # The tautomer backend changes the 3D output. It is only added to the
+    # settings when it isn't the default so existing cache files stay valid.
+    if vars["gypsum_tautomer_backend"] != "molvs":
+        gypsum_settings["tautomer_backend"] = vars["gypsum_tautomer_backend"]
+
+    return ConformerCache(
+        vars["conformer_cache_file"],
+        vars["conformer_cache_max_size_mb"],
+        gypsum_settings,
+    )
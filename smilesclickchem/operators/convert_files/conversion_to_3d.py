@@ -6,11 +6,14 @@ import __future__
 import glob
 import sys
 import os
+import json
+import time
+import traceback
 from os.path import basename
 
 import rdkit
 import rdkit.Chem as Chem
-from func_timeout import func_timeout
+from func_timeout import func_timeout, FunctionTimedOut
 
 # Disable the unnecessary RDKit warnings
 rdkit.RDLogger.DisableLog("rdApp.*")
@@ -30,7 +33,33 @@ GYPSUM_GYPSUM_DIR = (
 sys.path.extend([GYPSUM_DIR, CURRENT_DIR, GYPSUM_GYPSUM_DIR])
 
 import smilesclickchem.operators.convert_files.gypsum_dl.gypsum_dl.MolObjectHandling as MOH
-from smilesclickchem.operators.convert_files.gypsum_dl.gypsum_dl.Start import prepare_molecules
+from smilesclickchem.operators.convert_files.gypsum_dl.gypsum_dl.Start import (
+    set_parameters,
+    execute_gypsum_dl,
+    detect_unassigned_bonds,
+)
+from smilesclickchem.operators.convert_files.gypsum_dl.gypsum_dl.MolContainer import MolContainer
+from smilesclickchem.operators.convert_files.gypsum_dl.gypsum_dl.Parallelizer import Parallelizer
+from smilesclickchem.operators.convert_files.conformer_cache import (
+    make_conformer_cache,
+    rename_sdf_text,
+)
+from smilesclickchem.operators.convert_files.sdf_shards import (
+    SDFShardWriter,
+    SDFShardReader,
+    SDF_SHARD_FOLDERNAME,
+)
+from smilesclickchem.operators.convert_files.process_supervisor import (
+    ProcessSupervisor,
+    report_progress,
+    JOB_COMPLETED,
+    JOB_ERROR,
+    JOB_TIMEOUT,
+)
+
+# Name of the file within the 3D_SDFs folder which records every ligand which
+# failed to convert to 3D and why
+GYPSUM_FAILURES_FILENAME = "gypsum_failures.json"
 
 
 
@@ -75,17 +104,30 @@ class StdoutRedirection:
         sys.stdout = sys.__stdout__
 
 
-def convert_to_3d(vars, smi_file, smile_file_directory):
+def convert_to_3d(vars, smi_file, smile_file_directory, only_new_sdfs=False):
     """
     This function converts SMILES from 1D to 3D using gypsum Gypsum converts
     SMILES in an .smi file to 3D .sdf files Then rdkit converts the sdfs to
     PDB files.
 
+    If vars["output_format_3d"] is "sharded_sdf" the sdfs are instead
+    appended to the shards in the 3D_SDF_Shards folder and no PDB files are
+    made.
+
     Inputs:
     :param dict vars: User variables which will govern how the programs runs
     :param str smi_file: the file name of the .smi file
     :param srt smile_file_directory: the directory path which contains the
         .smi file
+    :param bool only_new_sdfs: if True only the .sdf files of the ligands in
+        smi_file are converted to PDBs. If False every .sdf file in the 3D_SDFs
+        folder is converted. This is used when a generation is converted in
+        chunks so earlier chunks aren't reconverted.
+
+    Returns:
+    :returns: dict pdb_records_by_ligand: Keys are the short names of the
+        ligands which were converted to PDBs and items are lists of
+        [SMILES, pose name] for each of their PDBs
     """
 
     print("CONVERTING SMILES TO SDF")
@@ -95,19 +137,135 @@ def convert_to_3d(vars, smi_file, smile_file_directory):
     )
     print("CONVERTING SMILES TO SDF COMPLETED")
 
+    if vars["output_format_3d"] == "sharded_sdf":
+        print("WRITING SDF SHARDS")
+        # Only the .sdf files of this smi_file are sharded. The shards of
+        # earlier chunks are never reread.
+        pdb_records_by_ligand = convert_sdf_to_shards(
+            vars,
+            smile_file_directory,
+            get_sdf_files_of_smi_file(smi_file, gypsum_output_folder_path),
+        )
+        print("WRITING SDF SHARDS COMPLETED")
+        return pdb_records_by_ligand
+
     print("CONVERTING SDF TO PDB")
     # convert sdf files to PDBs using rdkit
-    convert_sdf_to_pdbs(vars, smile_file_directory, gypsum_output_folder_path)
+    if only_new_sdfs is True:
+        list_of_sdf_files = get_sdf_files_of_smi_file(
+            smi_file, gypsum_output_folder_path
+        )
+    else:
+        list_of_sdf_files = None
+    pdb_records_by_ligand = convert_sdf_to_pdbs(
+        vars, smile_file_directory, gypsum_output_folder_path, list_of_sdf_files
+    )
     print("CONVERTING SDF TO PDB COMPLETED")
 
+    return pdb_records_by_ligand
+
+
+def convert_unfinished_to_3d(vars, list_of_ligands, smile_file_directory):
+    """
+    Convert to 3D only the ligands which do not already have PDB files. This
+    is used when resuming a run. Ligands which already have an .sdf file from
+    Gypsum-DL are only converted from .sdf to .pdb.
+
+    If vars["output_format_3d"] is "sharded_sdf" ligands already in the shard
+    index are skipped instead, and the rest are added to the shards.
+
+    Inputs:
+    :param dict vars: User variables which will govern how the programs runs
+    :param list list_of_ligands: list of ligand/name pairs which should be
+        converted to 3D
+    :param srt smile_file_directory: the directory path of the generation
+
+    Returns:
+    :returns: dict pdb_records_by_ligand: Keys are the short names of the
+        ligands which were converted to PDBs by this call and items are lists
+        of [SMILES, pose name] for each of their PDBs. Ligands which already
+        had PDB files are not included.
+    """
+    pdb_subfolder_path = smile_file_directory + "PDBs" + os.sep
+    gypsum_output_folder_path = "{}3D_SDFs{}".format(smile_file_directory, os.sep)
+
+    shard_reader = None
+    if vars["output_format_3d"] == "sharded_sdf":
+        shard_reader = SDFShardReader(smile_file_directory + SDF_SHARD_FOLDERNAME)
+
+    ligands_without_sdf = []
+    list_of_sdf_files = []
+    for ligand_info in list_of_ligands:
+        lig_name_short = ligand_info[1].split(")")[-1]
+        if shard_reader is not None:
+            if shard_reader.has_ligand(lig_name_short):
+                continue
+        elif len(glob.glob(pdb_subfolder_path + lig_name_short + "__*.pdb")) != 0:
+            continue
+
+        sdf_file = "{}{}__input1.sdf".format(gypsum_output_folder_path, lig_name_short)
+        if os.path.exists(sdf_file):
+            list_of_sdf_files.append(sdf_file)
+        else:
+            ligands_without_sdf.append(ligand_info)
+
+    print(
+        "RESUMING 3D CONVERSION: {} ligands need Gypsum-DL and {} ".format(
+            len(ligands_without_sdf), len(list_of_sdf_files)
+        )
+        + "more need converting from SDF to PDB"
+    )
+
+    if len(ligands_without_sdf) != 0:
+        unfinished_smi_file = smile_file_directory + "Unfinished_3D_SMILES.smi"
+        with open(unfinished_smi_file, "w") as f:
+            for ligand_info in ligands_without_sdf:
+                f.write(ligand_info[0] + "\t" + ligand_info[1] + "\n")
+
+        print("CONVERTING SMILES TO SDF")
+        convert_smi_to_sdfs_with_gypsum(vars, unfinished_smi_file, smile_file_directory)
+        print("CONVERTING SMILES TO SDF COMPLETED")
+
+        list_of_sdf_files.extend(
+            get_sdf_files_of_smi_file(unfinished_smi_file, gypsum_output_folder_path)
+        )
+
+    pdb_records_by_ligand = {}
+    if shard_reader is not None:
+        shard_reader.close()
+        if len(list_of_sdf_files) != 0:
+            print("WRITING SDF SHARDS")
+            pdb_records_by_ligand = convert_sdf_to_shards(
+                vars, smile_file_directory, list_of_sdf_files
+            )
+            print("WRITING SDF SHARDS COMPLETED")
+    elif len(list_of_sdf_files) != 0:
+        print("CONVERTING SDF TO PDB")
+        pdb_records_by_ligand = convert_sdf_to_pdbs(
+            vars, smile_file_directory, gypsum_output_folder_path, list_of_sdf_files
+        )
+        print("CONVERTING SDF TO PDB COMPLETED")
+
+    return pdb_records_by_ligand
+
 
 def convert_smi_to_sdfs_with_gypsum(vars, gen_smiles_file, smile_file_directory):
     """
     Convert a file of SMILES to a set of 3d .sdf files using Gypsum. This does
     so by making a set of .json files for running Gypsum for every ligand in
-    the .smi file.
+    the .smi file. If vars["gypsum_batch_size"] is greater than 1 the ligands
+    are instead split into batches and each job converts a whole batch.
 
-    This will print out the list of ligands which failed to convert to 3D.
+    In multiprocessing mode each job is run in a killable worker process with
+    a deadline of vars["gypsum_timeout_limit"] seconds per ligand.
+
+    This will print out the list of ligands which failed to convert to 3D and
+    record why each failed in the gypsum_failures.json file in the 3D_SDFs
+    folder.
+
+    If vars["conformer_cache_file"] is set, ligands found in the conformer
+    cache have their .sdf files written from the cache and skip Gypsum. Newly
+    converted ligands are added to the cache.
 
     Inputs:
     :param dict vars: User variables which will govern how the programs runs
@@ -127,6 +285,8 @@ def convert_smi_to_sdfs_with_gypsum(vars, gen_smiles_file, smile_file_directory)
     max_ph = vars["max_ph"]
     pka_precision = vars["pka_precision"]
     gypsum_timeout_limit = vars["gypsum_timeout_limit"]
+    gypsum_batch_size = vars["gypsum_batch_size"]
+    gypsum_tautomer_backend = vars["gypsum_tautomer_backend"]
 
     # Make a new folder to put gypsum .smi's and json. Name folder
     # gypsum_submission_files.
@@ -144,54 +304,186 @@ def convert_smi_to_sdfs_with_gypsum(vars, gen_smiles_file, smile_file_directory)
     if os.path.exists(gypsum_log_path) is False:
         os.makedirs(gypsum_log_path)
 
+    # Write the .sdf files of ligands which are already in the conformer
+    # cache. Only the other ligands are submitted to gypsum.
+    conformer_cache = make_conformer_cache(vars)
+    if conformer_cache is not None:
+        gen_smiles_file, list_of_uncached_ligands = write_cached_conformers(
+            conformer_cache, gen_smiles_file, folder_path, gypsum_output_folder_path
+        )
+        if len(list_of_uncached_ligands) == 0:
+            conformer_cache.close()
+            return gypsum_output_folder_path
+
     # Make All of the json files to submit to gypsum
-    list_of_gypsum_params = make_smi_and_gyspum_params(
-        gen_smiles_file,
-        folder_path,
-        gypsum_output_folder_path,
-        max_variants_per_compound,
-        gypsum_thoroughness,
-        min_ph,
-        max_ph,
-        pka_precision,
-    )
+    if gypsum_batch_size > 1:
+        list_of_gypsum_params = make_batch_smi_and_gyspum_params(
+            gen_smiles_file,
+            folder_path,
+            gypsum_output_folder_path,
+            max_variants_per_compound,
+            gypsum_thoroughness,
+            min_ph,
+            max_ph,
+            pka_precision,
+            gypsum_batch_size,
+            gypsum_tautomer_backend,
+        )
+    else:
+        list_of_gypsum_params = make_smi_and_gyspum_params(
+            gen_smiles_file,
+            folder_path,
+            gypsum_output_folder_path,
+            max_variants_per_compound,
+            gypsum_thoroughness,
+            min_ph,
+            max_ph,
+            pka_precision,
+            gypsum_tautomer_backend,
+        )
 
-    # create a the job_inputs to run gypsum in multithread
-    job_input = tuple(
-        [
-            tuple(
-                [
-                    gypsum_log_path,
-                    gypsum_params,
-                    gypsum_timeout_limit,
-                ]
-            )
-            for gypsum_params in list_of_gypsum_params
+    sys.stdout.flush()
+    if vars["parallelizer"].return_mode() == "multiprocessing":
+        # Run Gypsum in killable processes so a ligand stuck in RDKit can
+        # be stopped at its deadline
+        failure_records = run_gypsum_with_supervisor(
+            vars["parallelizer"],
+            gypsum_log_path,
+            list_of_gypsum_params,
+            gypsum_timeout_limit,
+        )
+    else:
+        # create a the job_inputs to run gypsum in multithread
+        job_input = tuple(
+            [
+                tuple(
+                    [
+                        gypsum_log_path,
+                        gypsum_params,
+                        gypsum_timeout_limit,
+                    ]
+                )
+                for gypsum_params in list_of_gypsum_params
+            ]
+        )
+        output = vars["parallelizer"].run(job_input, run_gypsum_multiprocessing)
+        failure_records = [
+            record for job_records in output
+            if job_records is not None for record in job_records
         ]
+    sys.stdout.flush()
+
+    save_gypsum_failures(
+        gypsum_output_folder_path, list_of_gypsum_params, failure_records
     )
+    if len(failure_records) > 0:
+        print("The Following ligands Failed to convert in Gypsum")
+        print("See {} for details".format(
+            gypsum_output_folder_path + GYPSUM_FAILURES_FILENAME
+        ))
+        print(sorted([record["name"] for record in failure_records]))
+
+    if conformer_cache is not None:
+        cache_new_conformers(
+            conformer_cache, list_of_uncached_ligands, gypsum_output_folder_path
+        )
+        conformer_cache.close()
+    sys.stdout.flush()
+    return gypsum_output_folder_path
 
 
-    sys.stdout.flush()
-    failed_to_convert = vars["parallelizer"].run(
-        job_input, run_gypsum_multiprocessing
+def write_cached_conformers(conformer_cache, gen_smiles_file, folder_path,
+                            gypsum_output_folder_path):
+    """
+    Write the .sdf file of every ligand in an .smi file which is found in the
+    conformer cache, and write the ligands which are not found to a new .smi
+    file to submit to Gypsum.
+
+    Inputs:
+    :param ConformerCache conformer_cache: the conformer cache
+    :param str gen_smiles_file: the file name of the .smi file to be converted
+        to 3D sdf's
+    :param srt folder_path: the directory path which will contain the inputs
+        and outputs from Gypsum
+    :param str gypsum_output_folder_path: a path to the folder with all of the
+        3D sdf's created by gypsum.
+
+    Returns:
+    :returns: str uncached_smiles_file: the .smi file of the ligands which
+        were not found in the cache
+    :returns: list list_of_uncached_ligands: list of [SMILES, short name]
+        pairs of the ligands which were not found in the cache
+    """
+    list_of_ligands = []
+    with open(gen_smiles_file) as smiles_file:
+        for line in smiles_file:
+            parts = line.replace("    ", "\t").replace("\n", "").split("\t")
+            if len(parts) < 2:
+                continue
+            list_of_ligands.append([parts[0], abridge_ligand_name(parts[1])])
+
+    sdf_by_smiles = conformer_cache.get_many([x[0] for x in list_of_ligands])
+
+    list_of_uncached_ligands = []
+    for smile, lig_name_short in list_of_ligands:
+        if smile not in sdf_by_smiles:
+            list_of_uncached_ligands.append([smile, lig_name_short])
+            continue
+
+        sdf_file = "{}{}__input1.sdf".format(gypsum_output_folder_path, lig_name_short)
+        with open(sdf_file, "w") as f:
+            f.write(rename_sdf_text(sdf_by_smiles[smile], lig_name_short))
+
+    print(
+        "{} ligands were found in the conformer cache. ".format(
+            len(list_of_ligands) - len(list_of_uncached_ligands)
+        )
+        + "{} ligands will be converted by Gypsum-DL".format(
+            len(list_of_uncached_ligands)
+        )
     )
-    sys.stdout.flush()
 
+    uncached_smiles_file = "{}{}_Uncached.smi".format(
+        folder_path, basename(gen_smiles_file).replace(".smi", "")
+    )
+    with open(uncached_smiles_file, "w") as f:
+        for smile, lig_name_short in list_of_uncached_ligands:
+            f.write("{}\t{}\n".format(smile, lig_name_short))
+
+    return uncached_smiles_file, list_of_uncached_ligands
 
-    lig_failed_to_convert = [x for x in failed_to_convert if x is not None]
-    lig_failed_to_convert = list(set(lig_failed_to_convert))
-    if len(lig_failed_to_convert) > 0:
-        print("The Following ligands Failed to convert in Gypsum")
-        print("Likely due to a Timeout")
-        print(lig_failed_to_convert)
-    sys.stdout.flush()
-    return gypsum_output_folder_path
+
+def cache_new_conformers(conformer_cache, list_of_ligands,
+                         gypsum_output_folder_path):
+    """
+    Add the .sdf files of newly converted ligands to the conformer cache.
+    Ligands which failed to convert are not cached.
+
+    Inputs:
+    :param ConformerCache conformer_cache: the conformer cache
+    :param list list_of_ligands: list of [SMILES, short name] pairs
+    :param str gypsum_output_folder_path: a path to the folder with all of
+        the 3D sdf's created by gypsum.
+    """
+    sdf_by_smiles = {}
+    for smile, lig_name_short in list_of_ligands:
+        sdf_file = "{}{}__input1.sdf".format(gypsum_output_folder_path, lig_name_short)
+        if os.path.exists(sdf_file) is False:
+            continue
+        with open(sdf_file) as f:
+            sdf_text = f.read()
+        if "$$$$" not in sdf_text:
+            # Gypsum did not write any 3D models
+            continue
+        sdf_by_smiles[smile] = sdf_text
+
+    conformer_cache.put_many(sdf_by_smiles)
 
 
 def make_smi_and_gyspum_params(gen_smiles_file, folder_path,
                                gypsum_output_folder_path, max_variance,
                                gypsum_thoroughness, min_ph, max_ph,
-                               pka_precision):
+                               pka_precision, gypsum_tautomer_backend):
     """
     Make an individual .smi file and parameter dictionary to submit to Gypsum
     for every ligand in the generation_*_to_convert.smi file.
@@ -217,6 +509,8 @@ def make_smi_and_gyspum_params(gen_smiles_file, folder_path,
         Dimorphite-DL
     :param float pka_precision: User variable for Size of pH substructure
         ranges by Dimorphite-DL
+    :param str gypsum_tautomer_backend: User variable for the backend Gypsum-DL
+        uses to enumerate tautomers. Either "molvs" or "rdkit"
 
     Returns:
     :returns: list list_of_gypsum_params: a list of dictionaries. Each
@@ -235,32 +529,7 @@ def make_smi_and_gyspum_params(gen_smiles_file, folder_path,
             if len(parts) == 0 or len(parts) == 1:
                 print(parts)
             smile = parts[0]
-            # ligand_name example
-            # (Gen_30_Cross_639427+Gen_31_Cross_717928)Gen_34_Cross_709666 But
-            # bash doesn't like + or () for file names so we will abridge
-            # lig_name_short name for above example becomes
-            # Gen_34_Cross_709666 if ligand is from the source files we wont
-            # split the name
-
-            ligand_name = parts[1]
-            if len(ligand_name.split(")")) == 2:
-                lig_name_short = ligand_name.split(")")[1]
-            elif len(ligand_name.split(")")) == 1:
-                lig_name_short = ligand_name
-            else:
-                printout = "Ligand name failed to abridge. Smiles may be \
-                            named in improper format please separate with _ \
-                            or camelcase. Our formatting is: \
-                            (Gen_2_Cross_631+Gen_3_Cross_744)Gen_4_Cross_702 \
-                            which reads as Gen_34_Cross_702 (aka ligand 702) \
-                            was produced by crossover using ligands: \
-                            Gen_2_Cross_631 and Gen_3_Cross_744. \
-                            This will abridge to Gen_4_Cross_702 for saving \
-                            files.\nThe failed ligand name was \
-                            {}".format(ligand_name)
-
-                print(printout)
-                raise Exception(printout)
+            lig_name_short = abridge_ligand_name(parts[1])
 
             smi_line = "{}\t{}".format(smile, lig_name_short)
 
@@ -271,135 +540,748 @@ def make_smi_and_gyspum_params(gen_smiles_file, folder_path,
                 smi_file.write(smi_line)
 
             # Make .json file
-            gypsum_params = {
-                "source": smi_path,
-                "output_folder": gypsum_output_folder_path,
-                "num_processors": 1,
-                "job_manager": "serial",
-                "use_durrant_lab_filters": True,
-                "max_variants_per_compound": max_variance,
-                "thoroughness": gypsum_thoroughness,
-                "separate_output_files": True,
-                "add_pdb_output": False,
-                "add_html_output": False,
-                "min_ph": min_ph,
-                "max_ph": max_ph,
-                "pka_precision": pka_precision,
-                "skip_optimize_geometry": False,
-                "skip_alternate_ring_conformations": False,
-                "skip_adding_hydrogen": False,
-                "skip_making_tautomers": False,
-                "skip_enumerate_chiral_mol": False,
-                "skip_enumerate_double_bonds": False,
-                "let_tautomers_change_chirality": False,
-                "2d_output_only": False,
-                "cache_prerun": False,
-                "test": False,
-            }
+            gypsum_params = make_gypsum_params(
+                smi_path,
+                gypsum_output_folder_path,
+                max_variance,
+                gypsum_thoroughness,
+                min_ph,
+                max_ph,
+                pka_precision,
+                gypsum_tautomer_backend,
+            )
 
             list_of_gypsum_params.append(gypsum_params)
 
     return list_of_gypsum_params
 
 
+def make_batch_smi_and_gyspum_params(gen_smiles_file, folder_path,
+                                     gypsum_output_folder_path, max_variance,
+                                     gypsum_thoroughness, min_ph, max_ph,
+                                     pka_precision, gypsum_batch_size,
+                                     gypsum_tautomer_backend):
+    """
+    Split the ligands in the generation_*_to_convert.smi file into batches
+    and make a single .smi file and parameter dictionary to submit to Gypsum
+    for every batch.
+
+    The .smi file for each batch will be noted within the dictionary as
+    "source".
+
+    Inputs:
+    :param str gen_smiles_file: the file name of the .smi file to be converted
+        to 3D sdf's
+    :param srt folder_path: the directory path which will contain the inputs
+        and outputs from Gypsum
+    :param str gypsum_output_folder_path: a path to the folder with all of the
+        3D sdf's created by gypsum.
+    :param int max_variance: User variable for how many conformers per ligand
+        should be made by Gypsum
+    :param int gypsum_thoroughness: User variable for How widely Gypsum-DL
+        will search for low-energy conformers.
+    :param float min_ph: User variable for Minimum pH to consider by
+        Dimorphite-DL
+    :param float max_ph: User variable for Maximum pH to consider by
+        Dimorphite-DL
+    :param float pka_precision: User variable for Size of pH substructure
+        ranges by Dimorphite-DL
+    :param int gypsum_batch_size: the max number of ligands per batch
+    :param str gypsum_tautomer_backend: User variable for the backend Gypsum-DL
+        uses to enumerate tautomers. Either "molvs" or "rdkit"
+
+    Returns:
+    :returns: list list_of_gypsum_params: a list of dictionaries. Each
+        dictionary contains the Gypsum-DL parameters to convert a batch of
+        ligands from SMILES to 3D .sdf
+    """
+    smi_lines = []
+    with open(gen_smiles_file) as smiles_file:
+        for line in smiles_file:
+            if line == "\n":
+                continue
+            line = line.replace("\n", "")
+            line = line.replace("    ", "\t")
+            parts = line.split("\t")
+            if len(parts) < 2:
+                print(parts)
+                continue
+            smi_lines.append(
+                "{}\t{}".format(parts[0], abridge_ligand_name(parts[1]))
+            )
+
+    # Batch files are named after the .smi file so the batches of different
+    # files converted in the same generation (ie streaming chunks) don't clash
+    smi_file_name = basename(gen_smiles_file).replace(".smi", "")
+
+    list_of_gypsum_params = []
+    for batch_start in range(0, len(smi_lines), gypsum_batch_size):
+        batch_lines = smi_lines[batch_start: batch_start + gypsum_batch_size]
+        smi_path = "{}{}_Batch_{}.smi".format(
+            folder_path, smi_file_name, len(list_of_gypsum_params) + 1
+        )
+        with open(smi_path, "w") as smi_file:
+            smi_file.write("\n".join(batch_lines) + "\n")
+
+        gypsum_params = make_gypsum_params(
+            smi_path,
+            gypsum_output_folder_path,
+            max_variance,
+            gypsum_thoroughness,
+            min_ph,
+            max_ph,
+            pka_precision,
+            gypsum_tautomer_backend,
+        )
+        list_of_gypsum_params.append(gypsum_params)
+
+    return list_of_gypsum_params
+
+
+def abridge_ligand_name(ligand_name):
+    """
+    Abridge a ligand name to the short name used for the files made for that
+    ligand.
+
+    Inputs:
+    :param str ligand_name: the full name of the ligand
+        ie. (Gen_30_Cross_639427+Gen_31_Cross_717928)Gen_34_Cross_709666
+
+    Returns:
+    :returns: str lig_name_short: the abridged name ie. Gen_34_Cross_709666
+    """
+    # ligand_name example
+    # (Gen_30_Cross_639427+Gen_31_Cross_717928)Gen_34_Cross_709666 But
+    # bash doesn't like + or () for file names so we will abridge
+    # lig_name_short name for above example becomes
+    # Gen_34_Cross_709666 if ligand is from the source files we wont
+    # split the name
+    if len(ligand_name.split(")")) == 2:
+        lig_name_short = ligand_name.split(")")[1]
+    elif len(ligand_name.split(")")) == 1:
+        lig_name_short = ligand_name
+    else:
+        printout = "Ligand name failed to abridge. Smiles may be \
+                    named in improper format please separate with _ \
+                    or camelcase. Our formatting is: \
+                    (Gen_2_Cross_631+Gen_3_Cross_744)Gen_4_Cross_702 \
+                    which reads as Gen_34_Cross_702 (aka ligand 702) \
+                    was produced by crossover using ligands: \
+                    Gen_2_Cross_631 and Gen_3_Cross_744. \
+                    This will abridge to Gen_4_Cross_702 for saving \
+                    files.\nThe failed ligand name was \
+                    {}".format(ligand_name)
+
+        print(printout)
+        raise Exception(printout)
+
+    return lig_name_short
+
+
+def make_gypsum_params(smi_path, gypsum_output_folder_path, max_variance,
+                       gypsum_thoroughness, min_ph, max_ph, pka_precision,
+                       gypsum_tautomer_backend):
+    """
+    Make the parameter dictionary to submit an .smi file to Gypsum.
+
+    Inputs:
+    :param str smi_path: the path to the .smi file to convert
+    :param str gypsum_output_folder_path: a path to the folder with all of the
+        3D sdf's created by gypsum.
+    :param int max_variance: User variable for how many conformers per ligand
+        should be made by Gypsum
+    :param int gypsum_thoroughness: User variable for How widely Gypsum-DL
+        will search for low-energy conformers.
+    :param float min_ph: User variable for Minimum pH to consider by
+        Dimorphite-DL
+    :param float max_ph: User variable for Maximum pH to consider by
+        Dimorphite-DL
+    :param float pka_precision: User variable for Size of pH substructure
+        ranges by Dimorphite-DL
+    :param str gypsum_tautomer_backend: User variable for the backend Gypsum-DL
+        uses to enumerate tautomers. Either "molvs" or "rdkit"
+
+    Returns:
+    :returns: dict gypsum_params: the Gypsum-DL parameters
+    """
+    gypsum_params = {
+        "source": smi_path,
+        "output_folder": gypsum_output_folder_path,
+        "num_processors": 1,
+        "job_manager": "serial",
+        "use_durrant_lab_filters": True,
+        "max_variants_per_compound": max_variance,
+        "thoroughness": gypsum_thoroughness,
+        "separate_output_files": True,
+        "add_pdb_output": False,
+        "add_html_output": False,
+        "min_ph": min_ph,
+        "max_ph": max_ph,
+        "pka_precision": pka_precision,
+        "skip_optimize_geometry": False,
+        "skip_alternate_ring_conformations": False,
+        "skip_adding_hydrogen": False,
+        "skip_making_tautomers": False,
+        "skip_enumerate_chiral_mol": False,
+        "skip_enumerate_double_bonds": False,
+        "let_tautomers_change_chirality": False,
+        "tautomer_backend": gypsum_tautomer_backend,
+        "2d_output_only": False,
+        "cache_prerun": False,
+        "test": False,
+    }
+
+    return gypsum_params
+
+
+def read_gypsum_source(gypsum_params):
+    """
+    Read the ligands of the .smi file submitted to Gypsum.
+
+    Inputs:
+    :param dict gypsum_params: dictionary of params to be feed to Gypsum-DL.
+        "source" is the .smi file of a single ligand or of a batch.
+
+    Returns:
+    :returns: list list_of_ligands: list of [SMILES, short name] pairs
+    """
+    list_of_ligands = []
+    with open(gypsum_params["source"]) as smi_file:
+        for line in smi_file:
+            parts = line.replace("\n", "").split("\t")
+            if len(parts) < 2:
+                continue
+            list_of_ligands.append(parts[:2])
+
+    return list_of_ligands
+
+
+def make_gypsum_job(gypsum_log_path, gypsum_params):
+    """
+    Make the job to convert the ligands of an .smi file submitted to Gypsum.
+
+    Inputs:
+    :param str gypsum_log_path: a path to the folder to place the log files
+        produced when running gypsum.
+    :param dict gypsum_params: dictionary of params to be feed to Gypsum-DL.
+
+    Returns:
+    :returns: tuple job: tuple of (log_file, gypsum_params, list_of_ligands)
+        which are the arguments of run_gypsum_job
+    """
+    job_id = gypsum_params["source"].split(os.sep)[-1].replace(".smi", "")
+    log_file = "{}{}_log.txt".format(gypsum_log_path, job_id)
+
+    return tuple([log_file, gypsum_params, read_gypsum_source(gypsum_params)])
+
+
+def run_gypsum_with_supervisor(parallelizer, gypsum_log_path,
+                               list_of_gypsum_params, gypsum_timeout_limit):
+    """
+    Convert ligands to 3D using Gypsum in worker processes run by a
+    ProcessSupervisor. A job which runs past its deadline has its worker
+    killed and replaced.
+
+    If the parallelizer has a persistent worker pool, one ProcessSupervisor
+    is kept for the lifetime of the parallelizer so its workers are reused by
+    every conversion, and it is shut down with the parallelizer. Otherwise a
+    ProcessSupervisor is made for this conversion only.
+
+    Each ligand of a job is given gypsum_timeout_limit seconds, counted from
+    when the job starts it. If a ligand of a batch times out it is recorded
+    as failed and the ligands after it are retried straight away as a new
+    batch. If a batch fails the ligands in the batch which do not have an
+    .sdf file are retried one at a time.
+
+    Inputs:
+    :param object parallelizer: the Parallelizer object (vars["parallelizer"])
+    :param str gypsum_log_path: a path to the folder to place the log files
+        produced when running gypsum.
+    :param list list_of_gypsum_params: a list of dictionaries of Gypsum-DL
+        parameters. One per ligand or batch of ligands
+    :param int gypsum_timeout_limit: this is taken from
+        vars["gypsum_timeout_limit"]. It determines the maximum amount of time to
+        run Gypsum per ligand
+
+    Returns:
+    :returns: list failure_records: a failure record (dict) for every ligand
+        which failed to convert to 3D sdf.
+    """
+    num_processors = parallelizer.num_procs
+    if parallelizer.persistent_pool is True:
+        supervisor = parallelizer.get_persistent_resource(
+            "gypsum_supervisor", lambda: ProcessSupervisor(num_processors)
+        )
+    else:
+        supervisor = ProcessSupervisor(num_processors)
+    num_workers_killed_before = supervisor.num_workers_killed
+
+    jobs = [
+        make_gypsum_job(gypsum_log_path, gypsum_params)
+        for gypsum_params in list_of_gypsum_params
+    ]
+    failure_records = []
+    try:
+        while len(jobs) != 0:
+            results = supervisor.run(
+                run_gypsum_job,
+                jobs,
+                [gypsum_timeout_limit for job in jobs],
+            )
+            job_failure_records, jobs = process_gypsum_job_results(
+                gypsum_log_path, jobs, results, gypsum_timeout_limit
+            )
+            failure_records.extend(job_failure_records)
+    finally:
+        if parallelizer.persistent_pool is not True:
+            supervisor.end()
+
+    num_workers_killed = supervisor.num_workers_killed - num_workers_killed_before
+    if num_workers_killed != 0:
+        print(
+            "{} Gypsum-DL worker processes were killed for ".format(
+                num_workers_killed
+            )
+            + "passing their deadline and were replaced"
+        )
+
+    return failure_records
+
+
 def run_gypsum_multiprocessing(gypsum_log_path, gypsum_params,
                                gypsum_timeout_limit):
     """
-    This converts the a single ligand from a SMILE to a 3D SDF using Gypsum.
-    This is used within a multithread.
+    This converts a single ligand, or a batch of ligands, from SMILES to 3D
+    SDFs using Gypsum. This is used within a multithread when the
+    parallelizer is in serial or mpi mode.
 
-    This uses a Try statement and a bash script to be able to create a timeout
-    to prevent stalling or very long conversions.
+    This uses func_timeout to create a timeout for each ligand to prevent
+    stalling or very long conversions. Unlike run_gypsum_with_supervisor
+    this can not interrupt a ligand stuck within RDKit.
 
     Inputs:
     :param str gypsum_log_path: a path to the folder to place the log files
         produced when running gypsum.
     :param dict gypsum_params: dictionary of params to be feed to Gypsum-DL to
-        convert to 3D sdf for a single ligand
+        convert to 3D sdf for a single ligand or a batch of ligands
     :param int gypsum_timeout_limit: this is taken from
         vars["gypsum_timeout_limit"]. It determines the maximum amount of time to
         run Gypsum per ligand
 
     Returns:
-    :returns: str lig_id: the name of the ligand if it failed or None if it
-        successfully converted to 3D sdf.
+    :returns: list failure_records: a failure record (dict) for every ligand
+        which failed to convert to 3D sdf.
     """
-    current_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-    gypsum_dir = (
-        str(current_dir) + os.sep + "convert_files" + os.sep + "gypsum_dl" + os.sep
-    )
-    gypsum_gypsum_dir = str(gypsum_dir) + os.sep + "gypsum_dl" + os.sep
-    sys.path.extend([current_dir, gypsum_dir, gypsum_gypsum_dir])
+    jobs = [make_gypsum_job(gypsum_log_path, gypsum_params)]
+    failure_records = []
+    while len(jobs) != 0:
+        results = [
+            run_gypsum_job_with_func_timeout(job, gypsum_timeout_limit)
+            for job in jobs
+        ]
+        job_failure_records, jobs = process_gypsum_job_results(
+            gypsum_log_path, jobs, results, gypsum_timeout_limit
+        )
+        failure_records.extend(job_failure_records)
 
+    return failure_records
 
-    lig_id = gypsum_params["source"].split(os.sep)[-1].replace(".smi", "")
-    log_file = "{}{}_log.txt".format(gypsum_log_path, lig_id)
 
-    try:
-        with StdoutRedirection(log_file):
-            func_timeout(gypsum_timeout_limit, prepare_molecules, args=(gypsum_params,))
+def run_gypsum_job_with_func_timeout(job, time_limit):
+    """
+    Run a Gypsum job with a func_timeout timeout for each ligand. The job
+    stops at the first ligand which times out.
 
-        sys.stdout.flush()
-    except:
-        # This Ligand Timed out
-        return lig_id
+    Inputs:
+    :param tuple job: tuple of (log_file, gypsum_params, list_of_ligands)
+    :param float time_limit: the maximum time in seconds to convert each
+        ligand
+
+    Returns:
+    :returns: tuple result: tuple of (status, output, run_time) in the same
+        format as the results of ProcessSupervisor.run
+    """
+    log_file, gypsum_params, list_of_ligands = job
+
+    start_time = time.time()
+    lig_failed_to_convert = []
+    output = lig_failed_to_convert
+    status = JOB_COMPLETED
+
+    # The thread run by func_timeout may outlive the timeout, so stdout is
+    # redirected outside of it
+    with StdoutRedirection(log_file):
+        try:
+            params = make_batch_params(gypsum_params)
+            for ligand_info in list_of_ligands:
+                ligand_start_time = time.time()
+                try:
+                    converted = func_timeout(
+                        time_limit,
+                        prepare_ligand_in_batch,
+                        args=(params, ligand_info),
+                    )
+                except FunctionTimedOut:
+                    output = (ligand_info[1], time.time() - ligand_start_time)
+                    status = JOB_TIMEOUT
+                    break
+                if converted is False:
+                    lig_failed_to_convert.append(ligand_info[1])
+        except:
+            output = traceback.format_exc()
+            status = JOB_ERROR
+    sys.stdout.flush()
+
+    return tuple([status, output, time.time() - start_time])
+
+
+def run_gypsum_job(log_file, gypsum_params, list_of_ligands):
+    """
+    Convert a list of ligands to 3D with Gypsum, writing the output of Gypsum
+    to a log file.
+
+    Inputs:
+    :param str log_file: the path of the log file
+    :param dict gypsum_params: dictionary of params to be feed to Gypsum-DL
+    :param list list_of_ligands: list of [SMILES, short name] pairs
+
+    Returns:
+    :returns: list lig_failed_to_convert: the names of the ligands which
+        failed to convert to 3D sdf.
+    """
+    with StdoutRedirection(log_file):
+        lig_failed_to_convert = prepare_batch_of_molecules(
+            gypsum_params, list_of_ligands
+        )
+
+    return lig_failed_to_convert
+
+
+def process_gypsum_job_results(gypsum_log_path, jobs, results,
+                               gypsum_timeout_limit):
+    """
+    Make failure records from the results of a set of Gypsum jobs.
+
+    The ligands of a job are converted in order, so if a job timed out the
+    ligand it was converting is recorded as failed, the ligands before it
+    were finished, and the ligands after it are retried as a new job.
+
+    A batch of ligands which failed is not recorded as failed. Instead a new
+    single-ligand job is made for every ligand in the batch without an .sdf
+    file, so each ligand gets its own job. The .sdf files are only given
+    their final name once they are completely written, so an .sdf file of a
+    killed job is never mistaken for a finished one.
+
+    Inputs:
+    :param str gypsum_log_path: a path to the folder to place the log files
+        produced when running gypsum.
+    :param list jobs: list of tuples of (log_file, gypsum_params,
+        list_of_ligands)
+    :param list results: list of tuples of (status, output, run_time). One per
+        job
+    :param int gypsum_timeout_limit: the maximum time to run Gypsum per ligand
+
+    Returns:
+    :returns: list failure_records: a failure record (dict) for every ligand
+        which failed to convert to 3D sdf.
+    :returns: list retry_jobs: list of jobs to retry
+    """
+    failure_records = []
+    retry_jobs = []
+    for job, result in zip(jobs, results):
+        gypsum_params = job[1]
+        list_of_ligands = job[2]
+        status, output, run_time = result
+
+        if status == JOB_COMPLETED:
+            failed_names = set(output)
+            for ligand_info in list_of_ligands:
+                if ligand_info[1] not in failed_names:
+                    continue
+                failure_records.append(
+                    make_gypsum_failure_record(
+                        ligand_info, gypsum_params, "failed", run_time,
+                        gypsum_timeout_limit, None,
+                    )
+                )
+            continue
+
+        if status == JOB_TIMEOUT:
+            timed_out_name, ligand_run_time = output
+            ligand_names = [ligand_info[1] for ligand_info in list_of_ligands]
+            if timed_out_name in ligand_names:
+                timed_out_idx = ligand_names.index(timed_out_name)
+            else:
+                # The job was killed before it started its first ligand
+                timed_out_idx = 0
+
+            # The ligands before the one which timed out were finished
+            for ligand_info in list_of_ligands[:timed_out_idx]:
+                if os.path.exists(get_gypsum_sdf_file(gypsum_params, ligand_info)):
+                    continue
+                failure_records.append(
+                    make_gypsum_failure_record(
+                        ligand_info, gypsum_params, "failed", run_time,
+                        gypsum_timeout_limit, None,
+                    )
+                )
+
+            failure_records.append(
+                make_gypsum_failure_record(
+                    list_of_ligands[timed_out_idx], gypsum_params, status,
+                    ligand_run_time, gypsum_timeout_limit, None,
+                )
+            )
+
+            # The ligands after it were never started
+            list_of_unstarted_ligands = list_of_ligands[timed_out_idx + 1:]
+            if len(list_of_unstarted_ligands) != 0:
+                log_file = "{}{}_log.txt".format(
+                    gypsum_log_path, list_of_unstarted_ligands[0][1]
+                )
+                retry_jobs.append(
+                    tuple([log_file, gypsum_params, list_of_unstarted_ligands])
+                )
+            continue
+
+        if len(list_of_ligands) == 1:
+            failure_records.append(
+                make_gypsum_failure_record(
+                    list_of_ligands[0], gypsum_params, status, run_time,
+                    gypsum_timeout_limit, output,
+                )
+            )
+            continue
+
+        # Retry each ligand in the batch which did not finish
+        for ligand_info in list_of_ligands:
+            if os.path.exists(get_gypsum_sdf_file(gypsum_params, ligand_info)):
+                continue
+            log_file = "{}{}_log.txt".format(gypsum_log_path, ligand_info[1])
+            retry_jobs.append(tuple([log_file, gypsum_params, [ligand_info]]))
+
+    return failure_records, retry_jobs
+
+
+def get_gypsum_sdf_file(gypsum_params, ligand_info):
+    """
+    Get the path of the .sdf file Gypsum-DL writes for a ligand.
+
+    Inputs:
+    :param dict gypsum_params: dictionary of params to be feed to Gypsum-DL
+    :param list ligand_info: [SMILES, short name] of the ligand
+
+    Returns:
+    :returns: str sdf_file: the path of the .sdf file
+    """
+    return "{}{}__input1.sdf".format(gypsum_params["output_folder"], ligand_info[1])
+
+
+def make_gypsum_failure_record(ligand_info, gypsum_params, reason, run_time,
+                               time_limit, details):
+    """
+    Make the record of a ligand which failed to convert to 3D.
+
+    Inputs:
+    :param list ligand_info: [SMILES, short name] of the ligand
+    :param dict gypsum_params: dictionary of params fed to Gypsum-DL
+    :param str reason: "timeout" if the ligand passed its deadline, "error"
+        if Gypsum raised an Exception, or "failed" if Gypsum could not make any
+        3D models of the ligand
+    :param float run_time: how long in seconds the job ran for
+    :param float time_limit: the deadline of the job in seconds
+    :param str details: the traceback if Gypsum raised an Exception;
+        otherwise None
+
+    Returns:
+    :returns: dict failure_record: the failure record
+    """
+    return {
+        "name": ligand_info[1],
+        "smiles": ligand_info[0],
+        "reason": reason,
+        "run_time": round(run_time, 3),
+        "time_limit": time_limit,
+        "source": gypsum_params["source"],
+        "details": details,
+    }
+
+
+def save_gypsum_failures(gypsum_output_folder_path, list_of_gypsum_params,
+                         failure_records):
+    """
+    Save the failure records to the failures file in the 3D_SDFs folder. If
+    the file exists the records are merged into it. Any earlier record of a
+    ligand submitted in list_of_gypsum_params is replaced, so a ligand which
+    converted when retried (ie on resume) is no longer listed.
+
+    Inputs:
+    :param str gypsum_output_folder_path: a path to the folder with all of
+        the 3D sdf's created by gypsum.
+    :param list list_of_gypsum_params: the Gypsum-DL parameters of every job
+        which was run
+    :param list failure_records: a failure record (dict) for every ligand
+        which failed to convert to 3D sdf.
+    """
+    failures_file = gypsum_output_folder_path + GYPSUM_FAILURES_FILENAME
+
+    previous_records = []
+    if os.path.exists(failures_file):
+        previous_records = read_gypsum_failures(failures_file)
+
+    submitted_names = set([])
+    for gypsum_params in list_of_gypsum_params:
+        for ligand_info in read_gypsum_source(gypsum_params):
+            submitted_names.add(ligand_info[1])
+
+    all_records = [
+        record for record in previous_records
+        if record["name"] not in submitted_names
+    ]
+    all_records.extend(failure_records)
+
+    temp_file = failures_file + ".tmp"
+    with open(temp_file, "w") as f:
+        json.dump(all_records, f, indent=4)
+    os.replace(temp_file, failures_file)
+
+
+def read_gypsum_failures(failures_file):
+    """
+    Read a file of Gypsum failure records.
+
+    Inputs:
+    :param str failures_file: the path to the failures file
+
+    Returns:
+    :returns: list failure_records: list of failure records (dicts) with the
+        keys "name", "smiles", "reason", "run_time", "time_limit", "source"
+        and "details"
+    """
+    with open(failures_file) as f:
+        try:
+            failure_records = json.load(f)
+        except:
+            raise Exception(
+                "The Gypsum failures file could not be read: {}".format(failures_file)
+            )
+
+    return failure_records
+
+
+def prepare_batch_of_molecules(gypsum_params, list_of_ligands):
+    """
+    Run a batch of ligands through Gypsum-DL, setting up the Gypsum-DL
+    parameters once for the whole batch. This is the batch equivalent of
+    prepare_molecules.
+
+    The ligands are converted one at a time and report_progress() is called
+    before each, so when run by a ProcessSupervisor each ligand gets its own
+    deadline.
+
+    Each ligand is saved to its own .sdf file named as if it were converted
+    on its own (ie. Gen_4_Mutant_7_63__input1.sdf).
+
+    Inputs:
+    :param dict gypsum_params: dictionary of params to be feed to Gypsum-DL
+    :param list list_of_ligands: list of [SMILES, short name] pairs
+
+    Returns:
+    :returns: list lig_failed_to_convert: the names of the ligands which
+        failed to convert to 3D sdf.
+    """
+    params = make_batch_params(gypsum_params)
 
-    # Check if it worked if it failed return lig_id if it works return None
-    did_gypsum_complete = check_gypsum_log_did_complete(log_file)
-    if did_gypsum_complete in [None, False]:
-        # Failed to convert
-        return lig_id
+    lig_failed_to_convert = []
+    for ligand_info in list_of_ligands:
+        report_progress(ligand_info[1])
+        if prepare_ligand_in_batch(params, ligand_info) is False:
+            lig_failed_to_convert.append(ligand_info[1])
 
-    return None
+    return lig_failed_to_convert
 
 
-def check_gypsum_log_did_complete(log_file_path):
+def make_batch_params(gypsum_params):
     """
-    This function checks a log_file_path to see if the last line reads
-    "TIMEOUT". If it does then gypsum timed out before converting a .smi. If
-    it timedout return False. If it completed return True
+    Make the Gypsum-DL parameters shared by every ligand of a batch.
 
     Inputs:
-    :param str log_file_path: the path to the log from converting a ligand
-        with Gypsum.
+    :param dict gypsum_params: dictionary of params to be feed to Gypsum-DL
 
     Returns:
-    :returns: bool bol:  Returns True if the conversion worked (or if it was a
-        blank .smi with no name or SMILES). Returns False if it timedout. Returns
-        None if it failed to convert due to errors with the SMILES string, .json,
-        or .smi.
+    :returns: dict params: the processed Gypsum-DL parameters, including the
+        Parallelizer
+    """
+    params = set_parameters(gypsum_params)
+    params["Parallelizer"] = Parallelizer(
+        params["job_manager"], params["num_processors"], True
+    )
 
-        -examples would be
-                1) if the SMILE was invalid chemically
-                2) There was SMILE name but no SMILE string
-                3) The SMILES wasn't a SMILE but rather a different data type
-                    ie None, False, non-chemical string...
+    return params
+
+
+def prepare_ligand_in_batch(params, ligand_info):
     """
+    Convert a single ligand of a batch to 3D with Gypsum-DL.
+
+    Inputs:
+    :param dict params: the Gypsum-DL parameters made by make_batch_params
+    :param list ligand_info: [SMILES, short name] of the ligand
 
-    if os.path.exists(log_file_path) is False:
+    Returns:
+    :returns: bool converted: True if Gypsum-DL made at least one 3D model of
+        the ligand
+    """
+    smiles, name = ligand_info
+    if detect_unassigned_bonds(smiles) is None:
+        print("WARNING: Throwing out SMILES because of unassigned bonds: " + smiles)
         return False
 
-    sys.stdout.flush()
-    with open(log_file_path) as log:
-        data = log.readlines()
-    if len(data) == 0:
-        # For whatever reason it didn't write to the file.
-        return None
-
-    lastline = data[-1]
-    lastline = lastline.replace("\n", "")
-    lastline = lastline.replace("\t", "")
-    lastline = lastline.replace(" ", "")
-
-    if str(lastline) == "TIMEOUT":
+    new_contnr = MolContainer(smiles, name, 0, {})
+    if type(new_contnr.orig_smi_canonical) != str:
+        print(
+            "WARNING: Throwing out SMILES because of it couldn't convert to mol: "
+            + smiles
+        )
         return False
-    if str(lastline) == "FAILED ERRORS WITH THE LIGAND":
-        return None
-    # passes
-    return True
+
+    # The .sdf files are named by contnr_idx_orig. Set it to 0 so every
+    # ligand is named __input1 as if it were the only ligand in the file.
+    new_contnr.contnr_idx_orig = 0
+    execute_gypsum_dl([new_contnr], params)
+
+    return len(new_contnr.mols) != 0
 
 
-def convert_sdf_to_pdbs(vars, gen_folder_path, sdfs_folder_path):
+def get_sdf_files_of_smi_file(smi_file, sdfs_folder_path):
+    """
+    Find the .sdf files Gypsum-DL made for the ligands in an .smi file.
+
+    Inputs:
+    :param str smi_file: the file name of the .smi file which was converted
+    :param str sdfs_folder_path: Path of the folder with all of the 3D .sdf
+        files
+
+    Returns:
+    :returns: list list_of_sdf_files: list of paths to the .sdf files of the
+        ligands in smi_file which converted successfully
+    """
+    list_of_sdf_files = []
+    with open(smi_file) as smiles_file:
+        for line in smiles_file:
+            parts = line.replace("    ", "\t").replace("\n", "").split("\t")
+            if len(parts) < 2:
+                continue
+            lig_name_short = parts[1].split(")")[-1]
+            sdf_file = "{}{}__input1.sdf".format(sdfs_folder_path, lig_name_short)
+            if os.path.exists(sdf_file):
+                list_of_sdf_files.append(sdf_file)
+
+    return list_of_sdf_files
+
+
+def convert_sdf_to_pdbs(vars, gen_folder_path, sdfs_folder_path,
+                        list_of_sdf_files=None):
     """
     It will find any .sdf files within the folder_path and convert them to
     .pdb types using rdkit.Chem. It also makes a subfolder to store the pdb
@@ -410,11 +1292,26 @@ def convert_sdf_to_pdbs(vars, gen_folder_path, sdfs_folder_path):
     :param str gen_folder_path: Path of the folder for the current generation
     :param str sdfs_folder_path: Path of the folder with all of the 3D .sdf
         files to convert
+    :param list list_of_sdf_files: list of the .sdf files to convert. If None
+        every .sdf file within sdfs_folder_path is converted.
+
+    Returns:
+    :returns: dict pdb_records_by_ligand: Keys are the short names of the
+        ligands and items are lists of [SMILES, pose name] for each of their
+        PDBs, sorted by PDB file name. Ligands without any PDBs are not
+        included.
     """
 
     files = []
 
-    if os.path.isdir(sdfs_folder_path):
+    if list_of_sdf_files is not None:
+        if len(list_of_sdf_files) == 0:
+            # A single chunk may fail entirely without the whole run failing
+            print("\nNone of the ligands in this chunk converted to 3D.\n")
+            return {}
+        files.extend(list_of_sdf_files)
+
+    elif os.path.isdir(sdfs_folder_path):
         # so it's a directory, go through the directory and find all the sdf files
         if sdfs_folder_path[-1:] != os.sep:
             sdfs_folder_path = (
@@ -453,92 +1350,171 @@ def convert_sdf_to_pdbs(vars, gen_folder_path, sdfs_folder_path):
         raise Exception(printout)
 
     # Convert sdf files to pdbs in multithread
-    vars["parallelizer"].run(job_inputs, convert_single_sdf_to_pdb)
+    output = vars["parallelizer"].run(job_inputs, convert_single_sdf_to_pdb)
+
+    pdb_records_by_ligand = {}
+    for job_input, pdb_records in zip(job_inputs, output):
+        if pdb_records is None or len(pdb_records) == 0:
+            continue
+        lig_name_short = basename(job_input[1]).split("__input1")[0]
+        pdb_records.sort(key=lambda x: x[1] + ".pdb")
+        pdb_records_by_ligand[lig_name_short] = pdb_records
+
+    return pdb_records_by_ligand
 
 
 def convert_single_sdf_to_pdb(pdb_subfolder_path, sdf_file_path):
     """
     This will convert a given .sdf into separate .pdb files.
 
+    The .sdf is parsed once. Each PDB is built in memory with a REMARK header
+    holding its final SMILES (with protanation and stereochem) and written
+    once.
+
     Inputs:
     :param str pdb_subfolder_path: Path of the folder to place all created pdb
         files
     :param str sdf_file_path: Path of the sdf_file_path to convert to pdb
         files
+
+    Returns:
+    :returns: list pdb_records: a list of [SMILES, pose name] for every PDB
+        written, in order. The pose name is the PDB file name without .pdb
+        ie) [["CCC", "Gen_1_Mutant_7_63__1"]]
+    """
+    pdb_records = []
+    for no_hydrogen_smiles, pose_name, mol, _ in read_sdf_poses(sdf_file_path):
+        pdb_block = "REMARK Final SMILES string: {}\n".format(no_hydrogen_smiles)
+        pdb_block = pdb_block + Chem.MolToPDBBlock(mol, flavor=32)
+        with open(pdb_subfolder_path + pose_name + ".pdb", "w") as f:
+            f.write(pdb_block)
+
+        pdb_records.append([no_hydrogen_smiles, pose_name])
+
+    return pdb_records
+
+
+def convert_sdf_to_shards(vars, gen_folder_path, list_of_sdf_files):
+    """
+    Append the poses in a list of .sdf files to the shards in the
+    3D_SDF_Shards folder of the generation. Each .sdf file is deleted once
+    its poses are in the shard index.
+
+    The poses are named and filtered the same way as when they are converted
+    to PDB files, so the shards hold the same poses the PDBs folder would.
+
+    Inputs:
+    :param dict vars: User variables which will govern how the programs runs
+    :param str gen_folder_path: Path of the folder for the current generation
+    :param list list_of_sdf_files: list of the .sdf files to shard
+
+    Returns:
+    :returns: dict pdb_records_by_ligand: Keys are the short names of the
+        ligands and items are lists of [SMILES, pose name] for each of their
+        poses. Ligands without any poses are not included.
     """
+    job_inputs = tuple(
+        [tuple([file_path]) for file_path in list_of_sdf_files if "params" not in file_path]
+    )
+    if len(job_inputs) == 0:
+        # A single chunk may fail entirely without the whole run failing
+        print("\nNone of the ligands in this chunk converted to 3D.\n")
+        return {}
+
+    output = vars["parallelizer"].run(job_inputs, read_sdf_pose_records)
+
+    shard_writer = SDFShardWriter(
+        gen_folder_path + SDF_SHARD_FOLDERNAME, vars["ligands_per_shard"]
+    )
+    pdb_records_by_ligand = {}
+    for job_input, pose_records in zip(job_inputs, output):
+        if pose_records is None or len(pose_records) == 0:
+            continue
+        lig_name_short = basename(job_input[0]).split("__input1")[0]
+        shard_writer.add_ligand(pose_records)
+        pdb_records_by_ligand[lig_name_short] = [x[:2] for x in pose_records]
+    shard_writer.close()
 
-    if os.path.exists(sdf_file_path) is True:
+    for job_input in job_inputs:
+        if os.path.exists(job_input[0]):
+            os.remove(job_input[0])
 
-        file_basename = basename(sdf_file_path)
-        file_basename = file_basename.split("__input1")[0]
+    return pdb_records_by_ligand
 
-        file_output_name = "{}{}_".format(pdb_subfolder_path, file_basename)
 
+def read_sdf_pose_records(sdf_file_path):
+    """
+    Read the poses of an .sdf file to add to the shards. The title of each
+    pose is set to its pose name.
+
+    Inputs:
+    :param str sdf_file_path: Path of the .sdf file
+
+    Returns:
+    :returns: list pose_records: a list of [SMILES, pose name, sdf text] for
+        every pose, in order
+    """
+    return [
+        [no_hydrogen_smiles, pose_name, rename_sdf_text(sdf_text, pose_name)]
+        for no_hydrogen_smiles, pose_name, _, sdf_text in read_sdf_poses(sdf_file_path)
+    ]
+
+
+def read_sdf_poses(sdf_file_path):
+    """
+    Parse the poses of an .sdf file made by Gypsum-DL. Poses which fail
+    sanitization are skipped. The remaining poses are named
+    {ligand}__{n} indexed to 1 ie) Gen_1_Mutant_7_63__1
+
+    Inputs:
+    :param str sdf_file_path: Path of the .sdf file
+
+    Returns:
+    :returns: list poses: a list of [SMILES, pose name, mol, sdf text] for
+        every pose, in order. The SMILES is without hydrogens and the sdf
+        text is the unmodified .sdf record of the pose.
+    """
+    poses = []
+    if os.path.exists(sdf_file_path) is False:
+        return poses
+
+    file_basename = basename(sdf_file_path)
+    file_basename = file_basename.split("__input1")[0]
+
+    try:
+        mols = Chem.SDMolSupplier(
+            sdf_file_path, sanitize=False, removeHs=False, strictParsing=False
+        )
+    except:
+        mols = None
+
+    # if mols is None rdkit couldn't import the sdf so we will not do anything else
+    # if len(mols)==0 gypsum output a blank file by accident
+    if mols is None or len(mols) == 0:
+        return poses
+
+    for mol_idx, mol in enumerate(mols):
+        # Extra precaution to prevent None's within a set of good
+        # mols
+        if mol is None:
+            continue
+
+        mol = MOH.check_sanitization(mol)
+        # Filter out any which failed
+        if mol is None:
+            continue
+
+        # Get the SMILES without hydrogens for the header
         try:
-            mols = Chem.SDMolSupplier(
-                sdf_file_path, sanitize=False, removeHs=False, strictParsing=False
-            )
+            no_hydrogen_smiles = Chem.MolToSmiles(Chem.RemoveHs(mol))
         except:
-            mols = None
+            no_hydrogen_smiles = Chem.MolToSmiles(mol)
+        if no_hydrogen_smiles is None:
+            print("SMILES was None for: ", file_basename)
+            no_hydrogen_smiles = "None"
 
-        # if mols is None rdkit couldn't import the sdf so we will not do anything else
-        if mols is None:
-            pass
-        elif len(mols) == 0:
-            pass
-        else:
-            try:
-                mols_no_hydrogen = Chem.SDMolSupplier(
-                    sdf_file_path, sanitize=True, removeHs=True, strictParsing=False
-                )
-            except:
-                mols_no_hydrogen = [None for x in range(0, len(mols))]
-
-            # if len(mols)==0 gypsum output a blank file by accident
-            # if mols is None rdkit couldn't import the sdf
-            if len(mols) != 0:
-                counter = 0
-                for i in range(0, len(mols)):
-                    mol = mols[i]
-                    # Extra precaution to prevent None's within a set of good
-                    # mols
-                    if mol is None:
-                        continue
-
-                    mol = MOH.check_sanitization(mol)
-                    # Filter out any which failed
-                    if mol is None:
-                        continue
-
-                    # pdb_name indexed to 1
-                    pdb_name = "{}_{}.pdb".format(file_output_name, counter + 1)
-                    if mol is not None:  # For extra precaution...
-                        Chem.MolToPDBFile(mol, pdb_name, flavor=32)
-                        # Add header to PDB file with SMILES containing
-                        # protanation and stereochem
-
-                        no_hydrogen_smiles = mols_no_hydrogen[i]
-                        if no_hydrogen_smiles is None:
-                            no_hydrogen_smiles = Chem.MolToSmiles(mol)
-
-                        if no_hydrogen_smiles is None:
-                            print("SMILES was None for: ", pdb_name)
-                            printout = "REMARK Final SMILES string: {}\n".format("None")
-                        elif type(no_hydrogen_smiles) == str:
-                            printout = "REMARK Final SMILES string: {}\n".format(
-                                no_hydrogen_smiles
-                            )
-                        elif type(no_hydrogen_smiles) == type(Chem.MolFromSmiles("C")):
-                            printout = "REMARK Final SMILES string: {}\n".format(
-                                Chem.MolToSmiles(no_hydrogen_smiles)
-                            )
-
-                        with open(pdb_name) as f:
-                            printout = printout + f.read()
-                        with open(pdb_name, "w") as f:
-                            f.write(printout)
-                        printout = ""
-
-                    counter = counter + 1
-            else:
-                pass
+        # pose_name indexed to 1
+        pose_name = "{}__{}".format(file_basename, len(poses) + 1)
+        poses.append([no_hydrogen_smiles, pose_name, mol, mols.GetItemText(mol_idx)])
+
+    return poses
@@ -59,7 +59,10 @@ def pick_lowest_enrgy_mols(mol_lst, num, thoroughness):
     # a list of Gypsum-DL MyMol.MyMol objects.
     mols_3d = Utils.random_sample(mol_lst, num * thoroughness, "")
 
-    # Now get the energies
+    # Now get the energies. Variants ranked by an earlier step (or converted
+    # to 3D before) reuse that conformer, so only new variants are embedded.
+    # The conformers are kept on the mols, so the picked ones are not
+    # embedded again when converted to 3D or minimized.
     data = []
     for i, mol in enumerate(mols_3d):
         mol.make_first_3d_conf_no_min()  # Make sure at least one conformer
@@ -73,8 +76,9 @@ def pick_lowest_enrgy_mols(mol_lst, num, thoroughness):
     # Now keep only best top few.
     data = data[:num]
 
-    # Keep just the mols there.
-    new_mols_list = [mol_lst[d[1]] for d in data]
+    # Keep just the mols there. Note that the indexes are of mols_3d, which
+    # is shuffled, not of mol_lst.
+    new_mols_list = [mols_3d[d[1]] for d in data]
 
     # Return those molecules.
     return new_mols_list
@@ -27,9 +27,13 @@ import __future__
 import sys
 import copy
 import operator
+from collections import OrderedDict
+
+import numpy
 
 import gypsum_dl.Utils as Utils
 import gypsum_dl.MolObjectHandling as MOH
+import gypsum_dl.ProhibitedSubstructs as ProhibitedSubstructs
 
 #Disable the unnecessary RDKit warnings
 from rdkit import RDLogger
@@ -39,6 +43,7 @@ try:
     import rdkit
     from rdkit.Chem import AllChem
     from rdkit import Chem
+    from rdkit.Chem import rdMolAlign
     from rdkit.Chem.rdchem import BondStereo
 except:
     Utils.exception("You need to install rdkit and its dependencies.")
@@ -48,6 +53,16 @@ try:
 except:
     Utils.exception("You need to install molvs and its dependencies.")
 
+# The max number of first conformers kept in FIRST_CONF_CACHE.
+FIRST_CONF_CACHE_SIZE = 10000
+
+# The first (unminimized) conformers made in this process, so a variant that
+# comes up again in a later step, as a new MyMol.MyMol object, is not embedded
+# again. Keys are the isomeric SMILES strings of the molecules with hydrogen
+# atoms, and items are (coordinates in canonical atom order, energy), or None
+# if the molecule could not be embedded.
+FIRST_CONF_CACHE = OrderedDict()
+
 class MyMol:
     """
     A class that wraps around a rdkit.Mol object. Includes additional data and
@@ -266,11 +281,46 @@ class MyMol:
         # Add hydrogens. JDD: I don't think this undoes dimorphite-dl, but we
         # need to check that.
         self.rdkit_mol = MOH.try_reprotanation(self.rdkit_mol)
+        if self.rdkit_mol is None:
+            return
+
+        # The same variant is often ranked by several steps (and again when
+        # converted to 3D), each time as a new MyMol.MyMol object. Reuse the
+        # conformer made the first time instead of embedding again.
+        cache_key = Chem.MolToSmiles(self.rdkit_mol, isomericSmiles=True)
+        canonical_ranks = list(
+            Chem.CanonicalRankAtoms(self.rdkit_mol, breakTies=True)
+        )
+        if cache_key in FIRST_CONF_CACHE:
+            FIRST_CONF_CACHE.move_to_end(cache_key)
+            cached = FIRST_CONF_CACHE[cache_key]
+            if cached is not None:
+                canonical_coords, energy = cached
+                conf = Chem.Conformer(self.rdkit_mol.GetNumAtoms())
+                for idx, rank in enumerate(canonical_ranks):
+                    conf.SetAtomPosition(idx, canonical_coords[rank].tolist())
+                self.conformers = [
+                    MyConformer(self, conf, False, False, energy, False)
+                ]
+            return
 
         # Add a single conformer. RMSD cutoff very small so all conformers
         # will be accepted. And not minimizing (False).
         self.add_conformers(1, 1e60, False)
 
+        # Save the conformer in canonical atom order, so it can be used by any
+        # MyMol.MyMol of the same molecule.
+        cached = None
+        if len(self.conformers) > 0:
+            coords = self.conformers[0].conformer().GetPositions()
+            canonical_coords = numpy.zeros(coords.shape)
+            canonical_coords[canonical_ranks] = coords
+            cached = (canonical_coords, self.conformers[0].energy)
+
+        FIRST_CONF_CACHE[cache_key] = cached
+        while len(FIRST_CONF_CACHE) > FIRST_CONF_CACHE_SIZE:
+            FIRST_CONF_CACHE.popitem(last=False)
+
     def smiles(self, noh=False):
         """Get the desalted, canonical smiles string associated with this
            object. (Not the input smiles!)
@@ -441,45 +491,30 @@ class MyMol:
         # "[*@@H]1~2~*~[*@@H](~*~*2)~*1", "[*@@H]~1~2~*~*~*~[*@H]1O2",
         # "[*@@H]~1~2~*~*~*~*~[*@H]1O2"]
 
-        # Note that C(O)=N, C and N mean they are aliphatic. Does not match
-        # c(O)n, when aromatic. So this form is acceptable if in aromatic
-        # structure.
-        prohibited_substructures = ["O(=*)-*"] #, "C(O)=N"]
-        prohibited_substructures.append("C(=[CH2])[OH]")  # Enol forms with terminal alkenes are unlikely.
-        prohibited_substructures.append("C(=[CH2])[O-]")  # Enol forms with terminal alkenes are unlikely.
-        prohibited_substructures.append("C=C([OH])[OH]")  # A geminal vinyl diol is not a tautomer of a carboxylate group.
-        prohibited_substructures.append("C=C([O-])[OH]")  # A geminal vinyl diol is not a tautomer of a carboxylate group.
-        prohibited_substructures.append("C=C([O-])[O-]")  # A geminal vinyl diol is not a tautomer of a carboxylate group.
-        prohibited_substructures.append("[C-]")  # No carbanions.
-        prohibited_substructures.append("[c-]")  # No carbanions.
-
-        for s in prohibited_substructures:
+        # See ProhibitedSubstructs.bizarre_substructs for the list.
+        for s in ProhibitedSubstructs.bizarre_substructs:
             # First just match strings... could be faster, but not 100%
             # accurate.
-            if s in self.orig_smi:
-                Utils.log("\tDetected unusual substructure: " + s)
-                self.bizarre_substruct = True
-                return True
-
-            if s in self.orig_smi_deslt:
-                Utils.log("\tDetected unusual substructure: " + s)
-                self.bizarre_substruct = True
-                return True
-
-            if s in self.can_smi:
+            if (
+                s in self.orig_smi
+                or s in self.orig_smi_deslt
+                or s in self.can_smi
+            ):
                 Utils.log("\tDetected unusual substructure: " + s)
                 self.bizarre_substruct = True
                 return True
 
-        # Now do actual substructure matching
-        for s in prohibited_substructures:
-            pattrn = Chem.MolFromSmarts(s)
-            if self.rdkit_mol.HasSubstructMatch(pattrn):
-                # Utils.log("\tRemoving a molecule because it has an odd
-                # substructure: " + s)
-                Utils.log("\tDetected unusual substructure: " + s)
-                self.bizarre_substruct = True
-                return True
+        # Now do actual substructure matching, against all the compiled
+        # substructures at once.
+        s = ProhibitedSubstructs.find_prohibited_substruct(
+            self.rdkit_mol, "bizarre"
+        )
+        if s is not None:
+            # Utils.log("\tRemoving a molecule because it has an odd
+            # substructure: " + s)
+            Utils.log("\tDetected unusual substructure: " + s)
+            self.bizarre_substruct = True
+            return True
 
         # Now certin patterns that are more complex.
         # TODO in the future?
@@ -554,9 +589,13 @@ class MyMol:
         self.set_rdkit_mol_prop("Genealogy", genealogy)
         self.set_rdkit_mol_prop("_Name", self.name)
 
-    def add_conformers(self, num, rmsd_cutoff=0.1, minimize=True):
+    def add_conformers(self, num, rmsd_cutoff=0.1, minimize=True,
+                       num_threads=1):
         """Add conformers to this molecule.
 
+        All new conformers after the first are embedded with a single
+        multi-conformer call and, if requested, minimized together.
+
         :param num: The total number of conformers to generate, including ones
            that have been generated previously.
         :type num: int
@@ -566,21 +605,29 @@ class MyMol:
         :param minimize: Whether or not to minimize the geometry of all these
            conformers. Defaults to True.
         :param minimize: bool, optional
+        :param num_threads: The number of threads RDKit uses to embed and
+           minimize the conformers. 0 uses every thread the system supports.
+           Defaults to 1, because Gypsum-DL usually runs one molecule per
+           process.
+        :param num_threads: int, optional
         """
 
         # First, do you need to add new conformers? Some might have already
         # been added. Just add enough to meet the requested amount.
         num_new_confs = max(0, num - len(self.conformers))
-        for i in range(num_new_confs):
-            if len(self.conformers) == 0:
-                # For the first one, don't start from random coordinates.
-                new_conf = MyConformer(self)
-            else:
-                # For all subsequent ones, do start from random coordinates.
-                new_conf = MyConformer(self, None, False, True)
 
+        if num_new_confs > 0 and len(self.conformers) == 0:
+            # For the first one, don't start from random coordinates.
+            new_conf = MyConformer(self)
             if new_conf.mol is not False:
                 self.conformers.append(new_conf)
+            num_new_confs = num_new_confs - 1
+
+        if num_new_confs > 0:
+            # For all subsequent ones, do start from random coordinates.
+            self.conformers.extend(
+                self.embed_conformers(num_new_confs, minimize, num_threads)
+            )
 
         # Are the current ones minimized if necessary?
         if minimize == True:
@@ -593,38 +640,104 @@ class MyMol:
         # Remove ones that are very structurally similar.
         self.eliminate_structurally_similar_conformers(rmsd_cutoff)
 
+    def embed_conformers(self, num, minimize=True, num_threads=1):
+        """Embed several conformers from random coordinates with one call to
+           EmbedMultipleConfs, then calculate their energies (or minimize
+           them) with one force field.
+
+        :param num: The number of conformers to embed.
+        :type num: int
+        :param minimize: Whether or not to minimize the new conformers.
+           Defaults to True.
+        :param minimize: bool, optional
+        :param num_threads: The number of threads RDKit uses. Defaults to 1.
+        :param num_threads: int, optional
+        :return: A list of the new MyConformer objects. It may be shorter than
+           num if some conformers could not be embedded.
+        :rtype: list
+        """
+
+        mol = copy.deepcopy(self.rdkit_mol)
+        mol.RemoveAllConformers()
+
+        try:
+            params = AllChem.ETKDGv2()
+        except:
+            params = AllChem.ETKDG()
+        params.enforcechiral = True
+        params.maxIterations = 0
+        params.useRandomCoords = True
+        params.numThreads = num_threads
+
+        conf_ids = list(AllChem.EmbedMultipleConfs(mol, num, params))
+        if len(conf_ids) == 0:
+            return []
+
+        # Get the energy of every conformer.
+        try:
+            if minimize == True:
+                results = AllChem.UFFOptimizeMoleculeConfs(
+                    mol, numThreads=num_threads
+                )
+                energies = [result[1] for result in results]
+            else:
+                ff = AllChem.UFFGetMoleculeForceField(mol, confId=conf_ids[0])
+                energies = [
+                    ff.CalcEnergy(
+                        mol.GetConformer(conf_id).GetPositions().flatten().tolist()
+                    )
+                    for conf_id in conf_ids
+                ]
+        except:
+            Utils.log("Warning: Could not calculate energy for molecule " +
+                      Chem.MolToSmiles(mol))
+            energies = [9999 for conf_id in conf_ids]
+
+        new_confs = []
+        for conf_id, energy in zip(conf_ids, energies):
+            new_confs.append(
+                MyConformer(
+                    self, Chem.Conformer(mol.GetConformer(conf_id)), False, False, energy,
+                    minimize
+                )
+            )
+
+        return new_confs
+
     def eliminate_structurally_similar_conformers(self, rmsd_cutoff=0.1):
         """Eliminates conformers that are very geometrically similar.
 
+        The heavy-atom RMSD of every pair of conformers is calculated at once
+        after optimal superposition. Conformers are then kept in order
+        (lowest energy first) unless they are within the cutoff of a conformer
+        that was already kept. Each kept conformer is aligned to the first.
+
         :param rmsd_cutoff: The RMSD cutoff to use. Defaults to 0.1
         :param rmsd_cutoff: float, optional
         """
 
+        if len(self.conformers) < 2:
+            return
+
+        rmsd_matrix = get_rmsd_matrix(
+            [
+                conf.conformer().GetPositions()[conf.ids_hvy_atms]
+                for conf in self.conformers
+            ]
+        )
+
         # Eliminate redundant ones.
-        for i1 in range(0, len(self.conformers) - 1):
-            if self.conformers[i1] is not None:
-                for i2 in range(i1 + 1, len(self.conformers)):
-                    if self.conformers[i2] is not None:
-                        # Align them.
-                        self.conformers[i2] = self.conformers[i1].align_to_me(
-                            self.conformers[i2]
-                        )
-
-                        # Calculate the RMSD.
-                        rmsd = self.conformers[i1].rmsd_to_me(
-                            self.conformers[i2]
-                        )
-
-                        # Replace the second one with None if it's too similar
-                        # to the first.
-                        if rmsd <= rmsd_cutoff:
-                            self.conformers[i2] = None
-
-        # Remove all the None entries.
-        while None in self.conformers:
-            self.conformers.remove(None)
+        kept_idxs = []
+        for i in range(len(self.conformers)):
+            if all(rmsd_matrix[i, j] > rmsd_cutoff for j in kept_idxs):
+                kept_idxs.append(i)
 
         # Those that remains are only the distinct conformers.
+        self.conformers = [self.conformers[i] for i in kept_idxs]
+
+        # Align them to the first one.
+        for conf in self.conformers[1:]:
+            self.conformers[0].align_to_me(conf)
 
     def count_hyd_bnd_to_carb(self):
         """Count the number of Hydrogens bound to carbons."""
@@ -654,7 +767,8 @@ class MyConformer:
     MyMol.MyMol object (different molecule conformations).
     """
 
-    def __init__(self, mol, conformer=None, second_embed=False, use_random_coordinates=False):
+    def __init__(self, mol, conformer=None, second_embed=False, use_random_coordinates=False,
+                 energy=None, minimized=False):
         """Create a MyConformer objects.
 
         :param mol: The MyMol.MyMol associated with this conformer.
@@ -673,6 +787,12 @@ class MyConformer:
            conformers to try to consider alternate geometries. So they should
            start from random coordinates. Defaults to False.
         :type use_random_coordinates: bool, optional
+        :param energy: The energy of the provided conformer, if already
+           calculated. Defaults to None.
+        :type energy: float, optional
+        :param minimized: Whether the provided conformer has already been
+           minimized. Defaults to False.
+        :type minimized: bool, optional
         """
 
         # Save some values to the object.
@@ -743,7 +863,12 @@ class MyConformer:
             self.mol.AddConformer(conformer, assignId=True)
 
         # Calculate some energies, other housekeeping.
-        if self.mol is not False:
+        if self.mol is not False and energy is not None:
+            self.energy = energy
+            self.minimized = minimized
+            self.ids_hvy_atms = [a.GetIdx() for a in self.mol.GetAtoms()
+                                 if a.GetAtomicNum() != 1]
+        elif self.mol is not False:
             try:
                 ff = AllChem.UFFGetMoleculeForceField(self.mol)
                 self.energy = ff.CalcEnergy()
@@ -802,18 +927,13 @@ class MyConformer:
         :rtype: MyConformer
         """
 
-        # Add the conformer of the other MyConformer object.
-        self.mol.AddConformer(other_conf.conformer(), assignId=True)
-
-        # Align them.
-        AllChem.AlignMolConformers(self.mol, atomIds = self.ids_hvy_atms)
-
-        # Reset the conformer of the other MyConformer object.
-        last_conf = self.mol.GetConformers()[-1]
-        other_conf.conformer(last_conf)
-
-        # Remove the added conformer.
-        self.mol.RemoveConformer(last_conf.GetId())
+        # Align the heavy atoms of the other conformer onto this one. This
+        # moves the other conformer in place.
+        rdMolAlign.AlignMol(
+            other_conf.mol,
+            self.mol,
+            atomMap=[(idx, idx) for idx in self.ids_hvy_atms],
+        )
 
         # Return that other object.
         return other_conf
@@ -856,3 +976,38 @@ class MyConformer:
         )
 
         return rmsd
+
+
+def get_rmsd_matrix(list_of_coords):
+    """Calculate the RMSD between every pair of conformers after optimal
+       superposition (the Kabsch algorithm), vectorized over all pairs.
+
+    :param list_of_coords: A list of numpy arrays of shape (number of atoms,
+       3). The atoms must be in the same order in every array.
+    :type list_of_coords: list
+    :return: A symmetric numpy array of shape (number of conformers, number of
+       conformers) with the RMSD of every pair.
+    :rtype: numpy.ndarray
+    """
+
+    coords = numpy.array(list_of_coords, dtype=float)
+    num_atoms = coords.shape[1]
+
+    # Center every conformer on its centroid.
+    coords = coords - coords.mean(axis=1)[:, numpy.newaxis, :]
+
+    # The covariance matrix of every pair, shape (n, n, 3, 3).
+    covariance = numpy.einsum("iak,jal->ijkl", coords, coords)
+    u, singular_values, vt = numpy.linalg.svd(covariance)
+
+    # Correct for reflections.
+    sign = numpy.sign(numpy.linalg.det(u) * numpy.linalg.det(vt))
+    singular_values[..., 2] = singular_values[..., 2] * sign
+
+    sq_norms = (coords ** 2).sum(axis=(1, 2))
+    sq_deviation = (
+        sq_norms[:, numpy.newaxis] + sq_norms[numpy.newaxis, :]
+        - 2.0 * singular_values.sum(axis=-1)
+    )
+
+    return numpy.sqrt(numpy.clip(sq_deviation, 0.0, None) / num_atoms)
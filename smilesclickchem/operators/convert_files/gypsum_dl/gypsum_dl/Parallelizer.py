@@ -28,8 +28,13 @@ system. (Description provided by Harrison Green.)
 """
 
 import __future__
+import atexit
 import multiprocessing
+import multiprocessing.connection
+import queue
 import sys
+import threading
+import traceback
 
 MPI_installed = False
 try:
@@ -45,7 +50,9 @@ class Parallelizer(object):
     Abstract parallelization class
     """
 
-    def __init__(self, mode=None, num_procs=None, flag_for_low_level=False):
+    def __init__(
+        self, mode=None, num_procs=None, flag_for_low_level=False, persistent_pool=False
+    ):
         """
         This will initialize the Parallelizer class and kick off the specific classes for multiprocessing and MPI.
 
@@ -72,6 +79,9 @@ class Parallelizer(object):
                                         This will be overriden and fixed to a single processor if mode==serial
         :param bol flag_for_low_level: this will override mode and number of processors and set it to a multiprocess as serial. This is useful because
                                 a low-level program in mpi mode referenced by a top level program in mpi mode will have terrible problems. This means you can't mpi-multiprocess inside an mpi-multiprocess.
+        :param bol persistent_pool: if True and the mode is multiprocessing, the worker processes are started once (on the first call to run)
+                                and reused for every later call to run until end() is called. Any module-level state a worker builds
+                                (ie compiled reaction libraries) is kept between calls. If False a new set of processes is started for every call to run.
         """
 
         if mode == "none" or mode == "None":
@@ -125,6 +135,19 @@ class Parallelizer(object):
         else:
             self.num_procs = self.compute_nodes()
 
+        # The persistent pool is only used in multiprocessing mode. It is
+        # started lazily so no processes are made until there is work to do.
+        self.persistent_pool = persistent_pool
+        self.pool_obj = None
+
+        # List of (func, args) which every newly started worker process runs
+        # before it takes any jobs. See install_worker_state()
+        self.worker_initializers = []
+
+        # Objects which are kept for as long as the persistent pool and are
+        # ended by end(). See get_persistent_resource()
+        self.persistent_resources = {}
+
     def test_import_MPI(self, mode, flag_for_low_level=False):
         """
         This tests for the ability of importing the MPI sublibrary from mpi4py.
@@ -238,7 +261,8 @@ class Parallelizer(object):
 
     def end(self, mode=None):
         """
-        Call this method before exit to terminate MPI workers
+        Call this method before exit to terminate MPI workers and the
+        persistent worker pool.
 
 
         Inputs:
@@ -250,6 +274,16 @@ class Parallelizer(object):
 
         if mode == None:
             mode = self.mode
+
+        # The pool is shut down regardless of mode
+        if self.pool_obj is not None:
+            self.pool_obj.end()
+            self.pool_obj = None
+
+        for resource in self.persistent_resources.values():
+            resource.end()
+        self.persistent_resources = {}
+
         if mode == "mpi":
 
             if self.HAS_MPI == True and self.parallel_obj != None:
@@ -327,11 +361,114 @@ class Parallelizer(object):
             return self.parallel_obj.run(func, args)
 
         elif mode == "multiprocessing":
-            return MultiThreading(args, num_procs, func)
+            if self.persistent_pool == True and num_procs == self.num_procs:
+                if self.pool_obj is None:
+                    self.pool_obj = ParallelPool(
+                        self.num_procs, self.worker_initializers
+                    )
+                self.pool_obj.initializers = self.worker_initializers
+                return self.pool_obj.run(func, args)
+
+            return MultiThreading(args, num_procs, func, self.worker_initializers)
         else:
             # serial is running the ParallelThreading with num_procs=1
             return MultiThreading(args, 1, func)
 
+    def install_worker_state(self, func, args):
+        """
+        Install state (ie a large object used by every job) into every worker
+        once, rather than shipping it with every job.
+
+        func(*args) is run once in this process and once in every worker
+        which is currently running. It is also recorded so that it is run by
+        every worker started later, before that worker takes any jobs.
+        func should store the state in a module-level variable which the job
+        functions read. It should replace that state rather than add to it,
+        as a worker forked from this process may already have it.
+
+        Workers started later receive the args objects as they are at that
+        time. If the objects are modified in this process, use
+        update_worker_state() to make the same change in running workers.
+
+        Inputs:
+        :param python_obj func: function which installs the state. It must be
+            a module-level function.
+        :param tuple args: the arguments for func
+        """
+
+        self.worker_initializers.append((func, tuple(args)))
+        self.update_worker_state(func, args)
+
+    def update_worker_state(self, func, args):
+        """
+        Run func(*args) once in this process and once in every worker which
+        is currently running. Unlike install_worker_state() it is not rerun
+        by workers started later.
+
+        Inputs:
+        :param python_obj func: function which changes the state. It must be
+            a module-level function.
+        :param tuple args: the arguments for func
+        """
+
+        args = tuple(args)
+        if self.mode == "mpi":
+            # Every rank, including this one, runs func exactly once
+            size = self.parallel_obj.COMM.Get_size()
+            self.parallel_obj.run(func, [args for i in range(size)])
+            return
+
+        func(*args)
+        if self.pool_obj is not None:
+            self.pool_obj.initializers = self.worker_initializers
+            self.pool_obj.run_on_every_worker(func, args)
+
+    def remove_worker_state(self, func):
+        """
+        Forget a function recorded by install_worker_state(). Workers started
+        afterwards will not run it, but still run every other recorded
+        function. State already installed in running workers is left in
+        place.
+
+        Inputs:
+        :param python_obj func: the function passed to install_worker_state()
+        """
+
+        self.worker_initializers = [
+            initializer
+            for initializer in self.worker_initializers
+            if initializer[0] is not func
+        ]
+
+    def get_persistent_resource(self, name, make_func):
+        """
+        Get an object which is kept for as long as the persistent pool, such
+        as a separate set of worker processes. It is made by make_func() the
+        first time it is asked for and its end() method is called by end().
+
+        Inputs:
+        :param str name: the name the object is kept under
+        :param python_obj make_func: function which takes no arguments and
+            returns a new object with an end() method
+
+        Returns:
+        :returns: python_obj resource: the object kept under name
+        """
+
+        if name not in self.persistent_resources:
+            self.persistent_resources[name] = make_func()
+
+        return self.persistent_resources[name]
+
+    def clear_worker_state(self):
+        """
+        Forget every function recorded by install_worker_state(). Workers
+        started afterwards will not run them. State already installed in
+        running workers is left in place.
+        """
+
+        self.worker_initializers = []
+
     def pick_mode(self):
         """
         Determines the parallelization cababilities of the system and returns one
@@ -616,6 +753,302 @@ class ParallelMPI(object):
 #
 
 
+class ParallelPool(object):
+    """
+    Utility code for running tasks on a pool of long-lived worker processes.
+
+    Unlike MultiThreading, which starts new processes for every call, the
+    workers of a ParallelPool are started once and wait on a shared task
+    queue until end() is called. Any state a worker builds, such as
+    module-level caches, is kept between calls to run().
+    """
+
+    # Seconds to wait for a result before checking again that every worker
+    # is still alive
+    WORKER_CHECK_INTERVAL = 0.01
+
+    def __init__(self, num_procs, initializers=None):
+        """
+        Start the worker processes.
+
+        Inputs:
+        :param int num_procs: the number of worker processes to start. If
+            num_procs <= 0 all available processors are used.
+        :param list initializers: list of (func, args) which every worker
+            runs when it starts, before taking any jobs. Can be None. The
+            Parallelizer keeps this up to date, so a worker started to
+            replace one which died runs the current initializers.
+        """
+
+        if num_procs <= 0:
+            num_procs = multiprocessing.cpu_count()
+        self.num_procs = num_procs
+
+        if initializers is None:
+            initializers = []
+        self.initializers = initializers
+
+        # Every task and result carries the id of the call of run() or
+        # run_on_every_worker() it belongs to, so a late result from an
+        # earlier call is ignored
+        self.run_id = 0
+
+        self.processes = None
+        self.start()
+
+        # Make sure the workers do not outlive the main process if end() is
+        # never reached (ie an Exception is raised in the main process)
+        atexit.register(self.end)
+
+    def start(self):
+        """
+        Make the queues and start every worker process.
+        """
+
+        self.task_queue = multiprocessing.Queue()
+
+        # Results are put with a SimpleQueue, which writes them before put()
+        # returns. A multiprocessing.Queue writes them from a background
+        # thread, so a worker which dies can take results it already "put"
+        # with it.
+        self.done_queue = multiprocessing.SimpleQueue()
+
+        # Used by run_on_every_worker() to stop a worker from taking a
+        # second copy of a message meant for each worker once
+        self.barrier = multiprocessing.Barrier(self.num_procs)
+
+        # The sequence number of the job each worker is running, or -1 if it
+        # is idle. This is shared memory rather than a message, so it is
+        # still readable if the worker dies.
+        self.running_jobs = multiprocessing.Array("i", self.num_procs, lock=False)
+
+        self.processes = [None for i in range(self.num_procs)]
+        for worker_index in range(self.num_procs):
+            self.start_worker(worker_index)
+
+    def start_worker(self, worker_index):
+        """
+        Start one worker process, replacing any earlier worker with the same
+        index.
+
+        Inputs:
+        :param int worker_index: the index of the worker
+        """
+
+        self.running_jobs[worker_index] = -1
+        process = multiprocessing.Process(
+            target=pool_worker,
+            args=(
+                self.task_queue,
+                self.done_queue,
+                self.barrier,
+                list(self.initializers),
+                worker_index,
+                self.running_jobs,
+            ),
+        )
+        process.start()
+        self.processes[worker_index] = process
+
+    def replace_dead_workers(self):
+        """
+        Start a new worker in place of every worker which has died.
+
+        Returns:
+        :returns: list dead_workers: a (worker index, exit code, sequence
+            number of the job it was running or -1) tuple for every worker
+            which died
+        """
+
+        dead_workers = []
+        for worker_index, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+
+            dead_workers.append(
+                (worker_index, process.exitcode, self.running_jobs[worker_index])
+            )
+            print(
+                "Worker process {} of the worker pool died (exit code {}). "
+                "Starting a new worker.".format(worker_index, process.exitcode)
+            )
+            self.start_worker(worker_index)
+
+        return dead_workers
+
+    def get_result(self):
+        """
+        Get the next result from the workers, waiting at most
+        WORKER_CHECK_INTERVAL seconds. A worker dying ends the wait early.
+
+        Returns:
+        :returns: tuple result: the (run id, sequence number, succeeded,
+            result) tuple sent by a worker. queue.Empty is raised if there is
+            none yet.
+        """
+
+        if self.done_queue.empty():
+            multiprocessing.connection.wait(
+                [process.sentinel for process in self.processes],
+                self.WORKER_CHECK_INTERVAL,
+            )
+            if self.done_queue.empty():
+                raise queue.Empty
+
+        return self.done_queue.get()
+
+    def run(self, func, args):
+        """
+        Run a function on the worker pool.
+
+        * func is a pure function of type (A)->(B)
+        * args is a list of type list(A)
+
+        Returns the result of type list(B) where result[i] = func(*args[i]).
+
+        If a worker dies while running a job (ie a segfault) it is replaced
+        and an Exception is raised for its job once every other job is done.
+
+        Inputs:
+        :param python_obj func: This is the object of the function which will
+            be used.
+        :param list args: a list of lists/tuples, each sublist/tuple must
+            contain all information required by the function for a single
+            object which will be multiprocessed
+
+        Returns:
+        :returns: list results: A list containing all the results in the
+            order of args
+        """
+
+        if len(args) == 0:
+            return []
+
+        if self.processes is None:
+            raise Exception("The worker pool has already been shut down")
+
+        args = check_and_format_inputs_to_list_of_tuples(args)
+
+        self.run_id = self.run_id + 1
+        for index, item in enumerate(args):
+            if not isinstance(item, tuple):
+                item = (item,)
+            self.task_queue.put((self.run_id, index, (func, item)))
+
+        results = {}
+        failed_job = None
+        while len(results) < len(args):
+            try:
+                run_id, seq, succeeded, result = self.get_result()
+            except queue.Empty:
+                for worker_index, exitcode, seq in self.replace_dead_workers():
+                    if seq < 0 or seq in results:
+                        continue
+
+                    result = "Worker process {} died (exit code {}) ".format(
+                        worker_index, exitcode
+                    )
+                    result = result + "while running this job."
+                    results[seq] = result
+                    if failed_job is None:
+                        failed_job = (seq, result)
+                continue
+
+            if run_id != self.run_id or seq in results:
+                # A late result of a job which was already failed
+                continue
+
+            if succeeded is False and failed_job is None:
+                failed_job = (seq, result)
+            results[seq] = result
+
+        if failed_job is not None:
+            printout = "Job {} failed within the worker pool:\n{}".format(
+                failed_job[0], failed_job[1]
+            )
+            print(printout)
+            raise Exception(printout)
+
+        return [results[seq] for seq in range(len(args))]
+
+    def run_on_every_worker(self, func, args):
+        """
+        Run func(*args) exactly once in every worker process.
+
+        If a worker dies the others can't get past the barrier, so the whole
+        pool is restarted and an Exception is raised. The restarted workers
+        run the initializers but not earlier calls of run_on_every_worker().
+
+        Inputs:
+        :param python_obj func: This is the object of the function which will
+            be used.
+        :param tuple args: the arguments for func
+        """
+
+        if self.processes is None:
+            raise Exception("The worker pool has already been shut down")
+
+        self.run_id = self.run_id + 1
+        for i in range(self.num_procs):
+            self.task_queue.put((self.run_id, "WORKER_STATE", (func, tuple(args))))
+
+        num_done = 0
+        failed_job = None
+        while num_done < self.num_procs:
+            try:
+                run_id, seq, succeeded, result = self.get_result()
+            except queue.Empty:
+                if all(process.is_alive() for process in self.processes):
+                    continue
+
+                # Release the workers waiting at the barrier for the dead one
+                self.barrier.abort()
+                self.end()
+                self.start()
+                printout = "A worker process died while installing worker "
+                printout = printout + "state, so the worker pool was restarted."
+                print(printout)
+                raise Exception(printout)
+
+            if run_id != self.run_id:
+                continue
+
+            num_done = num_done + 1
+            if succeeded is False and failed_job is None:
+                failed_job = result
+
+        if failed_job is not None:
+            printout = "Installing worker state failed within the worker "
+            printout = printout + "pool:\n{}".format(failed_job)
+            print(printout)
+            raise Exception(printout)
+
+    def end(self):
+        """
+        Stop all of the worker processes. Workers finish their current job
+        before stopping. Any which fail to stop are terminated.
+        """
+
+        if self.processes is None:
+            return
+
+        for i in range(len(self.processes)):
+            self.task_queue.put("STOP")
+
+        for process in self.processes:
+            process.join(10)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+        self.task_queue.close()
+        self.done_queue.close()
+        self.processes = None
+
+
+#
+
+
 class Empty_obj(object):
     """
     Create a unique Empty Object to hand to empty processors
@@ -635,7 +1068,7 @@ Adapted from examples on https://docs.python.org/2/library/multiprocessing.html
 
 
 
-def MultiThreading(inputs, num_procs, task_name):
+def MultiThreading(inputs, num_procs, task_name, initializers=None):
     """Initialize this object.
 
     Args:
@@ -644,6 +1077,9 @@ def MultiThreading(inputs, num_procs, task_name):
         num_procs (int): The number of processors to use.
         task_class_name (class): The class that governs what to do for each
             job on each processor.
+        initializers ([(func, args)]): functions each new worker process runs
+            before taking any jobs. These are not run when num_procs is 1,
+            as the jobs are then run in this process.
     """
 
     results = []
@@ -671,7 +1107,7 @@ def MultiThreading(inputs, num_procs, task_name):
             output = job(*args)
             results.append(output)
     else:
-        results = start_processes(tasks, num_procs)
+        results = start_processes(tasks, num_procs, initializers)
 
     return results
 
@@ -681,7 +1117,11 @@ def MultiThreading(inputs, num_procs, task_name):
 ###
 
 
-def worker(input, output):
+def worker(input, output, initializers=None):
+    if initializers is not None:
+        for func, args in initializers:
+            func(*args)
+
     for seq, job in iter(input.get, "STOP"):
         func, args = job
         result = func(*args)
@@ -689,6 +1129,53 @@ def worker(input, output):
         output.put(ret_val)
 
 
+def pool_worker(input, output, barrier, initializers, worker_index, running_jobs):
+    """
+    Worker function for the ParallelPool. Unlike worker, Exceptions are
+    caught and returned so the main process can raise them rather than
+    waiting forever for a result which will never come.
+
+    The sequence number of the job being run is written to
+    running_jobs[worker_index], so the main process knows which job was lost
+    if this worker dies.
+
+    Jobs with the sequence "WORKER_STATE" are sent once per worker. After
+    running one, the worker waits at the barrier until every other worker
+    has taken its copy.
+    """
+    # If an initializer fails every job is failed with its traceback
+    initializer_error = None
+    try:
+        for func, args in initializers:
+            func(*args)
+    except Exception:
+        initializer_error = traceback.format_exc()
+
+    for run_id, seq, job in iter(input.get, "STOP"):
+        if seq != "WORKER_STATE":
+            running_jobs[worker_index] = seq
+
+        func, args = job
+        if initializer_error is not None:
+            ret_val = (run_id, seq, False, initializer_error)
+        else:
+            try:
+                result = func(*args)
+                ret_val = (run_id, seq, True, result)
+            except Exception:
+                ret_val = (run_id, seq, False, traceback.format_exc())
+
+        if seq == "WORKER_STATE":
+            try:
+                barrier.wait()
+            except threading.BrokenBarrierError:
+                # Another worker died, so the pool is being restarted
+                pass
+            ret_val = (run_id, seq, ret_val[2], None if ret_val[2] else ret_val[3])
+        output.put(ret_val)
+        running_jobs[worker_index] = -1
+
+
 def check_and_format_inputs_to_list_of_tuples(args):
     # Make sure args is a list of tuples
     if type(args) != list and type(args) != tuple:
@@ -737,7 +1224,7 @@ def count_processors(num_inputs, num_procs):
     return num_procs
 
 
-def start_processes(inputs, num_procs):
+def start_processes(inputs, num_procs, initializers=None):
     """
     Creates a queue of inputs and outputs
     """
@@ -752,7 +1239,9 @@ def start_processes(inputs, num_procs):
 
     # Start worker processes
     for i in range(num_procs):
-        multiprocessing.Process(target=worker, args=(task_queue, done_queue)).start()
+        multiprocessing.Process(
+            target=worker, args=(task_queue, done_queue, initializers)
+        ).start()
 
     # Get and print results
     results = []
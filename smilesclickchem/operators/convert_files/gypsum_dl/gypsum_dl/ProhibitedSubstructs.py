@@ -0,0 +1,121 @@
+# Copyright 2018 Jacob D. Durrant
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+This module holds the substructures Gypsum-DL won't permit in a variant. Each
+set of substructures is compiled into an RDKit FilterCatalog once per
+process, so a variant is checked against every substructure of a set with a
+single call, which also reports which substructure matched.
+"""
+
+import __future__
+
+import gypsum_dl.Utils as Utils
+
+try:
+    from rdkit.Chem.FilterCatalog import (
+        FilterCatalog,
+        FilterCatalogEntry,
+        SmartsMatcher,
+    )
+except:
+    Utils.exception("You need to install rdkit and its dependencies.")
+
+# Substructures that are likely artifacts of the tautomerization process and
+# can't be easily corrected using fix_common_errors(). Used by
+# MyMol.remove_bizarre_substruc().
+#
+# Note that C(O)=N, C and N mean they are aliphatic. Does not match c(O)n,
+# when aromatic. So this form is acceptable if in aromatic structure.
+bizarre_substructs = [
+    "O(=*)-*",  # "C(O)=N",
+    "C(=[CH2])[OH]",  # Enol forms with terminal alkenes are unlikely.
+    "C(=[CH2])[O-]",  # Enol forms with terminal alkenes are unlikely.
+    "C=C([OH])[OH]",  # A geminal vinyl diol is not a tautomer of a carboxylate group.
+    "C=C([O-])[OH]",  # A geminal vinyl diol is not a tautomer of a carboxylate group.
+    "C=C([O-])[O-]",  # A geminal vinyl diol is not a tautomer of a carboxylate group.
+    "[C-]",  # No carbanions.
+    "[c-]",  # No carbanions.
+]
+
+# Substructures not permitted by the Durrant-lab filters (per substructure
+# matching, not substring matching). Used by
+# Steps.SMILES.DurrantLabFilter.durrant_lab_filters().
+durrant_lab_substructs = [
+    "C=[N-]",
+    "[N-]C=[N+]",
+    "[nH+]c[n-]",
+    "[#7+]~[#7+]",
+    "[#7-]~[#7-]",
+    "[!#7]~[#7+]~[#7-]~[!#7]",  # Doesn't hit azide.
+    # Vina can't process boron anyway...
+    "[#5]",  # B
+    "O=[PH](=O)([#8])([#8])",  # molvs does odd tautomer: OP(O)(O)=O => O=[PH](=O)(O)O
+    "[#7]=C1[#7]=C[#7]C=C1",  # Prevents an odd tautomer sometimes seen with adenine.
+    "N=c1cc[#7]c[#7]1",  # Variant of above
+    "[$([NX2H1]),$([NX3H2])]=C[$([OH]),$([O-])]"  # Terminal iminol
+]
+
+substruct_sets = {
+    "bizarre": bizarre_substructs,
+    "durrant_lab": durrant_lab_substructs,
+}
+
+# The compiled FilterCatalog of each set, made the first time the set is
+# used in this process.
+compiled_catalogs = {}
+
+
+def get_catalog(set_name):
+    """Gets the compiled FilterCatalog of a set of prohibited substructures,
+       compiling it if this is the first time it is used in this process.
+
+    :param set_name: The name of the set, a key of substruct_sets.
+    :type set_name: str
+    :return: The FilterCatalog. The description of each entry is its SMARTS
+       string.
+    :rtype: rdkit.Chem.FilterCatalog.FilterCatalog
+    """
+
+    if set_name in compiled_catalogs:
+        return compiled_catalogs[set_name]
+
+    catalog = FilterCatalog()
+    for smarts in substruct_sets[set_name]:
+        matcher = SmartsMatcher(smarts, smarts, 1)
+        if not matcher.IsValid():
+            Utils.exception("Invalid prohibited substructure: " + smarts)
+        catalog.AddEntry(FilterCatalogEntry(smarts, matcher))
+
+    compiled_catalogs[set_name] = catalog
+    return catalog
+
+
+def find_prohibited_substruct(rdkit_mol, set_name):
+    """Checks a molecule against every substructure of a set at once.
+
+    :param rdkit_mol: The molecule to check.
+    :type rdkit_mol: rdkit.Chem.rdchem.Mol
+    :param set_name: The name of the set, a key of substruct_sets.
+    :type set_name: str
+    :return: The SMARTS string of the first substructure of the set the
+       molecule contains, or None if it contains none of them.
+    :rtype: str | None
+    """
+
+    entry = get_catalog(set_name).GetFirstMatch(rdkit_mol)
+    if entry is None:
+        return None
+
+    return entry.GetDescription()
@@ -47,6 +47,10 @@ except:
 
 from gypsum_dl.MolContainer import MolContainer
 from gypsum_dl.Steps.SMILES.PrepareSmiles import prepare_smiles
+from gypsum_dl.Steps.SMILES.MakeTautomers import (
+    TAUTOMER_BACKENDS,
+    RDKIT_BACKEND_WARNING,
+)
 from gypsum_dl.Steps.ThreeD.PrepareThreeD import prepare_3d
 from gypsum_dl.Steps.IO.ProcessOutput import proccess_output
 from gypsum_dl.Steps.IO.LoadFiles import load_smiles_file
@@ -387,6 +391,8 @@ def set_parameters(params_unicode):
             "skip_enumerate_chiral_mol": False,
             "skip_enumerate_double_bonds": False,
             "let_tautomers_change_chirality": False,
+            "tautomer_backend": "molvs",
+            "fuse_smiles_steps": False,
             "use_durrant_lab_filters": False,
             "job_manager": "multiprocessing",
             "cache_prerun": False,
@@ -554,6 +560,17 @@ def finalize_params(params):
     # Make sure job_manager is always lower case.
     params["job_manager"] = params["job_manager"].lower()
 
+    # Make sure the tautomer backend is one we know.
+    params["tautomer_backend"] = params["tautomer_backend"].lower()
+    if params["tautomer_backend"] not in TAUTOMER_BACKENDS:
+        Utils.exception(
+            'The parameter "tautomer_backend" must be one of: '
+            + ", ".join(TAUTOMER_BACKENDS)
+            + "."
+        )
+    if params["tautomer_backend"] == "rdkit":
+        Utils.log(RDKIT_BACKEND_WARNING)
+
     return params
 
 
@@ -75,7 +75,10 @@ def save_to_sdf(contnrs, params, separate_output_files, output_folder):
                 Utils.slug(contnr.name),
                 contnr.contnr_idx_orig + 1,
             )
-            w = Chem.SDWriter(sdf_file)
+            # Write to a temporary name which is only replaced by sdf_file
+            # once the file is complete, so a run killed mid-write never
+            # leaves a partial sdf_file behind.
+            w = Chem.SDWriter(sdf_file + ".partial")
             # w = Chem.SDWriter(output_folder + os.sep + "output." + str(i + 1) + ".sdf")
 
         for m in contnr.mols:
@@ -85,6 +88,7 @@ def save_to_sdf(contnrs, params, separate_output_files, output_folder):
         if separate_output_files == True:
             w.flush()
             w.close()
+            os.replace(sdf_file + ".partial", sdf_file)
 
     if separate_output_files == False:
         w.flush()
@@ -25,7 +25,9 @@ import gypsum_dl.ChemUtils as ChemUtils
 import gypsum_dl.MyMol as MyMol
 import gypsum_dl.MolContainer as MolCont
 
-from gypsum_dl.Steps.SMILES.dimorphite_dl.dimorphite_dl import Protonate
+from gypsum_dl.Steps.SMILES.dimorphite_dl.dimorphite_dl import (
+    get_protonation_engine,
+)
 
 
 def add_hydrogens(
@@ -156,11 +158,17 @@ def parallel_add_H(contnr, protonation_settings):
         )
         Utils.exception("container.orig_smi_canonical: " + contnr.orig_smi_canonical)
 
-    # Add the SMILES string to the protonation parameters.
-    protonation_settings["smiles"] = contnr.orig_smi_canonical
-
-    # Protonate the SMILESstring. This is Dimorphite-DL.
-    smis = Protonate(protonation_settings)
+    # Protonate the SMILESstring. This is Dimorphite-DL. The engine, and its
+    # compiled protonation sites, are made once per process and reused for
+    # every container.
+    engine = get_protonation_engine(
+        protonation_settings["min_ph"],
+        protonation_settings["max_ph"],
+        protonation_settings["pka_precision"],
+    )
+    smis = engine.protonate(
+        contnr.orig_smi_canonical, protonation_settings["max_variants"]
+    )
 
     # Convert the protonated SMILES strings into a list of rdkit molecule
     # objects.
@@ -22,28 +22,12 @@ import __future__
 import gypsum_dl.Parallelizer as Parallelizer
 import gypsum_dl.Utils as Utils
 import gypsum_dl.ChemUtils as ChemUtils
-
-try:
-    from rdkit import Chem
-except:
-    Utils.exception("You need to install rdkit and its dependencies.")
+import gypsum_dl.ProhibitedSubstructs as ProhibitedSubstructs
 
 # Get the substructures you won't permit (per substructure matching, not
-# substring matching)
-prohibited_smi_substrs_for_substruc = [
-    "C=[N-]",
-    "[N-]C=[N+]",
-    "[nH+]c[n-]",
-    "[#7+]~[#7+]",
-    "[#7-]~[#7-]",
-    "[!#7]~[#7+]~[#7-]~[!#7]",  # Doesn't hit azide.
-    # Vina can't process boron anyway...
-    "[#5]",  # B
-    "O=[PH](=O)([#8])([#8])",  # molvs does odd tautomer: OP(O)(O)=O => O=[PH](=O)(O)O
-    "[#7]=C1[#7]=C[#7]C=C1",  # Prevents an odd tautomer sometimes seen with adenine.
-    "N=c1cc[#7]c[#7]1",  # Variant of above
-    "[$([NX2H1]),$([NX3H2])]=C[$([OH]),$([O-])]"  # Terminal iminol
-]
+# substring matching). These are compiled once per process, see
+# ProhibitedSubstructs.
+prohibited_smi_substrs_for_substruc = ProhibitedSubstructs.durrant_lab_substructs
 
 # Get the substrings you won't permit (per substring matching)
 prohibited_smi_substrs_for_substr = [
@@ -105,12 +89,9 @@ def durrant_lab_filters(contnrs, num_procs, job_manager, parallelizer_obj):
 
     Utils.log("Applying Durrant-lab filters to all molecules...")
 
-    prohibited_substructs = [
-        Chem.MolFromSmarts(s) for s in prohibited_smi_substrs_for_substruc
-    ]
-
-    # Get the parameters to pass to the parallelizer object.
-    params = [[c, prohibited_substructs] for c in contnrs]
+    # Get the parameters to pass to the parallelizer object. The prohibited
+    # substructures are compiled in each process, so they aren't passed.
+    params = [[c] for c in contnrs]
 
     # Run the tautomizer through the parallel object.
     tmp = []
@@ -120,7 +101,7 @@ def durrant_lab_filters(contnrs, num_procs, job_manager, parallelizer_obj):
         )
     else:
         for c in params:
-            tmp.append(parallel_durrant_lab_filter(c, prohibited_substructs))
+            tmp.append(parallel_durrant_lab_filter(c[0]))
 
     # Note that results is a list of containers.
 
@@ -147,14 +128,12 @@ def durrant_lab_filters(contnrs, num_procs, job_manager, parallelizer_obj):
     )
 
 
-def parallel_durrant_lab_filter(contnr, prohibited_substructs):
-    """A parallelizable helper function that checks that tautomers do not
-       break any nonaromatic rings present in the original object.
+def parallel_durrant_lab_filter(contnr):
+    """A parallelizable helper function that removes the molecules of a
+       container that contain prohibited substructures.
 
     :param contnr: The molecule container.
     :type contnr: MolContainer.MolContainer
-    :param prohibited_substructs: A list of the prohibited substructures.
-    :type prohibited_substructs: list
     :return: Either the container with bad molecules removed, or a None
       object.
     :rtype: MolContainer.MolContainer | None
@@ -162,25 +141,31 @@ def parallel_durrant_lab_filter(contnr, prohibited_substructs):
 
     # Replace any molecules that have prohibited substructure with None.
     for mi, m in enumerate(contnr.mols):
-        for pattrn in prohibited_substructs:
-            if durrant_lab_contains_bad_substr(
-                m.orig_smi_deslt
-            ) or m.rdkit_mol.HasSubstructMatch(pattrn):
-                Utils.log(
-                    "\t"
-                    + m.smiles(True)
-                    + ", a variant generated "
-                    + "from "
-                    + contnr.orig_smi
-                    + " ("
-                    + m.name
-                    + "), contains a prohibited substructure, so I'm "
-                    + "discarding it."
-                )
-
-                contnr.mols[mi] = None
+        if durrant_lab_contains_bad_substr(m.orig_smi_deslt):
+            substruct = None
+        else:
+            # One match against all the compiled substructures at once.
+            substruct = ProhibitedSubstructs.find_prohibited_substruct(
+                m.rdkit_mol, "durrant_lab"
+            )
+            if substruct is None:
                 continue
 
+        Utils.log(
+            "\t"
+            + m.smiles(True)
+            + ", a variant generated "
+            + "from "
+            + contnr.orig_smi
+            + " ("
+            + m.name
+            + "), contains a prohibited substructure"
+            + ("" if substruct is None else " (" + substruct + ")")
+            + ", so I'm discarding it."
+        )
+
+        contnr.mols[mi] = None
+
     # Now go back and remove those Nones
     contnr.mols = Parallelizer.strip_none(contnr.mols)
 
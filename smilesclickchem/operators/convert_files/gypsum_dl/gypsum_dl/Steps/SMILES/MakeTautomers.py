@@ -13,7 +13,8 @@
 # limitations under the License.
 
 """
-This module makes alternate tautomeric states, using MolVS.
+This module makes alternate tautomeric states, using MolVS or RDKit's C++
+port of the MolVS tautomer enumerator.
 """
 
 import __future__
@@ -36,6 +37,37 @@ try:
 except:
     Utils.exception("You need to install molvs and its dependencies.")
 
+try:
+    from rdkit.Chem.MolStandardize import rdMolStandardize
+except:
+    # Older versions of RDKit don't have rdMolStandardize. Only the molvs
+    # backend can be used.
+    rdMolStandardize = None
+
+# The backends which can enumerate tautomers. "molvs" uses the vendored
+# pure-Python MolVS TautomerEnumerator. "rdkit" uses
+# rdMolStandardize.TautomerEnumerator with the same (v1) MolVS transforms, and
+# checks the aromatic rings and chiral centers of each tautomer in the same
+# pass.
+TAUTOMER_BACKENDS = ["molvs", "rdkit"]
+
+# The "rdkit" backend is not a drop-in replacement for "molvs". This is
+# logged whenever it is selected.
+RDKIT_BACKEND_WARNING = (
+    'WARNING: The "rdkit" tautomer backend does not give the same tautomers '
+    + 'as the default "molvs" backend. It does not make tautomers which move '
+    + "a hydrogen off of a charged atom, it keeps the stereochemistry of "
+    + "double bonds not involved in the tautomerization (which molvs drops), "
+    + "and it may keep a different subset of tautomers when there are more "
+    + "than max_variants_per_compound. Use molvs for results which match "
+    + "Gypsum-DL's reference output."
+)
+
+# The RDKit TautomerEnumerators already made in this process. Keys are the
+# max number of tautomers. Making an enumerator parses all of its transforms,
+# so each is only made once.
+RDKIT_TAUTOMER_ENUMERATORS = {}
+
 
 def make_tauts(
     contnrs,
@@ -45,6 +77,7 @@ def make_tauts(
     job_manager,
     let_tautomers_change_chirality,
     parallelizer_obj,
+    tautomer_backend="molvs",
 ):
     """Generates tautomers of the molecules. Note that some of the generated
     tautomers are not realistic. If you find a certain improbable
@@ -75,6 +108,9 @@ def make_tauts(
     :type job_manager: string
     :param parallelizer_obj: The Parallelizer object.
     :type parallelizer_obj: Parallelizer.Parallelizer
+    :param tautomer_backend: The backend which enumerates the tautomers,
+       either "molvs" or "rdkit". Defaults to "molvs".
+    :type tautomer_backend: string, optional
     """
 
     # No need to proceed if there are no max variants.
@@ -83,6 +119,69 @@ def make_tauts(
 
     Utils.log("Generating tautomers for all molecules...")
 
+    taut_data = enumerate_tauts(
+        contnrs,
+        max_variants_per_compound,
+        num_procs,
+        job_manager,
+        let_tautomers_change_chirality,
+        parallelizer_obj,
+        tautomer_backend,
+    )
+
+    # Keep only the top few compound variants in each container, to prevent a
+    # combinatorial explosion.
+    ChemUtils.bst_for_each_contnr_no_opt(
+        contnrs, taut_data, max_variants_per_compound, thoroughness
+    )
+
+
+def enumerate_tauts(
+    contnrs,
+    max_variants_per_compound,
+    num_procs,
+    job_manager,
+    let_tautomers_change_chirality,
+    parallelizer_obj,
+    tautomer_backend="molvs",
+):
+    """Generates the tautomers of the molecules and removes the bad ones,
+       using the chosen backend. Unlike make_tauts, this does not trim the
+       containers to the best few variants.
+
+    :param contnrs: A list of containers (MolContainer.MolContainer).
+    :type contnrs: A list.
+    :param max_variants_per_compound: To control the combinatorial explosion,
+       only this number of variants (molecules) will be advanced to the next
+       step.
+    :type max_variants_per_compound: int
+    :param num_procs: The number of processors to use.
+    :type num_procs: int
+    :param job_manager: The multithred mode to use.
+    :type job_manager: string
+    :param let_tautomers_change_chirality: Whether to allow tautomers that
+      change the total number of chiral centers.
+    :type let_tautomers_change_chirality: bool
+    :param parallelizer_obj: The Parallelizer object.
+    :type parallelizer_obj: Parallelizer.Parallelizer
+    :param tautomer_backend: The backend which enumerates the tautomers,
+       either "molvs" or "rdkit". Defaults to "molvs".
+    :type tautomer_backend: string, optional
+    :return: A list of MyMol.MyMol objects, containing the alternate
+        tautomeric forms.
+    :rtype: list
+    """
+
+    if tautomer_backend == "rdkit":
+        return make_tauts_rdkit(
+            contnrs,
+            max_variants_per_compound,
+            num_procs,
+            job_manager,
+            let_tautomers_change_chirality,
+            parallelizer_obj,
+        )
+
     # Create the parameters to feed into the parallelizer object.
     params = []
     for contnr in contnrs:
@@ -116,11 +215,7 @@ def make_tauts(
     #    contnrs, taut_data, num_procs, job_manager, parallelizer_obj
     # )
 
-    # Keep only the top few compound variants in each container, to prevent a
-    # combinatorial explosion.
-    ChemUtils.bst_for_each_contnr_no_opt(
-        contnrs, taut_data, max_variants_per_compound, thoroughness
-    )
+    return taut_data
 
 
 def parallel_make_taut(contnr, mol_index, max_variants_per_compound):
@@ -200,6 +295,188 @@ def parallel_make_taut(contnr, mol_index, max_variants_per_compound):
     return results
 
 
+def make_tauts_rdkit(
+    contnrs,
+    max_variants_per_compound,
+    num_procs,
+    job_manager,
+    let_tautomers_change_chirality,
+    parallelizer_obj,
+):
+    """Generates tautomers of the molecules using RDKit's
+       rdMolStandardize.TautomerEnumerator. Tautomers that break an aromatic
+       ring or (optionally) change the number of chiral centers are removed in
+       the same pass, so only one parallel run is needed.
+
+    :param contnrs: A list of containers (MolContainer.MolContainer).
+    :type contnrs: A list.
+    :param max_variants_per_compound: To control the combinatorial explosion,
+       only this number of variants (molecules) will be advanced to the next
+       step.
+    :type max_variants_per_compound: int
+    :param num_procs: The number of processors to use.
+    :type num_procs: int
+    :param job_manager: The multithred mode to use.
+    :type job_manager: string
+    :param let_tautomers_change_chirality: Whether to allow tautomers that
+      change the total number of chiral centers.
+    :type let_tautomers_change_chirality: bool
+    :param parallelizer_obj: The Parallelizer object.
+    :type parallelizer_obj: Parallelizer.Parallelizer
+    :return: A list of MyMol.MyMol objects, containing the alternate
+        tautomeric forms.
+    :rtype: list
+    """
+
+    if rdMolStandardize is None:
+        Utils.exception(
+            "The rdkit tautomer backend requires a version of RDKit with "
+            + "rdMolStandardize. Please update RDKit or use the molvs backend."
+        )
+
+    # Create the parameters to feed into the parallelizer object.
+    params = []
+    for contnr in contnrs:
+        for mol_index, mol in enumerate(contnr.mols):
+            params.append(
+                tuple(
+                    [
+                        contnr,
+                        mol_index,
+                        max_variants_per_compound,
+                        let_tautomers_change_chirality,
+                    ]
+                )
+            )
+    params = tuple(params)
+
+    # Run the tautomizer through the parallel object.
+    tmp = []
+    if parallelizer_obj != None:
+        tmp = parallelizer_obj.run(
+            params, parallel_make_taut_rdkit, num_procs, job_manager
+        )
+    else:
+        for i in params:
+            tmp.append(parallel_make_taut_rdkit(i[0], i[1], i[2], i[3]))
+
+    # Flatten the resulting list of lists.
+    return Parallelizer.flatten_list(Parallelizer.strip_none(tmp))
+
+
+def get_rdkit_tautomer_enumerator(max_tautomers):
+    """Gets the RDKit TautomerEnumerator of this process that stops at a
+       given number of tautomers, making it if needed.
+
+    :param max_tautomers: The max number of tautomers to enumerate.
+    :type max_tautomers: int
+    :return: The enumerator.
+    :rtype: rdMolStandardize.TautomerEnumerator
+    """
+
+    if max_tautomers not in RDKIT_TAUTOMER_ENUMERATORS:
+        # The v1 transforms are the MolVS transforms.
+        enum = rdMolStandardize.GetV1TautomerEnumerator()
+        enum.SetMaxTautomers(max_tautomers)
+
+        # MolVS keeps the chiral tags (tauts_no_elim_chiral deals with
+        # those), and only clears the stereo of double bonds which move.
+        enum.SetRemoveSp3Stereo(False)
+        enum.SetRemoveBondStereo(True)
+        enum.SetReassignStereo(True)
+
+        RDKIT_TAUTOMER_ENUMERATORS[max_tautomers] = enum
+
+    return RDKIT_TAUTOMER_ENUMERATORS[max_tautomers]
+
+
+def parallel_make_taut_rdkit(
+    contnr, mol_index, max_variants_per_compound, let_tautomers_change_chirality
+):
+    """Makes alternate tautomers for a given molecule container using RDKit,
+       and removes those that break an aromatic ring or (optionally) change
+       the number of chiral centers. This is the function that gets fed into
+       the parallelizer.
+
+    :param contnr: The molecule container.
+    :type contnr: MolContainer.MolContainer
+    :param mol_index: The molecule index.
+    :type mol_index: int
+    :param max_variants_per_compound: To control the combinatorial explosion,
+       only this number of variants (molecules) will be advanced to the next
+       step.
+    :type max_variants_per_compound: int
+    :param let_tautomers_change_chirality: Whether to allow tautomers that
+      change the total number of chiral centers.
+    :type let_tautomers_change_chirality: bool
+    :return: A list of MyMol.MyMol objects, containing the alternate
+        tautomeric forms.
+    :rtype: list
+    """
+
+    # Get the MyMol.MyMol within the molecule container corresponding to the
+    # given molecule index.
+    mol = contnr.mols[mol_index]
+
+    # Create a temporary RDKit mol object, prepared exactly as for MolVS.
+    m = MyMol.MyMol(mol.smiles()).rdkit_mol
+
+    # For tautomers to work, you need to not have any explicit hydrogens.
+    m = Chem.RemoveHs(m)
+
+    # Make sure it's not None.
+    if m is None:
+        Utils.log(
+            "\tCould not generate tautomers for "
+            + contnr.orig_smi
+            + ". I'm deleting it."
+        )
+        return []
+
+    Chem.Kekulize(m)
+    m = MOH.check_sanitization(m)
+    if m is None:
+        return []
+
+    enum = get_rdkit_tautomer_enumerator(max_variants_per_compound)
+    tauts_rdkit_mols = list(enum.Enumerate(m))
+
+    # Make all those tautomers into MyMol objects.
+    tauts_mols = [MyMol.MyMol(m) for m in tauts_rdkit_mols]
+
+    # Keep only those that have reasonable substructures.
+    tauts_mols = [t for t in tauts_mols if t.remove_bizarre_substruc() == False]
+
+    # If there's more than one, let the user know that.
+    if len(tauts_mols) > 1:
+        Utils.log("\t" + mol.smiles(True) + " has tautomers.")
+
+    # Now collect the final results.
+    results = []
+
+    for tm in tauts_mols:
+        tm.inherit_contnr_props(contnr)
+        tm.genealogy = mol.genealogy[:]
+        tm.name = mol.name
+
+        if tm.smiles() != mol.smiles():
+            tm.genealogy.append(tm.smiles(True) + " (tautomer)")
+
+        # Remove bad tautomers.
+        if parallel_check_nonarom_rings(tm, contnr) is None:
+            continue
+
+        if (
+            not let_tautomers_change_chirality
+            and parallel_check_chiral_centers(tm, contnr) is None
+        ):
+            continue
+
+        results.append(tm)
+
+    return results
+
+
 def tauts_no_break_arom_rngs(
     contnrs, taut_data, num_procs, job_manager, parallelizer_obj
 ):
@@ -34,12 +34,24 @@ from gypsum_dl.Steps.SMILES.EnumerateDoubleBonds import enumerate_double_bonds
 def prepare_smiles(contnrs, params):
     """Runs the appropriate steps for processing the SMILES strings.
 
+    If the fuse_smiles_steps parameter is set, each container is instead
+    taken through every step by a single parallel job (see
+    prepare_smiles_fused).
+
     :param contnrs: A list of containers (MolContainer.MolContainer).
     :type contnrs: list
     :param params: The user parameters.
     :type params: dict
     """
 
+    if (
+        params["fuse_smiles_steps"]
+        and params["Parallelizer"] != None
+        and params["job_manager"] != "serial"
+    ):
+        prepare_smiles_fused(contnrs, params)
+        return
+
     # Unpack some of the parameter values.
     min_ph = params["min_ph"]
     max_ph = params["max_ph"]
@@ -103,6 +115,7 @@ def prepare_smiles(contnrs, params):
             job_manager,
             let_tautomers_change_chirality,
             parallelizer_obj,
+            params["tautomer_backend"],
         )
         # Utils.log("Done with Tautomerization")
     else:
@@ -159,6 +172,73 @@ def prepare_smiles(contnrs, params):
         Utils.print_current_smiles(contnrs)
 
 
+def prepare_smiles_fused(contnrs, params):
+    """Runs the SMILES steps with one parallel job per container. Each job
+    takes its container through desalting, ionization, tautomers, the
+    Durrant-lab filters and the chiral and double-bond enumeration, keeping
+    the best variants after each step as usual. Containers are only sent to
+    the workers and back once, rather than once per step, and a slow
+    molecule no longer holds up every other molecule at each step.
+
+    :param contnrs: A list of containers (MolContainer.MolContainer). They
+       are replaced in place by the processed containers.
+    :type contnrs: list
+    :param params: The user parameters.
+    :type params: dict
+    """
+
+    Utils.log("Preparing the SMILES of each molecule in a single job.")
+
+    # Each job runs the steps in serial. The Parallelizer object itself
+    # can't be sent to the workers.
+    job_params = {}
+    for key in params:
+        if key != "Parallelizer":
+            job_params[key] = params[key]
+    job_params["Parallelizer"] = None
+    job_params["fuse_smiles_steps"] = False
+    job_params["num_processors"] = 1
+    job_params["job_manager"] = "serial"
+
+    inputs = tuple([tuple([contnr, job_params]) for contnr in contnrs])
+
+    results = params["Parallelizer"].run(
+        inputs, parallel_prepare_smiles, params["num_processors"], params["job_manager"]
+    )
+
+    # Put the processed containers in place of the originals. Keep an
+    # original if its job failed, so it is reported as a failed molecule.
+    for idx in range(0, len(contnrs)):
+        if results[idx] != None:
+            contnrs[idx] = results[idx]
+
+
+def parallel_prepare_smiles(contnr, job_params):
+    """Takes a single container through all of the SMILES steps. This is the
+       function that gets fed into the parallelizer by prepare_smiles_fused.
+
+    :param contnr: The molecule container.
+    :type contnr: MolContainer.MolContainer
+    :param job_params: The user parameters, set to run each step in serial.
+    :type job_params: dict
+    :return: The processed container.
+    :rtype: MolContainer.MolContainer
+    """
+
+    # The steps look up containers by their position in the list, so the
+    # container is given index 0 while it is processed alone.
+    contnr_idx = contnr.contnr_idx
+    contnr.update_idx(0)
+
+    prepare_smiles([contnr], job_params)
+
+    contnr.update_idx(contnr_idx)
+    for mol in contnr.mols:
+        mol.contnr_idx = contnr_idx
+
+    return contnr
+
+
 def wrap_molecules(contnrs):
     """Each molecule container holds only one SMILES string
     (corresponding to the input structure). Dimorphite-DL can potentially
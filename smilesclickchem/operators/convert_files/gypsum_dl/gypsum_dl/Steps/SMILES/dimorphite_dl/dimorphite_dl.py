@@ -22,6 +22,7 @@ import copy
 import os
 import argparse
 import sys
+from collections import OrderedDict
 
 try:
     # Python2
@@ -403,6 +404,37 @@ class UtilFuncs:
         # cautious.
         return None if mol is None else mol
 
+    @staticmethod
+    def standardize_smiles_str(smiles_str):
+        """Converts a SMILES string to the neutralized canonical form that
+        Dimorphite-DL protonates.
+
+        :param string smiles_str: The SMILES string.
+        :return: The standardized SMILES string, or None if the SMILES string
+            is poorly formed.
+        """
+
+        mol = UtilFuncs.convert_smiles_str_to_mol(smiles_str)
+        if mol is None:
+            return None
+
+        # Handle nuetralizing the molecules. Filter if failed.
+        mol = UtilFuncs.neutralize_mol(mol)
+        if mol is None:
+            return None
+
+        # Remove the hydrogens.
+        try:
+            mol = Chem.RemoveHs(mol)
+        except:
+            return None
+
+        if mol is None:
+            return None
+
+        # Regenerate the smiles string (to standardize).
+        return Chem.MolToSmiles(mol, isomericSmiles=True)
+
     @staticmethod
     def eprint(*args, **kwargs):
         """Error messages should be printed to STDERR. See
@@ -478,43 +510,14 @@ class LoadSMIFile(object):
             # Convert from SMILES string to RDKIT Mol. This series of tests is
             # to make sure the SMILES string is properly formed and to get it
             # into a canonical form. Filter if failed.
-            mol = UtilFuncs.convert_smiles_str_to_mol(smiles_str)
-            if mol is None:
-                if "silent" in self.args and not self.args["silent"]:
-                    UtilFuncs.eprint(
-                        "WARNING: Skipping poorly formed SMILES string: " + line
-                    )
-                return self.next()
-
-            # Handle nuetralizing the molecules. Filter if failed.
-            mol = UtilFuncs.neutralize_mol(mol)
-            if mol is None:
-                if "silent" in self.args and not self.args["silent"]:
-                    UtilFuncs.eprint(
-                        "WARNING: Skipping poorly formed SMILES string: " + line
-                    )
-                return self.next()
-
-            # Remove the hydrogens.
-            try:
-                mol = Chem.RemoveHs(mol)
-            except:
+            new_mol_string = UtilFuncs.standardize_smiles_str(smiles_str)
+            if new_mol_string is None:
                 if "silent" in self.args and not self.args["silent"]:
                     UtilFuncs.eprint(
                         "WARNING: Skipping poorly formed SMILES string: " + line
                     )
                 return self.next()
 
-            if mol is None:
-                if "silent" in self.args and not self.args["silent"]:
-                    UtilFuncs.eprint(
-                        "WARNING: Skipping poorly formed SMILES string: " + line
-                    )
-                return self.next()
-
-            # Regenerate the smiles string (to standardize).
-            new_mol_string = Chem.MolToSmiles(mol, isomericSmiles=True)
-
             return {"smiles": new_mol_string, "data": splits[1:]}
         else:
             # Blank line? Go to next one.
@@ -598,11 +601,6 @@ class Protonate(object):
         # protonation process, etc.
         orig_smi = smile_and_datum["smiles"]
 
-        # Dimorphite-DL may protonate some sites in ways that produce invalid
-        # SMILES. We need to keep track of all smiles so we can "rewind" to
-        # the last valid one, should things go south.
-        properly_formed_smi_found = [orig_smi]
-
         # Everything on SMILES line but the SMILES string itself (e.g., the
         # molecule name).
         data = smile_and_datum["data"]
@@ -611,78 +609,11 @@ class Protonate(object):
         # name).
         tag = " ".join(data)
 
-        # sites is a list of (atom index, "PROTONATED|DEPROTONATED|BOTH",
-        # reaction name, mol). Note that the second entry indicates what state
-        # the site SHOULD be in (not the one it IS in per the SMILES string).
-        # It's calculated based on the probablistic distributions obtained
-        # during training.
-        (
-            sites,
-            mol_used_to_idx_sites,
-        ) = ProtSubstructFuncs.get_prot_sites_and_target_states(orig_smi, self.subs)
-
-        new_mols = [mol_used_to_idx_sites]
-        if len(sites) > 0:
-            for site in sites:
-                # Make a new smiles with the correct protonation state. Note that
-                # new_smis is a growing list. This is how multiple protonation
-                # sites are handled.
-                new_mols = ProtSubstructFuncs.protonate_site(new_mols, site)
-                if len(new_mols) > self.args["max_variants"]:
-                    new_mols = new_mols[: self.args["max_variants"]]
-                    if "silent" in self.args and not self.args["silent"]:
-                        UtilFuncs.eprint(
-                            "WARNING: Limited number of variants to "
-                            + str(self.args["max_variants"])
-                            + ": "
-                            + orig_smi
-                        )
-
-                # Go through each of these new molecules and add them to the
-                # properly_formed_smi_found, in case you generate a poorly
-                # formed SMILES in the future and have to "rewind."
-                properly_formed_smi_found += [Chem.MolToSmiles(m) for m in new_mols]
-        else:
-            # Deprotonate the mols (because protonate_site never called to do
-            # it).
-            mol_used_to_idx_sites = Chem.RemoveHs(mol_used_to_idx_sites)
-            new_mols = [mol_used_to_idx_sites]
-
-            # Go through each of these new molecules and add them to the
-            # properly_formed_smi_found, in case you generate a poorly formed
-            # SMILES in the future and have to "rewind."
-            properly_formed_smi_found.append(Chem.MolToSmiles(mol_used_to_idx_sites))
-
-        # In some cases, the script might generate redundant molecules.
-        # Phosphonates, when the pH is between the two pKa values and the
-        # stdev value is big enough, for example, will generate two identical
-        # BOTH states. Let's remove this redundancy.
-        new_smis = list(
-            set(
-                [
-                    Chem.MolToSmiles(m, isomericSmiles=True, canonical=True)
-                    for m in new_mols
-                ]
-            )
+        # Protonate the sites of this smiles string.
+        new_smis, sites = ProtSubstructFuncs.protonate_smi(
+            orig_smi, self.subs, self.args
         )
 
-        # Sometimes Dimorphite-DL generates molecules that aren't actually
-        # possible. Simply convert these to mol objects to eliminate the bad
-        # ones (that are None).
-        new_smis = [
-            s for s in new_smis if UtilFuncs.convert_smiles_str_to_mol(s) is not None
-        ]
-
-        # If there are no smi left, return the input one at the very least.
-        # All generated forms have apparently been judged
-        # inappropriate/malformed.
-        if len(new_smis) == 0:
-            properly_formed_smi_found.reverse()
-            for smi in properly_formed_smi_found:
-                if UtilFuncs.convert_smiles_str_to_mol(smi) is not None:
-                    new_smis = [smi]
-                    break
-
         # If the user wants to see the target states, add those to the ends of
         # each line.
         if self.args["label_states"]:
@@ -696,6 +627,115 @@ class Protonate(object):
         return self.next()
 
 
+class ProtonationEngine(object):
+    """Protonates SMILES strings at a single pH range, reusing the compiled
+    protonation-site substructures for every SMILES string. Unlike Protonate,
+    which reads and compiles the substructures each time it is made, an engine
+    is meant to be made once per process (see get_protonation_engine) and
+    kept.
+
+    The protonation states of recently protonated SMILES strings are also
+    kept, in a least-recently-used memo, so a SMILES string seen again is not
+    protonated again."""
+
+    def __init__(self, min_ph=6.4, max_ph=8.4, pka_precision=1.0, memo_size=10000):
+        """Initialize the engine.
+
+        :param float min_ph: The lower bound on the pH range, defaults to 6.4.
+        :param float max_ph: The upper bound on the pH range, defaults to 8.4.
+        :param float pka_precision: The pKa precision factor (number of
+            standard devations), defaults to 1.0.
+        :param int memo_size: The max number of SMILES strings whose
+            protonation states are kept, defaults to 10000. 0 keeps none.
+        """
+
+        self.min_ph = min_ph
+        self.max_ph = max_ph
+        self.pka_precision = pka_precision
+        self.memo_size = memo_size
+
+        # Load the substructures that can be protonated.
+        self.subs = ProtSubstructFuncs.load_protonation_substructs_calc_state_for_ph(
+            min_ph, max_ph, pka_precision
+        )
+
+        # Keys are (SMILES string, max_variants) and items are tuples of the
+        # protonated SMILES strings.
+        self.memo = OrderedDict()
+
+    def protonate(self, smiles_str, max_variants=128):
+        """Protonates a single SMILES string.
+
+        :param string smiles_str: The SMILES string. Canonical SMILES strings
+            make the best use of the memo.
+        :param int max_variants: Limit the number of variants, defaults to
+            128.
+        :return: A list of the protonated SMILES strings. Empty if the SMILES
+            string is poorly formed.
+        """
+
+        key = (smiles_str, max_variants)
+        if key in self.memo:
+            self.memo.move_to_end(key)
+            return list(self.memo[key])
+
+        new_smis = []
+        orig_smi = UtilFuncs.standardize_smiles_str(smiles_str)
+        if orig_smi is not None:
+            args = {"max_variants": max_variants, "silent": True}
+
+            # Make sure functions in ProtSubstructFuncs have access to the
+            # args.
+            ProtSubstructFuncs.args = args
+
+            new_smis, sites = ProtSubstructFuncs.protonate_smi(
+                orig_smi, self.subs, args
+            )
+
+        if self.memo_size > 0:
+            self.memo[key] = tuple(new_smis)
+            while len(self.memo) > self.memo_size:
+                self.memo.popitem(last=False)
+
+        return list(new_smis)
+
+    def protonate_many(self, smiles_strs, max_variants=128):
+        """Protonates a list of SMILES strings.
+
+        :param list smiles_strs: A list of SMILES strings.
+        :param int max_variants: Limit the number of variants per SMILES
+            string, defaults to 128.
+        :return: A list with the list of protonated SMILES strings of each
+            input SMILES string, in the same order.
+        """
+
+        return [self.protonate(smi, max_variants) for smi in smiles_strs]
+
+
+# The ProtonationEngines made in this process. Keys are (min_ph, max_ph,
+# pka_precision).
+PROTONATION_ENGINES = {}
+
+
+def get_protonation_engine(min_ph=6.4, max_ph=8.4, pka_precision=1.0):
+    """Gets the ProtonationEngine of this process for a pH range, making it
+    the first time the pH range is used.
+
+    :param float min_ph: The lower bound on the pH range, defaults to 6.4.
+    :param float max_ph: The upper bound on the pH range, defaults to 8.4.
+    :param float pka_precision: The pKa precision factor (number of standard
+        devations), defaults to 1.0.
+    :return: The ProtonationEngine.
+    :rtype: ProtonationEngine
+    """
+
+    key = (float(min_ph), float(max_ph), float(pka_precision))
+    if key not in PROTONATION_ENGINES:
+        PROTONATION_ENGINES[key] = ProtonationEngine(*key)
+
+    return PROTONATION_ENGINES[key]
+
+
 class ProtSubstructFuncs:
     """A namespace to store functions for loading the substructures that can
     be protonated. To keep things organized."""
@@ -850,6 +890,98 @@ class ProtSubstructFuncs:
 
         return protonation_sites, mol_used_to_idx_sites
 
+    @staticmethod
+    def protonate_smi(orig_smi, subs, args):
+        """Makes the protonation states of a single standardized SMILES string.
+
+        :param string orig_smi: The SMILES string, as standardized by
+            UtilFuncs.standardize_smiles_str.
+        :param list subs: Substructure information.
+        :param dict args: A dictionary containing the arguments. Only
+            "max_variants" and "silent" are used.
+        :return: A list of the protonated SMILES strings, and the list of
+            protonation sites.
+        """
+
+        # Dimorphite-DL may protonate some sites in ways that produce invalid
+        # SMILES. We need to keep track of all smiles so we can "rewind" to
+        # the last valid one, should things go south.
+        properly_formed_smi_found = [orig_smi]
+
+        # sites is a list of (atom index, "PROTONATED|DEPROTONATED|BOTH",
+        # reaction name, mol). Note that the second entry indicates what state
+        # the site SHOULD be in (not the one it IS in per the SMILES string).
+        # It's calculated based on the probablistic distributions obtained
+        # during training.
+        (
+            sites,
+            mol_used_to_idx_sites,
+        ) = ProtSubstructFuncs.get_prot_sites_and_target_states(orig_smi, subs)
+
+        new_mols = [mol_used_to_idx_sites]
+        if len(sites) > 0:
+            for site in sites:
+                # Make a new smiles with the correct protonation state. Note that
+                # new_smis is a growing list. This is how multiple protonation
+                # sites are handled.
+                new_mols = ProtSubstructFuncs.protonate_site(new_mols, site)
+                if len(new_mols) > args["max_variants"]:
+                    new_mols = new_mols[: args["max_variants"]]
+                    if "silent" in args and not args["silent"]:
+                        UtilFuncs.eprint(
+                            "WARNING: Limited number of variants to "
+                            + str(args["max_variants"])
+                            + ": "
+                            + orig_smi
+                        )
+
+                # Go through each of these new molecules and add them to the
+                # properly_formed_smi_found, in case you generate a poorly
+                # formed SMILES in the future and have to "rewind."
+                properly_formed_smi_found += [Chem.MolToSmiles(m) for m in new_mols]
+        else:
+            # Deprotonate the mols (because protonate_site never called to do
+            # it).
+            mol_used_to_idx_sites = Chem.RemoveHs(mol_used_to_idx_sites)
+            new_mols = [mol_used_to_idx_sites]
+
+            # Go through each of these new molecules and add them to the
+            # properly_formed_smi_found, in case you generate a poorly formed
+            # SMILES in the future and have to "rewind."
+            properly_formed_smi_found.append(Chem.MolToSmiles(mol_used_to_idx_sites))
+
+        # In some cases, the script might generate redundant molecules.
+        # Phosphonates, when the pH is between the two pKa values and the
+        # stdev value is big enough, for example, will generate two identical
+        # BOTH states. Let's remove this redundancy.
+        new_smis = list(
+            set(
+                [
+                    Chem.MolToSmiles(m, isomericSmiles=True, canonical=True)
+                    for m in new_mols
+                ]
+            )
+        )
+
+        # Sometimes Dimorphite-DL generates molecules that aren't actually
+        # possible. Simply convert these to mol objects to eliminate the bad
+        # ones (that are None).
+        new_smis = [
+            s for s in new_smis if UtilFuncs.convert_smiles_str_to_mol(s) is not None
+        ]
+
+        # If there are no smi left, return the input one at the very least.
+        # All generated forms have apparently been judged
+        # inappropriate/malformed.
+        if len(new_smis) == 0:
+            properly_formed_smi_found.reverse()
+            for smi in properly_formed_smi_found:
+                if UtilFuncs.convert_smiles_str_to_mol(smi) is not None:
+                    new_smis = [smi]
+                    break
+
+        return new_smis, sites
+
     @staticmethod
     def protonate_site(mols, site):
         """Given a list of molecule objects, we protonate the site.
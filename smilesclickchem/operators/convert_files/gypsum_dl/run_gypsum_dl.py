@@ -277,6 +277,27 @@ PARSER.add_argument(
                     further explanation).",
 )
 
+PARSER.add_argument(
+    "--tautomer_backend",
+    type=str,
+    default=None,
+    choices=["molvs", "rdkit"],
+    help="The backend which enumerates tautomers. molvs (the default) uses \
+                    the bundled MolVS TautomerEnumerator. rdkit uses RDKit's \
+                    faster C++ port of the same transforms, but is NOT \
+                    equivalent: it gives different tautomers for some \
+                    molecules (see README.md for further explanation).",
+)
+PARSER.add_argument(
+    "--fuse_smiles_steps",
+    action="store_true",
+    help="Take each molecule through all of the SMILES steps (desalting, \
+                    ionization, tautomers, filters and chiral and \
+                    double-bond enumeration) in a single parallel job, \
+                    rather than running each step across all molecules in \
+                    turn (see README.md for further explanation).",
+)
+
 PARSER.add_argument(
     "--use_durrant_lab_filters",
     action="store_true",
@@ -0,0 +1,263 @@
+"""ProcessSupervisor Class
+
+Runs jobs in killable worker processes with a wall-clock deadline per job.
+"""
+import __future__
+
+import time
+import traceback
+import multiprocessing
+from multiprocessing.connection import wait
+
+# How often in seconds the supervisor checks for jobs past their deadline
+DEADLINE_POLL_INTERVAL = 0.2
+
+# Status of a job which finished, raised an Exception, or was killed
+JOB_COMPLETED = "completed"
+JOB_ERROR = "error"
+JOB_TIMEOUT = "timeout"
+
+# Status of the message sent by report_progress()
+JOB_PROGRESS = "progress"
+
+# The connection of this process to its supervisor, if it is a worker of a
+# ProcessSupervisor. Used by report_progress()
+WORKER_CONNECTION = None
+
+
+class ProcessSupervisor(object):
+    """
+    This class runs jobs in a set of worker processes and enforces a
+    wall-clock deadline for each job.
+
+    A thread-based timeout (ie func_timeout) can not interrupt a job which is
+    stuck within C++ code, such as an RDKit conformer search, so the stuck job
+    keeps holding a core. Here a job which passes its deadline has its whole
+    worker process killed and a new worker is started in its place.
+
+    Each worker has its own pipe to the supervisor, so killing a worker
+    mid-message can not corrupt the results of the other workers.
+
+    A job made of several steps (ie a batch of ligands) can call
+    report_progress() at the start of each step. The deadline then applies
+    to each step rather than to the whole job.
+    """
+
+    def __init__(self, num_procs):
+        """
+        init for ProcessSupervisor. Worker processes are started lazily when
+        jobs are run.
+
+        Inputs:
+        :param int num_procs: the number of worker processes
+        """
+        self.num_procs = max(1, num_procs)
+
+        # List of [process, connection] for every worker
+        self.workers = []
+
+        # Number of workers which had to be killed
+        self.num_workers_killed = 0
+
+    def start_worker(self):
+        """
+        Start a new worker process.
+
+        Returns:
+        :returns: list worker: [process, connection] of the new worker
+        """
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=supervised_worker, args=(child_conn,)
+        )
+        process.daemon = True
+        process.start()
+        child_conn.close()
+
+        return [process, parent_conn]
+
+    def kill_worker(self, worker):
+        """
+        Kill a worker process.
+
+        Inputs:
+        :param list worker: [process, connection] of the worker
+        """
+        process, conn = worker
+        if process.is_alive():
+            process.terminate()
+            process.join(1)
+        if process.is_alive():
+            process.kill()
+            process.join(1)
+        conn.close()
+
+    def run(self, func, list_of_args, list_of_time_limits):
+        """
+        Run func once for every tuple of arguments in list_of_args.
+
+        Inputs:
+        :param func func: a module-level function to run
+        :param list list_of_args: a list of tuples of arguments for func
+        :param list list_of_time_limits: the wall-clock deadline in seconds
+            for each job. If the job calls report_progress() this is instead
+            the deadline for each step, counted from the last call.
+
+        Returns:
+        :returns: list results: a list with one entry per job in the order of
+            list_of_args. Each entry is a tuple of (status, result, run_time).
+            status is JOB_COMPLETED, JOB_ERROR or JOB_TIMEOUT. result is the
+            output of func if it completed and the traceback if it raised an
+            Exception. If it was killed result is a tuple of (the info of its
+            last report_progress() call or None, the run time of the step
+            which passed the deadline).
+        """
+        num_jobs = len(list_of_args)
+        results = [None for i in range(num_jobs)]
+        if num_jobs == 0:
+            return results
+
+        while len(self.workers) < min(self.num_procs, num_jobs):
+            self.workers.append(self.start_worker())
+
+        next_job = 0
+        num_finished = 0
+
+        # Keys are worker indexes and items are [job index, start time, start
+        # time of the current step, info of the current step] of the job the
+        # worker is running
+        running = {}
+
+        while num_finished < num_jobs:
+            # Hand jobs to idle workers
+            for worker_idx in range(len(self.workers)):
+                if next_job == num_jobs:
+                    break
+                if worker_idx in running:
+                    continue
+                self.workers[worker_idx][1].send(
+                    (func, list_of_args[next_job])
+                )
+                start_time = time.time()
+                running[worker_idx] = [next_job, start_time, start_time, None]
+                next_job = next_job + 1
+
+            # Collect the results of finished jobs
+            conns = [self.workers[worker_idx][1] for worker_idx in running]
+            ready_conns = wait(conns, DEADLINE_POLL_INTERVAL)
+            for worker_idx in list(running.keys()):
+                worker = self.workers[worker_idx]
+                if worker[1] not in ready_conns:
+                    continue
+
+                worker_died = False
+                try:
+                    status, result = worker[1].recv()
+                except (EOFError, OSError):
+                    # The worker died without sending a result
+                    status = JOB_ERROR
+                    result = "The worker process exited unexpectedly"
+                    worker_died = True
+
+                if status == JOB_PROGRESS:
+                    # The job started a new step, so its deadline restarts
+                    running[worker_idx][2] = time.time()
+                    running[worker_idx][3] = result
+                    continue
+
+                job_idx, start_time, step_start_time, step_info = running.pop(
+                    worker_idx
+                )
+
+                # The new worker is started outside the except block so the
+                # forked process doesn't inherit the exception being handled
+                if worker_died is True:
+                    self.kill_worker(worker)
+                    self.workers[worker_idx] = self.start_worker()
+
+                results[job_idx] = (status, result, time.time() - start_time)
+                num_finished = num_finished + 1
+
+            # Kill the workers of any jobs past their deadline
+            current_time = time.time()
+            for worker_idx in list(running.keys()):
+                job_idx, start_time, step_start_time, step_info = running[worker_idx]
+                step_run_time = current_time - step_start_time
+                if step_run_time < list_of_time_limits[job_idx]:
+                    continue
+
+                del running[worker_idx]
+                self.kill_worker(self.workers[worker_idx])
+                self.workers[worker_idx] = self.start_worker()
+                self.num_workers_killed = self.num_workers_killed + 1
+
+                results[job_idx] = (
+                    JOB_TIMEOUT,
+                    (step_info, step_run_time),
+                    current_time - start_time,
+                )
+                num_finished = num_finished + 1
+
+        return results
+
+    def end(self):
+        """
+        Stop all worker processes.
+        """
+        for worker in self.workers:
+            process, conn = worker
+            try:
+                conn.send(None)
+            except (EOFError, OSError):
+                pass
+        for worker in self.workers:
+            worker[0].join(5)
+            self.kill_worker(worker)
+        self.workers = []
+
+
+def supervised_worker(conn):
+    """
+    The loop run by each worker process of a ProcessSupervisor. It runs jobs
+    sent through conn until it is sent None.
+
+    Inputs:
+    :param multiprocessing.connection.Connection conn: the worker's end of
+        the pipe to the supervisor
+    """
+    global WORKER_CONNECTION
+    WORKER_CONNECTION = conn
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+
+        func, args = job
+        try:
+            message = (JOB_COMPLETED, func(*args))
+        except:
+            message = (JOB_ERROR, traceback.format_exc())
+
+        conn.send(message)
+
+    conn.close()
+
+
+def report_progress(info):
+    """
+    Tell the supervisor that the job run by this worker has started a new
+    step, so the job's deadline restarts. This does nothing if this process
+    is not a worker of a ProcessSupervisor.
+
+    Inputs:
+    :param python_obj info: a picklable description of the step. If the job
+        is killed this is returned as part of its result.
+    """
+    if WORKER_CONNECTION is None:
+        return
+
+    WORKER_CONNECTION.send((JOB_PROGRESS, info))
@@ -0,0 +1,384 @@
+"""SDFShardWriter and SDFShardReader Classes
+
+Stores the 3D poses of a run in a few large multi-record .sdf files (shards)
+with an index, rather than one file per ligand and one file per pose.
+
+The index is a tab-separated file with one line per pose:
+    pose_name   shard   byte_offset   length   SMILES
+ie) Gen_1_Mutant_7_63__2    shard_00001.sdf    48213    6021    CCC[NH3+]
+
+The pose names match the names the PDB files would have had
+(ie Gen_1_Mutant_7_63__2.pdb) and the SMILES is the SMILES of the pose
+without hydrogens, as in the header of a PDB file.
+"""
+import __future__
+
+import os
+
+import rdkit
+import rdkit.Chem as Chem
+
+# Disable the unnecessary RDKit warnings
+rdkit.RDLogger.DisableLog("rdApp.*")
+
+# Name of the folder within a Run folder which holds the shards
+SDF_SHARD_FOLDERNAME = "3D_SDF_Shards"
+
+# Name of the index file within the shard folder
+SDF_SHARD_INDEX_FILENAME = "shard_index.tsv"
+
+
+class SDFShardWriter(object):
+    """
+    This class appends the poses of ligands to the shards of a shard folder
+    and records them in its index.
+
+    A new shard is started once the current shard holds
+    max_ligands_per_shard ligands. If the shard folder already has shards
+    (ie from an earlier streaming chunk or before a run was resumed) the
+    writer continues from the last shard, and poses which are already in the
+    index are not added again.
+
+    The shard data is flushed before the index lines which point to it are
+    written, so an interrupted run never leaves index lines pointing past
+    the end of a shard.
+    """
+
+    def __init__(self, shard_folder, max_ligands_per_shard):
+        """
+        init for SDFShardWriter. The shard folder is made if it does not
+        exist.
+
+        Inputs:
+        :param str shard_folder: the path to the shard folder
+        :param int max_ligands_per_shard: the max number of ligands per shard
+        """
+        if shard_folder[-1] != os.sep:
+            shard_folder = shard_folder + os.sep
+        if os.path.exists(shard_folder) is False:
+            os.makedirs(shard_folder)
+
+        self.shard_folder = shard_folder
+        self.index_file = shard_folder + SDF_SHARD_INDEX_FILENAME
+        self.max_ligands_per_shard = max_ligands_per_shard
+
+        self.pose_names = set([])
+
+        # Keys are shard names and items are the set of ligands in the shard
+        self.ligands_by_shard = {}
+
+        for pose_name, shard, _, _, _ in read_shard_index(self.index_file):
+            self.pose_names.add(pose_name)
+            if shard not in self.ligands_by_shard:
+                self.ligands_by_shard[shard] = set([])
+            self.ligands_by_shard[shard].add(get_ligand_name_of_pose(pose_name))
+
+        self.current_shard = None
+        if len(self.ligands_by_shard) != 0:
+            self.current_shard = sorted(self.ligands_by_shard.keys())[-1]
+
+        self.shard_handle = None
+        self.unwritten_index_lines = []
+
+    def open_shard(self):
+        """
+        Open the current shard for appending, starting a new shard if there
+        is no current shard or it is full.
+        """
+        if self.current_shard is not None:
+            num_ligands = len(self.ligands_by_shard[self.current_shard])
+            if num_ligands < self.max_ligands_per_shard:
+                if self.shard_handle is None:
+                    self.shard_handle = open(
+                        self.shard_folder + self.current_shard, "ab"
+                    )
+                return
+
+        self.flush()
+        if self.shard_handle is not None:
+            self.shard_handle.close()
+
+        self.current_shard = "shard_{:05d}.sdf".format(len(self.ligands_by_shard) + 1)
+        self.ligands_by_shard[self.current_shard] = set([])
+        self.shard_handle = open(self.shard_folder + self.current_shard, "ab")
+
+    def add_ligand(self, pose_records):
+        """
+        Add the poses of a ligand to the current shard.
+
+        Inputs:
+        :param list pose_records: a list of [SMILES, pose name, sdf text] for
+            each pose of the ligand. The sdf text is a single .sdf record
+            ending in $$$$
+        """
+        pose_records = [x for x in pose_records if x[1] not in self.pose_names]
+        if len(pose_records) == 0:
+            return
+
+        self.open_shard()
+        ligand_name = get_ligand_name_of_pose(pose_records[0][1])
+        self.ligands_by_shard[self.current_shard].add(ligand_name)
+
+        for smiles, pose_name, sdf_text in pose_records:
+            sdf_bytes = sdf_text.encode("utf-8")
+            offset = self.shard_handle.tell()
+            self.shard_handle.write(sdf_bytes)
+            self.unwritten_index_lines.append(
+                "\t".join(
+                    [pose_name, self.current_shard, str(offset),
+                     str(len(sdf_bytes)), smiles]
+                )
+            )
+            self.pose_names.add(pose_name)
+
+    def flush(self):
+        """
+        Flush the current shard to disk, then write the index lines of the
+        poses added since the last flush.
+        """
+        if self.shard_handle is not None:
+            self.shard_handle.flush()
+            os.fsync(self.shard_handle.fileno())
+
+        if len(self.unwritten_index_lines) == 0:
+            return
+
+        with open(self.index_file, "a") as f:
+            for line in self.unwritten_index_lines:
+                f.write(line + "\n")
+        self.unwritten_index_lines = []
+
+    def close(self):
+        """
+        Flush and close the current shard.
+        """
+        self.flush()
+        if self.shard_handle is not None:
+            self.shard_handle.close()
+            self.shard_handle = None
+
+
+class SDFShardReader(object):
+    """
+    This class gives random access to the poses in a shard folder. Only the
+    index is read when the reader is made. The .sdf record of a pose is read
+    from its shard when it is requested.
+
+    ie)
+        shard_reader = SDFShardReader("Run_0/3D_SDF_Shards/")
+        for ligand_name in shard_reader.get_ligand_names():
+            for pose_name in shard_reader.get_pose_names(ligand_name):
+                mol = shard_reader.get_pose_mol(pose_name)
+        shard_reader.close()
+    """
+
+    def __init__(self, shard_folder):
+        """
+        init for SDFShardReader.
+
+        Inputs:
+        :param str shard_folder: the path to the shard folder
+        """
+        if shard_folder[-1] != os.sep:
+            shard_folder = shard_folder + os.sep
+
+        self.shard_folder = shard_folder
+
+        # Keys are pose names and items are (shard, offset, length, SMILES)
+        self.index = {}
+
+        # Keys are ligand names and items are the names of their poses
+        self.poses_by_ligand = {}
+
+        index_file = shard_folder + SDF_SHARD_INDEX_FILENAME
+        for pose_name, shard, offset, length, smiles in read_shard_index(index_file):
+            if pose_name in self.index:
+                continue
+            self.index[pose_name] = (shard, offset, length, smiles)
+            ligand_name = get_ligand_name_of_pose(pose_name)
+            if ligand_name not in self.poses_by_ligand:
+                self.poses_by_ligand[ligand_name] = []
+            self.poses_by_ligand[ligand_name].append(pose_name)
+
+        # Open file handles of the shards. Keys are shard names.
+        self.shard_handles = {}
+
+    def __len__(self):
+        """
+        Returns:
+        :returns: int num_poses: the number of poses in the index
+        """
+        return len(self.index)
+
+    def has_ligand(self, ligand_name):
+        """
+        Inputs:
+        :param str ligand_name: the short name of a ligand
+            ie) Gen_1_Mutant_7_63
+
+        Returns:
+        :returns: bool bool: True if the ligand has poses in the shards
+        """
+        return ligand_name in self.poses_by_ligand
+
+    def get_ligand_names(self):
+        """
+        Returns:
+        :returns: list ligand_names: the short names of every ligand in the
+            shards in the order they were added
+        """
+        return list(self.poses_by_ligand.keys())
+
+    def get_pose_names(self, ligand_name=None):
+        """
+        Inputs:
+        :param str ligand_name: the short name of a ligand. If None the
+            poses of every ligand are returned.
+
+        Returns:
+        :returns: list pose_names: the names of the poses
+            ie) ["Gen_1_Mutant_7_63__1", "Gen_1_Mutant_7_63__2"]
+        """
+        if ligand_name is None:
+            return list(self.index.keys())
+
+        return list(self.poses_by_ligand.get(ligand_name, []))
+
+    def get_pose_records(self, ligand_name):
+        """
+        Inputs:
+        :param str ligand_name: the short name of a ligand
+
+        Returns:
+        :returns: list pose_records: a list of [SMILES, pose name] for each
+            pose of the ligand
+        """
+        return [
+            [self.index[pose_name][3], pose_name]
+            for pose_name in self.get_pose_names(ligand_name)
+        ]
+
+    def get_pose_sdf_text(self, pose_name):
+        """
+        Read the .sdf record of a pose from its shard.
+
+        Inputs:
+        :param str pose_name: the name of the pose ie) Gen_1_Mutant_7_63__2
+
+        Returns:
+        :returns: str sdf_text: the .sdf record of the pose
+        """
+        if pose_name not in self.index:
+            printout = "The pose {} is not in the shard index of {}".format(
+                pose_name, self.shard_folder
+            )
+            raise Exception(printout)
+
+        shard, offset, length, _ = self.index[pose_name]
+        if shard not in self.shard_handles:
+            self.shard_handles[shard] = open(self.shard_folder + shard, "rb")
+
+        shard_handle = self.shard_handles[shard]
+        shard_handle.seek(offset)
+        return shard_handle.read(length).decode("utf-8")
+
+    def get_pose_mol(self, pose_name, sanitize=True):
+        """
+        Read a pose from its shard as an rdkit mol. Hydrogens are kept.
+
+        Inputs:
+        :param str pose_name: the name of the pose
+        :param bool sanitize: if True the mol is sanitized
+
+        Returns:
+        :returns: rdkit.Chem.rdchem.Mol mol: the mol of the pose or None if
+            rdkit could not read it
+        """
+        supplier = Chem.SDMolSupplier()
+        supplier.SetData(
+            self.get_pose_sdf_text(pose_name), sanitize=sanitize, removeHs=False
+        )
+        return next(supplier, None)
+
+    def get_ligand_mols(self, ligand_name, sanitize=True):
+        """
+        Inputs:
+        :param str ligand_name: the short name of a ligand
+        :param bool sanitize: if True the mols are sanitized
+
+        Returns:
+        :returns: list mols: the rdkit mols of every pose of the ligand
+        """
+        return [
+            self.get_pose_mol(pose_name, sanitize)
+            for pose_name in self.get_pose_names(ligand_name)
+        ]
+
+    def get_pose_pdb_block(self, pose_name):
+        """
+        Make the PDB of a pose, with the same SMILES header as the PDB files
+        written when the run does not use shards.
+
+        Inputs:
+        :param str pose_name: the name of the pose
+
+        Returns:
+        :returns: str pdb_block: the text of the PDB or None if rdkit could
+            not read the pose
+        """
+        mol = self.get_pose_mol(pose_name)
+        if mol is None:
+            return None
+
+        pdb_block = "REMARK Final SMILES string: {}\n".format(self.index[pose_name][3])
+        return pdb_block + Chem.MolToPDBBlock(mol, flavor=32)
+
+    def close(self):
+        """
+        Close any open shards.
+        """
+        for shard_handle in self.shard_handles.values():
+            shard_handle.close()
+        self.shard_handles = {}
+
+
+def read_shard_index(index_file):
+    """
+    Read the lines of a shard index. An incomplete last line, as left by a
+    run killed mid-write, is skipped.
+
+    Inputs:
+    :param str index_file: the path to the index file
+
+    Returns:
+    :returns: list index_entries: a list of (pose name, shard, offset,
+        length, SMILES) for every pose in the index
+    """
+    index_entries = []
+    if os.path.exists(index_file) is False:
+        return index_entries
+
+    with open(index_file) as f:
+        for line in f:
+            if line[-1:] != "\n":
+                continue
+            parts = line[:-1].split("\t")
+            if len(parts) != 5:
+                continue
+            index_entries.append(
+                (parts[0], parts[1], int(parts[2]), int(parts[3]), parts[4])
+            )
+
+    return index_entries
+
+
+def get_ligand_name_of_pose(pose_name):
+    """
+    Inputs:
+    :param str pose_name: the name of a pose ie) Gen_1_Mutant_7_63__2
+
+    Returns:
+    :returns: str ligand_name: the short name of its ligand
+        ie) Gen_1_Mutant_7_63
+    """
+    return pose_name.rsplit("__", 1)[0]
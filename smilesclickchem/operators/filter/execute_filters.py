@@ -3,8 +3,6 @@ Top level for running filters.
 """
 import __future__
 
-import copy
-
 import rdkit
 from rdkit import Chem
 from rdkit.Chem.MolStandardize import rdMolStandardize
@@ -14,10 +12,25 @@ rdkit.RDLogger.DisableLog("rdApp.*")
 
 from smilesclickchem.operators.filter.filter_classes.parent_filter_class import ParentFilter
 from smilesclickchem.operators.filter.filter_classes.get_child_filter_class import get_all_subclasses
+from smilesclickchem.operators.filter.filter_classes.substructure_engine import (
+    get_substructure_filter_engine,
+)
+from smilesclickchem.operators.filter.filter_scheduler import (
+    SANITIZATION_FAILURE_REASON,
+    get_filter_scheduler,
+)
+from smilesclickchem.operators.filter.filter_cache import (
+    get_filter_cache,
+    get_filter_signature,
+)
 
 import smilesclickchem.operators.convert_files.gypsum_dl.gypsum_dl.MolObjectHandling as MOH
 from smilesclickchem.operators.filter.filter_classes.filter_children_classes import *
 
+# The max number of ligands filtered per job. Each job computes the
+# descriptors of its ligands as a single batch.
+FILTER_BATCH_SIZE = 1000
+
 
 def make_run_class_dict(filters_to_use):
     """
@@ -71,40 +84,132 @@ def run_filter(vars, list_of_new_ligands):
     # Get the already generated dictionary of filter objects
     filter_object_dict = vars["filter_object_dict"]
 
+    # Split the ligands into batches. Use at least one batch per processor
+    # so the work is spread across all of them.
+    num_procs = max(1, vars["parallelizer"].num_procs)
+    batch_size = -(-len(list_of_new_ligands) // num_procs)
+    batch_size = max(1, min(FILTER_BATCH_SIZE, batch_size))
+
     # make a list of tuples for multi-processing Filter
     job_input = []
-    for smiles_info in list_of_new_ligands:
-        temp_tuple = tuple([smiles_info, filter_object_dict])
-        job_input.append(temp_tuple)
+    for batch_start in range(0, len(list_of_new_ligands), batch_size):
+        batch = list_of_new_ligands[batch_start: batch_start + batch_size]
+        job_input.append(tuple([batch, filter_object_dict]))
     job_input = tuple(job_input)
 
-    results = vars["parallelizer"].run(job_input, run_filter_mol)
+    results = vars["parallelizer"].run(job_input, run_filter_on_batch)
 
     # remove mols which fail the filter
-    ligands_which_passed_filter = [x for x in results if x is not None]
+    ligands_which_passed_filter = [
+        x for batch_results in results if batch_results is not None
+        for x in batch_results if x is not None
+    ]
 
     return ligands_which_passed_filter
 
 
-def run_filter_mol(smiles_info, child_dict):
+def run_filter_on_batch(list_of_smiles_info, child_dict):
     """
-    This takes a smiles_string and the selected filter list (child_dict) and
-    runs it through the selected filters.
+    This takes a batch of ligands and the selected filter list (child_dict)
+    and runs them through the selected filters. The descriptors of the whole
+    batch are computed together.
+
+    If this process has a FilterCache, ligands already in the cache are not
+    filtered again, and the results of the others are added to it. Ligands
+    are looked up by their canonical SMILES.
 
     Inputs:
-    :param list smiles_info: A list with info about a ligand, the SMILES string
-        is idx=0 and the name/ID is idx=1. example: smiles_info
-        ["CCCCCCC","zinc123"]
+    :param list list_of_smiles_info: A list of lists with info about a
+        ligand, the SMILES string is idx=0 and the name/ID is idx=1. example:
+        [["CCCCCCC","zinc123"], ["CCCCCCCC","zinc1234"]]
     :param dict child_dict: This dictionary contains all the names of the
         chosen filters as keys and the the filter objects as the items Or None if
         User specifies no filters
 
     Returns:
-    :returns: list smiles_info: list of the smiles_info if it passed the filter.
-        returns None If the mol fails a filter.
+    :returns: list results: a list with the smiles_info of every ligand
+        which passed the filters and None for every ligand which failed, in
+        the order of list_of_smiles_info.
     """
 
-    smiles_string = smiles_info[0]
+    if child_dict is None:
+        return [
+            smiles_info if prepare_mol_for_filters(smiles_info[0]) is not None
+            else None
+            for smiles_info in list_of_smiles_info
+        ]
+
+    filter_cache = get_filter_cache()
+    if filter_cache is None:
+        list_of_mols = [
+            prepare_mol_for_filters(smiles_info[0])
+            for smiles_info in list_of_smiles_info
+        ]
+        passed = run_all_selected_filters_on_batch(list_of_mols, child_dict)
+        return [
+            smiles_info if passed_filter else None
+            for smiles_info, passed_filter in zip(list_of_smiles_info, passed)
+        ]
+
+    signature = get_filter_signature(child_dict, True)
+    canonical_smiles_list = [
+        get_canonical_smiles(smiles_info[0]) for smiles_info in list_of_smiles_info
+    ]
+
+    passed = [None for smiles_info in list_of_smiles_info]
+    uncached_indices = []
+    for i, canonical_smiles in enumerate(canonical_smiles_list):
+        result = filter_cache.get(canonical_smiles, signature)
+        if result is None:
+            uncached_indices.append(i)
+        else:
+            passed[i] = result[0]
+
+    list_of_mols = [
+        prepare_mol_for_filters(list_of_smiles_info[i][0]) for i in uncached_indices
+    ]
+    list_of_reasons = get_filter_failure_reasons_on_batch(list_of_mols, child_dict)
+    for i, reasons in zip(uncached_indices, list_of_reasons):
+        passed[i] = len(reasons) == 0
+        filter_cache.put(canonical_smiles_list[i], signature, passed[i], reasons)
+
+    return [
+        smiles_info if passed_filter else None
+        for smiles_info, passed_filter in zip(list_of_smiles_info, passed)
+    ]
+
+
+def get_canonical_smiles(smiles_string):
+    """
+    Get the canonical isomeric SMILES of a SMILES string.
+
+    Inputs:
+    :param str smiles_string: a SMILES string
+
+    Returns:
+    :returns: str canonical_smiles: the canonical SMILES or smiles_string if
+        rdkit could not read it
+    """
+
+    mol = Chem.MolFromSmiles(smiles_string)
+    if mol is None:
+        return smiles_string
+
+    return Chem.MolToSmiles(mol, isomericSmiles=True)
+
+
+def prepare_mol_for_filters(smiles_string):
+    """
+    Make the mol of a SMILES string which is tested by the filters. The mol
+    is sanitized, deprotanated and uncharged.
+
+    Inputs:
+    :param str smiles_string: a SMILES string
+
+    Returns:
+    :returns: rdkit.Chem.rdchem.Mol object mol: the mol or None if it failed
+        to sanitize
+    """
 
     mol = Chem.MolFromSmiles(smiles_string, sanitize=False)
     # try sanitizing, which is necessary later
@@ -126,6 +231,29 @@ def run_filter_mol(smiles_info, child_dict):
     # This is done because logP is traditionally applied to neutral molecules
     uncharger_obj = rdMolStandardize.Uncharger()
     mol = uncharger_obj.uncharge(mol)
+
+    return mol
+
+
+def run_filter_mol(smiles_info, child_dict):
+    """
+    This takes a smiles_string and the selected filter list (child_dict) and
+    runs it through the selected filters.
+
+    Inputs:
+    :param list smiles_info: A list with info about a ligand, the SMILES string
+        is idx=0 and the name/ID is idx=1. example: smiles_info
+        ["CCCCCCC","zinc123"]
+    :param dict child_dict: This dictionary contains all the names of the
+        chosen filters as keys and the the filter objects as the items Or None if
+        User specifies no filters
+
+    Returns:
+    :returns: list smiles_info: list of the smiles_info if it passed the filter.
+        returns None If the mol fails a filter.
+    """
+
+    mol = prepare_mol_for_filters(smiles_info[0])
     if mol is None:
         return None
 
@@ -143,43 +271,71 @@ def run_filter_mol(smiles_info, child_dict):
     return smiles_info
 
 
-def run_filter_on_just_smiles(smile_string, child_dict):
+def run_filter_on_just_smiles(smile_string, child_dict, mol=None):
     """
     This takes a smiles_string and the selected filter list (child_dict) and
     runs it through the selected filters.
 
+    If this process has a FilterCache, the result is looked up in the cache
+    before the filters are run, and is added to it after. smile_string is
+    used as the key so it should be canonical, as the SMILES strings of the
+    products of SmilesClickChem are.
+
     Inputs:
     :param str smile_string: A smiles_string. example: smiles_info
         ["CCCCCCC","zinc123"]
     :param dict child_dict: This dictionary contains all the names of the
         chosen filters as keys and the the filter objects as the items Or None if
         User specifies no filters
+    :param rdkit.Chem.rdchem.Mol object mol: the sanitized and deprotanated
+        mol of smile_string. If it is given the filters are run on it directly
+        rather than on a mol parsed from smile_string. This is optional.
 
     Returns:
     :returns: str smile_string: smile_string if it passed the filter. returns
         False If the mol fails a filter.
     """
 
-    mol = Chem.MolFromSmiles(smile_string, sanitize=False)
-    # try sanitizing, which is necessary later
-    mol = MOH.check_sanitization(mol)
-    if mol is None:
-        return False
-
-    mol = MOH.try_deprotanation(mol)
-    if mol is None:
-        return False
-
+    filter_cache = None
     if child_dict is not None:
+        filter_cache = get_filter_cache()
+
+    if filter_cache is not None:
+        signature = get_filter_signature(child_dict, False)
+        result = filter_cache.get(smile_string, signature)
+        if result is not None:
+            if result[0] is False:
+                return False
+            return smile_string
+
+    if mol is not None:
+        if child_dict is None:
+            return smile_string
+        # run through the filters. The mol is already sanitized.
+        reasons = get_filter_failure_reasons_on_batch([mol], child_dict)[0]
+    else:
+        mol = Chem.MolFromSmiles(smile_string, sanitize=False)
+        # try sanitizing, which is necessary later
+        mol = MOH.check_sanitization(mol)
+        if mol is not None:
+            mol = MOH.try_deprotanation(mol)
+
+        if child_dict is None:
+            if mol is None:
+                return False
+            # return the smile string
+            return smile_string
+
         # run through the filters
-        filter_result = run_all_selected_filters(mol, child_dict)
+        reasons = get_filter_failure_reasons(mol, child_dict)
 
-        # see if passed
-        if filter_result is False:
-            return False
-        # it passed return the smiles_info
-        return smile_string
-    # return the smile string
+    if filter_cache is not None:
+        filter_cache.put(smile_string, signature, len(reasons) == 0, reasons)
+
+    # see if passed
+    if len(reasons) != 0:
+        return False
+    # it passed return the smiles_info
     return smile_string
 
 
@@ -200,18 +356,100 @@ def run_all_selected_filters(mol, child_dict):
         fails any filters.
     """
 
-    filters_failed = 0
+    return len(get_filter_failure_reasons(mol, child_dict)) == 0
+
+
+def get_filter_failure_reasons(mol, child_dict):
+    """
+    Run a single mol through all of the filters specified by the user and
+    find why it failed.
+
+    Inputs:
+    :param rdkit.Chem.rdchem.Mol object mol: An rdkit mol object to be tested
+        if it passes the filters. It may be None, in which case it fails.
+    :param dict child_dict: This dictionary contains all the names of the
+        chosen filters as keys and the the filter objects as the items
+
+    Returns:
+    :returns: list reasons: a list of str describing each filter the mol was
+        found to fail. Empty if the mol passed all the filters.
+    """
+
     mol = MOH.check_sanitization(mol)
     if mol is None:
-        return False
+        return [SANITIZATION_FAILURE_REASON]
+
+    return get_filter_failure_reasons_on_batch([mol], child_dict)[0]
+
+
+def run_all_selected_filters_on_batch(list_of_mols, child_dict):
+    """
+    Run a batch of mols through all of the filters specified by the user.
+
+    Inputs:
+    :param list list_of_mols: a list of rdkit mols. A mol may be None, in
+        which case it fails.
+    :param dict child_dict: This dictionary contains all the names of the
+        chosen filters as keys and the the filter objects as the items
+
+    Returns:
+    :returns: list passed: a list of bools. True for every mol which passes
+        all the filters.
+    """
+
+    return [
+        len(reasons) == 0
+        for reasons in get_filter_failure_reasons_on_batch(list_of_mols, child_dict)
+    ]
+
+
+def get_filter_failure_reasons_on_batch(list_of_mols, child_dict):
+    """
+    Run a batch of mols through all of the filters specified by the user and
+    find why each mol failed.
+
+    The filters are run by the FilterScheduler of this process, which runs
+    the cheapest and most selective checks first and stops for each mol at
+    the first check it fails. See filter_scheduler.FilterScheduler.
+
+    Inputs:
+    :param list list_of_mols: a list of rdkit mols. A mol may be None, in
+        which case it fails.
+    :param dict child_dict: This dictionary contains all the names of the
+        chosen filters as keys and the the filter objects as the items
+
+    Returns:
+    :returns: list list_of_reasons: a list with a list of reasons for every
+        mol. A mol which failed has a single reason describing the filter it
+        failed ie) ["LipinskiStrictFilter"] or
+        ["BRENK: Oxygen-nitrogen_single_bond"]. The list is empty if the mol
+        passed all the filters.
+    """
+
+    return get_filter_scheduler(child_dict).run_filters(list_of_mols)
+
+
+def get_substructure_alerts(mol, child_dict):
+    """
+    Find which alerts of the chosen substructure filters (ie PAINS, BRENK)
+    match a mol. This is used to report why a mol failed the filters.
+
+    Inputs:
+    :param rdkit.Chem.rdchem.Mol object mol: An rdkit mol object
+    :param dict child_dict: This dictionary contains all the names of the
+        chosen filters as keys and the the filter objects as the items
+
+    Returns:
+    :returns: list alerts: a list of [filter set, description] of every alert
+        which matches the mol ie) [["PAINS_A", "ene_six_het_A(483)"]]
+    """
+
+    filter_catalog_names = []
     for child in list(child_dict.keys()):
-        mol_copy = copy.deepcopy(mol)
-        filter_function = child_dict[child].run_filter
-        if filter_function(mol_copy) is False:
-            filters_failed = filters_failed + 1
+        if child_dict[child].is_substructure_filter():
+            filter_catalog_names.extend(child_dict[child].filter_catalogs)
 
-    if filters_failed == 0:
-        return True
+    if len(filter_catalog_names) == 0:
+        return []
 
-    # failed one or more filters
-    return False
+    return get_substructure_filter_engine(filter_catalog_names).get_alerts(mol)
@@ -0,0 +1,347 @@
+"""FilterCache Class
+
+A bounded LRU cache of filter results, with an optional on-disk store which
+can be shared between runs.
+"""
+import __future__
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import multiprocessing.util
+from collections import OrderedDict
+
+# Change this whenever a change to the filters would change their results,
+# so entries made by older versions are no longer used.
+FILTER_CACHE_VERSION = 1
+
+# Number of new results held in memory before they are written to the
+# on-disk store
+FILTER_CACHE_FLUSH_INTERVAL = 5000
+
+# Fraction of the max number of entries the on-disk store is reduced to when
+# it is over its max. Evicting a little extra means eviction doesn't run on
+# every flush.
+FILTER_CACHE_EVICT_TO_FRACTION = 0.9
+
+# The FilterCache of this process. It is installed in the main process and
+# in every worker by install_filter_cache. None if there is no cache.
+FILTER_CACHE = None
+
+# The pid of the process which registered flush_filter_cache to run when it
+# exits. A forked worker registers its own.
+FILTER_CACHE_FINALIZER_PID = None
+
+# Signatures already made in this process. Keys are tuples of the filter
+# names and whether the mol was uncharged.
+FILTER_SIGNATURES = {}
+
+
+class FilterCache(object):
+    """
+    This class caches whether a ligand passed a set of filters and, if not,
+    why. Entries are keyed by the canonical SMILES of the ligand plus a
+    signature of the set of filters, so results for one set of filters are
+    never used for another.
+
+    The most recently used max_entries results are held in memory. If a
+    cache_file is given, results are also stored in a SQLite file, which is
+    checked on a miss in memory. New results are written to the file in
+    groups. The least recently used entries in the file are evicted once it
+    holds more than max_disk_entries.
+
+    Each process has its own FilterCache and its own connection to the
+    file. The connection is opened lazily so a cache copied into a forked
+    worker opens a new connection.
+    """
+
+    def __init__(self, max_entries, cache_file=None, max_disk_entries=None):
+        """
+        init for FilterCache.
+
+        Inputs:
+        :param int max_entries: the max number of results held in memory
+        :param str cache_file: the path to the SQLite file of the on-disk
+            store or None for no on-disk store
+        :param int max_disk_entries: the max number of results kept in the
+            on-disk store
+        """
+        self.max_entries = max_entries
+        self.cache_file = cache_file
+        self.max_disk_entries = max_disk_entries
+
+        # Keys are cache keys and items are (passed, reasons)
+        self.results = OrderedDict()
+
+        # Results not yet written to the on-disk store
+        self.unwritten_results = {}
+
+        self.connection = None
+        self.connection_pid = None
+
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def get_connection(self):
+        """
+        Get this process's connection to the on-disk store, opening it if
+        needed.
+
+        Returns:
+        :returns: sqlite3.Connection connection: the connection or None if
+            there is no on-disk store
+        """
+        if self.cache_file is None:
+            return None
+
+        if self.connection is not None and self.connection_pid == os.getpid():
+            return self.connection
+
+        if self.connection is not None:
+            # A connection inherited from the parent process is never used.
+            # The parent writes its own unwritten results.
+            self.unwritten_results = {}
+
+        self.connection = sqlite3.connect(self.cache_file, timeout=60)
+        self.connection_pid = os.getpid()
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS filter_results ("
+            + "key TEXT PRIMARY KEY, "
+            + "passed INTEGER NOT NULL, "
+            + "reasons TEXT NOT NULL, "
+            + "last_used REAL NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS filter_results_last_used "
+            + "ON filter_results (last_used)"
+        )
+        self.connection.commit()
+
+        return self.connection
+
+    def get_key(self, smiles_string, signature):
+        """
+        Make the cache key of a ligand.
+
+        Inputs:
+        :param str smiles_string: the canonical SMILES string of the ligand
+        :param str signature: the signature of the set of filters
+
+        Returns:
+        :returns: str key: the cache key
+        """
+        return signature + "\t" + smiles_string
+
+    def get(self, smiles_string, signature):
+        """
+        Look up the filter result of a ligand.
+
+        Inputs:
+        :param str smiles_string: the canonical SMILES string of the ligand
+        :param str signature: the signature of the set of filters
+
+        Returns:
+        :returns: tuple result: (passed, reasons) or None if the ligand is not
+            in the cache. passed is a bool and reasons is a list of str
+            describing each filter the ligand failed.
+        """
+        key = self.get_key(smiles_string, signature)
+        if key in self.results:
+            self.results.move_to_end(key)
+            self.num_hits = self.num_hits + 1
+            return self.results[key]
+
+        result = None
+        connection = self.get_connection()
+        if connection is not None:
+            disk_key = hashlib.sha256(key.encode("utf-8")).hexdigest()
+            row = connection.execute(
+                "SELECT passed, reasons FROM filter_results WHERE key = ?",
+                (disk_key,),
+            ).fetchone()
+            if row is not None:
+                result = (bool(row[0]), json.loads(row[1]))
+                self.add_to_memory(key, result)
+
+                # Rewriting the entry updates when it was last used
+                self.unwritten_results[key] = result
+
+        if result is None:
+            self.num_misses = self.num_misses + 1
+        else:
+            self.num_hits = self.num_hits + 1
+
+        return result
+
+    def put(self, smiles_string, signature, passed, reasons):
+        """
+        Add the filter result of a ligand to the cache.
+
+        Inputs:
+        :param str smiles_string: the canonical SMILES string of the ligand
+        :param str signature: the signature of the set of filters
+        :param bool passed: True if the ligand passed every filter
+        :param list reasons: a list of str describing each filter the ligand
+            failed
+        """
+        key = self.get_key(smiles_string, signature)
+        result = (passed, list(reasons))
+        self.add_to_memory(key, result)
+
+        if self.cache_file is None:
+            return
+
+        self.unwritten_results[key] = result
+        if len(self.unwritten_results) >= FILTER_CACHE_FLUSH_INTERVAL:
+            self.flush()
+
+    def add_to_memory(self, key, result):
+        """
+        Add a result to the in-memory LRU, evicting the least recently used
+        result if it is full.
+
+        Inputs:
+        :param str key: the cache key
+        :param tuple result: (passed, reasons)
+        """
+        self.results[key] = result
+        self.results.move_to_end(key)
+        while len(self.results) > self.max_entries:
+            self.results.popitem(last=False)
+
+    def flush(self):
+        """
+        Write the new results to the on-disk store, then evict the least
+        recently used entries if it holds more than max_disk_entries.
+        """
+        connection = self.get_connection()
+        if connection is None or len(self.unwritten_results) == 0:
+            return
+
+        current_time = time.time()
+        rows = [
+            (
+                hashlib.sha256(key.encode("utf-8")).hexdigest(),
+                int(result[0]),
+                json.dumps(result[1]),
+                current_time,
+            )
+            for key, result in self.unwritten_results.items()
+        ]
+        connection.executemany(
+            "INSERT OR REPLACE INTO filter_results (key, passed, reasons, last_used) "
+            + "VALUES (?, ?, ?, ?)",
+            rows,
+        )
+        connection.commit()
+        self.unwritten_results = {}
+
+        num_entries = connection.execute(
+            "SELECT COUNT(*) FROM filter_results"
+        ).fetchone()[0]
+        if num_entries <= self.max_disk_entries:
+            return
+
+        num_to_delete = num_entries - int(
+            self.max_disk_entries * FILTER_CACHE_EVICT_TO_FRACTION
+        )
+        connection.execute(
+            "DELETE FROM filter_results WHERE key IN ("
+            + "SELECT key FROM filter_results ORDER BY last_used ASC LIMIT ?)",
+            (num_to_delete,),
+        )
+        connection.commit()
+
+
+def get_filter_signature(child_dict, uncharged):
+    """
+    Make the signature of a set of filters. Two sets of filters have the same
+    signature only if they would give the same results.
+
+    Inputs:
+    :param dict child_dict: This dictionary contains all the names of the
+        chosen filters as keys and the the filter objects as the items
+    :param bool uncharged: True if mols are uncharged before they are
+        filtered
+
+    Returns:
+    :returns: str signature: the signature
+    """
+    signature_key = tuple(sorted(child_dict.keys())) + (uncharged,)
+    if signature_key in FILTER_SIGNATURES:
+        return FILTER_SIGNATURES[signature_key]
+
+    filter_definitions = []
+    for child in sorted(child_dict.keys()):
+        filter_object = child_dict[child]
+        filter_definitions.append(
+            [
+                child,
+                filter_object.__class__.__module__,
+                filter_object.descriptor_thresholds,
+                filter_object.max_violations,
+                filter_object.filter_catalogs,
+            ]
+        )
+    signature_string = json.dumps(
+        [FILTER_CACHE_VERSION, uncharged, filter_definitions], sort_keys=True
+    )
+    signature = hashlib.sha256(signature_string.encode("utf-8")).hexdigest()[:16]
+    FILTER_SIGNATURES[signature_key] = signature
+
+    return signature
+
+
+def install_filter_cache(max_entries, cache_file, max_disk_entries):
+    """
+    Install the FilterCache of this process. If max_entries is 0 the cache
+    is turned off.
+
+    This is run once in every worker by
+    vars["parallelizer"].install_worker_state
+
+    Workers which are not kept between parallel steps exit before they have
+    made enough new results to write them to the on-disk store, so any
+    unwritten results are also written when the process exits.
+
+    Inputs:
+    :param int max_entries: the max number of results held in memory
+    :param str cache_file: the path to the SQLite file of the on-disk store
+        or None for no on-disk store
+    :param int max_disk_entries: the max number of results kept in the
+        on-disk store
+    """
+    global FILTER_CACHE
+    global FILTER_CACHE_FINALIZER_PID
+    if max_entries == 0:
+        FILTER_CACHE = None
+        return
+
+    FILTER_CACHE = FilterCache(max_entries, cache_file, max_disk_entries)
+
+    if cache_file is not None and FILTER_CACHE_FINALIZER_PID != os.getpid():
+        multiprocessing.util.Finalize(None, flush_filter_cache, exitpriority=10)
+        FILTER_CACHE_FINALIZER_PID = os.getpid()
+
+
+def flush_filter_cache():
+    """
+    Write any new results of this process's FilterCache to the on-disk
+    store.
+
+    This is run once in every worker by
+    vars["parallelizer"].update_worker_state
+    """
+    if FILTER_CACHE is not None:
+        FILTER_CACHE.flush()
+
+
+def get_filter_cache():
+    """
+    Returns:
+    :returns: FilterCache filter_cache: the FilterCache of this process or
+        None if there is no cache
+    """
+    return FILTER_CACHE
@@ -0,0 +1,231 @@
+"""
+This script computes the molecular descriptors used by the property filters
+(ie Lipinski, Ghose, VandeWaterbeemd) for a batch of mols.
+
+Each descriptor needed by any of the chosen filters is computed once per mol
+and stored in a NumPy structured array with one record per mol. The property
+filters then test their thresholds against whole columns of the array at
+once rather than each recomputing the descriptors for its own copy of a mol.
+
+A DescriptorBatch instead computes each descriptor of a mol only when it is
+first asked for, so mols which fail a cheap threshold never have their
+expensive descriptors computed.
+"""
+import __future__
+
+import numpy as np
+
+import rdkit
+import rdkit.Chem as Chem
+import rdkit.Chem.Lipinski as Lipinski
+import rdkit.Chem.Crippen as Crippen
+import rdkit.Chem.Descriptors as Descriptors
+import rdkit.Chem.MolSurf as MolSurf
+import rdkit.Chem.rdMolDescriptors as rdMolDescriptors
+
+# Disable the unnecessary RDKit warnings
+rdkit.RDLogger.DisableLog("rdApp.*")
+
+HALOGEN_ATOMIC_NUMS = set([9, 17, 35, 53, 85])
+
+
+def count_atoms(mol, atomic_nums):
+    """
+    Count the atoms of a mol with any of a set of atomic numbers.
+
+    Inputs:
+    :param rdkit.Chem.rdchem.Mol object mol: an rdkit mol
+    :param set atomic_nums: the atomic numbers to count
+
+    Returns:
+    :returns: int num_atoms: the number of matching atoms
+    """
+    return len([atom for atom in mol.GetAtoms() if atom.GetAtomicNum() in atomic_nums])
+
+
+# Descriptors computed on the mol as given. Keys are descriptor names and
+# items are functions of a mol.
+DESCRIPTOR_FUNCTIONS = {
+    "exact_mwt": Descriptors.ExactMolWt,
+    "num_h_donors": Lipinski.NumHDonors,
+    "num_h_acceptors": Lipinski.NumHAcceptors,
+    "mol_log_p": Crippen.MolLogP,
+    "tpsa": MolSurf.TPSA,
+    "num_rotatable_bonds": Lipinski.NumRotatableBonds,
+    "ring_count": rdMolDescriptors.CalcNumRings,
+    "num_halogens": lambda mol: count_atoms(mol, HALOGEN_ATOMIC_NUMS),
+    "num_oxygens": lambda mol: count_atoms(mol, set([8])),
+    "num_nitrogens": lambda mol: count_atoms(mol, set([7])),
+    # CalcNumAtoms counts implicit hydrogens, so this gives the same count as
+    # the mol with explicit hydrogens without making a copy of the mol
+    "num_atoms_with_hs": rdMolDescriptors.CalcNumAtoms,
+}
+
+# Descriptors computed on a copy of the mol with explicit hydrogens. These
+# are used by filters which count hydrogens towards the number of atoms.
+DESCRIPTOR_FUNCTIONS_WITH_HS = {
+    "exact_mwt_with_hs": Descriptors.ExactMolWt,
+    "mol_mr_with_hs": Crippen.MolMR,
+    "mol_log_p_with_hs": Crippen.MolLogP,
+}
+
+DESCRIPTOR_NAMES = list(DESCRIPTOR_FUNCTIONS.keys()) + list(
+    DESCRIPTOR_FUNCTIONS_WITH_HS.keys()
+)
+
+
+def make_descriptor_dtype(descriptor_names):
+    """
+    Make the dtype of the structured array of a set of descriptors.
+
+    Inputs:
+    :param list descriptor_names: the names of the descriptors
+
+    Returns:
+    :returns: numpy.dtype dtype: a dtype with one float64 field per
+        descriptor
+    """
+    return np.dtype([(name, np.float64) for name in descriptor_names])
+
+
+def compute_descriptors(list_of_mols, descriptor_names):
+    """
+    Compute a set of descriptors for a batch of mols. Each descriptor is
+    computed once per mol, and the copy of a mol with explicit hydrogens is
+    only made if a descriptor needs it.
+
+    Inputs:
+    :param list list_of_mols: a list of rdkit mols. A mol may be None.
+    :param list descriptor_names: the names of the descriptors to compute.
+        Each must be in DESCRIPTOR_NAMES.
+
+    Returns:
+    :returns: numpy.ndarray descriptors: a structured array with one record
+        per mol and one field per descriptor. Every field of a mol which is
+        None, or whose descriptor could not be computed, is NaN so it fails
+        any threshold.
+    """
+    for name in descriptor_names:
+        if name not in DESCRIPTOR_NAMES:
+            printout = "{} is not a descriptor of the descriptor engine.".format(name)
+            printout = printout + " Please choose from: {}".format(DESCRIPTOR_NAMES)
+            raise Exception(printout)
+
+    names_without_hs = [x for x in descriptor_names if x in DESCRIPTOR_FUNCTIONS]
+    names_with_hs = [x for x in descriptor_names if x in DESCRIPTOR_FUNCTIONS_WITH_HS]
+
+    descriptors = np.full(
+        len(list_of_mols), np.nan, dtype=make_descriptor_dtype(descriptor_names)
+    )
+    for i, mol in enumerate(list_of_mols):
+        if mol is None:
+            continue
+        try:
+            for name in names_without_hs:
+                descriptors[name][i] = DESCRIPTOR_FUNCTIONS[name](mol)
+
+            if len(names_with_hs) != 0:
+                mol_with_hs = Chem.AddHs(mol)
+                for name in names_with_hs:
+                    descriptors[name][i] = DESCRIPTOR_FUNCTIONS_WITH_HS[name](mol_with_hs)
+        except:
+            descriptors[i] = tuple([np.nan] * len(descriptor_names))
+
+    return descriptors
+
+
+class DescriptorBatch(object):
+    """
+    This class holds the descriptors of a batch of mols, computing each
+    descriptor of a mol only when it is first asked for. Mols which have
+    already failed a filter need never have the rest of their descriptors
+    computed, and the copy of a mol with explicit hydrogens is only made if
+    a descriptor which needs it is asked for.
+    """
+
+    def __init__(self, list_of_mols):
+        """
+        init for DescriptorBatch.
+
+        Inputs:
+        :param list list_of_mols: a list of rdkit mols. A mol may be None.
+        """
+        self.list_of_mols = list_of_mols
+
+        # Keys are descriptor names and items are arrays with one value per
+        # mol. Values not yet computed are NaN.
+        self.values = {}
+
+        # Keys are descriptor names and items are bool arrays which are True
+        # for every mol whose value has been computed
+        self.computed = {}
+
+        # The copies of the mols with explicit hydrogens, made when needed
+        self.mols_with_hs = [None for mol in list_of_mols]
+
+    def get_values(self, name, indices):
+        """
+        Get the values of a descriptor for some of the mols of the batch.
+        Every value of a mol which is None, or whose descriptor could not be
+        computed, is NaN so it fails any threshold.
+
+        Inputs:
+        :param str name: the name of the descriptor. It must be in
+            DESCRIPTOR_NAMES.
+        :param numpy.ndarray indices: the indices of the mols
+
+        Returns:
+        :returns: numpy.ndarray values: the values of the descriptor for the
+            mols at indices
+        """
+        if name not in self.values:
+            if name not in DESCRIPTOR_NAMES:
+                printout = "{} is not a descriptor of the descriptor engine.".format(
+                    name
+                )
+                printout = printout + " Please choose from: {}".format(
+                    DESCRIPTOR_NAMES
+                )
+                raise Exception(printout)
+            self.values[name] = np.full(len(self.list_of_mols), np.nan)
+            self.computed[name] = np.zeros(len(self.list_of_mols), dtype=bool)
+
+        values = self.values[name]
+        computed = self.computed[name]
+        for i in indices:
+            if computed[i]:
+                continue
+            computed[i] = True
+            mol = self.list_of_mols[i]
+            if mol is None:
+                continue
+            try:
+                if name in DESCRIPTOR_FUNCTIONS:
+                    values[i] = DESCRIPTOR_FUNCTIONS[name](mol)
+                else:
+                    if self.mols_with_hs[i] is None:
+                        self.mols_with_hs[i] = Chem.AddHs(mol)
+                    values[i] = DESCRIPTOR_FUNCTIONS_WITH_HS[name](self.mols_with_hs[i])
+            except:
+                values[i] = np.nan
+
+        return values[indices]
+
+    def get_descriptors(self, descriptor_names, indices):
+        """
+        Get a set of descriptors for some of the mols of the batch as a
+        structured array, like that made by compute_descriptors.
+
+        Inputs:
+        :param list descriptor_names: the names of the descriptors
+        :param numpy.ndarray indices: the indices of the mols
+
+        Returns:
+        :returns: numpy.ndarray descriptors: a structured array with one
+            record per mol at indices and one field per descriptor
+        """
+        descriptors = np.empty(len(indices), dtype=make_descriptor_dtype(descriptor_names))
+        for name in descriptor_names:
+            descriptors[name] = self.get_values(name, indices)
+
+        return descriptors
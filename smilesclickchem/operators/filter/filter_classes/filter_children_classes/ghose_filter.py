@@ -19,13 +19,7 @@ databases Journal of Combinatorial Chemistry, 1 (1999), pp. 55-68
 
 import __future__
 
-import copy
-
 import rdkit
-import rdkit.Chem as Chem
-import rdkit.Chem.Lipinski as Lipinski
-import rdkit.Chem.Crippen as Crippen
-import rdkit.Chem.Descriptors as Descriptors
 
 # Disable the unnecessary RDKit warnings
 rdkit.RDLogger.DisableLog("rdApp.*")
@@ -58,51 +52,15 @@ class GhoseFilter(ParentFilter):
     :param class ParentFilter: a parent class to initialize off
     """
 
-    def run_filter(self, mol):
-        """
-        This runs a Ghose filter for drug-likeliness. Ghose filter filters
-        molecules by Molecular weight (MW), the number of atoms, and the logP
-        value.
-
-        We protonate the mol in this filter because hydrogens affect
-        atom count. Our Ghose implementation counts hydrogens in against
-        the total number of atoms.
-
-        To pass the filter a molecule must be:
-            MW between 160 and 480 dalton
-            Number of Atoms: between 20 and 70
-            logP  between -0,4 and +5,6
-
-        Inputs:
-        :param rdkit.Chem.rdchem.Mol object mol: An rdkit mol object to be
-            tested if it passes the filters
-
-        Returns:
-        :returns: bool bool: True if the mol passes the filter; False if it
-            fails the filter
-        """
-        # Make a copy of the mol so we can AddHs without affecting other filters
-        # number of atoms is altered by the presence/absence of hydrogens.
-        # Our Ghose filter counts hydrogenss towards atom count
-        copy_mol = copy.deepcopy(mol)
-        copy_mol = Chem.AddHs(copy_mol)
-        exact_mwt = Descriptors.ExactMolWt(copy_mol)
-        if ((exact_mwt < 160) or (exact_mwt > 480)):
-            return False
-
-        num_atoms = copy_mol.GetNumAtoms()
-        if ((num_atoms < 20) or (num_atoms > 70)):
-            return False
-
-        # molar Refractivity
-        MolMR = Crippen.MolMR(copy_mol)
-        if ((MolMR < 40) or (MolMR > 130)):
-            return False
-
-        # molar LogP
-        mol_log_p = Crippen.MolLogP(copy_mol)
-        if ((mol_log_p < -0.4) or (mol_log_p > 5.6)):
-            return False
-
-        # passed all filters
-        return True
+    # Our Ghose filter counts hydrogens towards atom count, so the
+    # descriptors are computed with explicit hydrogens
+    descriptor_thresholds = [
+        ("exact_mwt_with_hs", ">=", 160),
+        ("exact_mwt_with_hs", "<=", 480),
+        ("num_atoms_with_hs", ">=", 20),
+        ("num_atoms_with_hs", "<=", 70),
+        ("mol_mr_with_hs", ">=", 40),
+        ("mol_mr_with_hs", "<=", 130),
+        ("mol_log_p_with_hs", ">=", -0.4),
+        ("mol_log_p_with_hs", "<=", 5.6),
+    ]
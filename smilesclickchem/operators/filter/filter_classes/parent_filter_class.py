@@ -3,6 +3,25 @@ This script holds the parent class for filtering.
 This is used as the basis for all filter classes.
 """
 import __future__
+
+import numpy as np
+
+from smilesclickchem.operators.filter.filter_classes.descriptor_engine import (
+    compute_descriptors,
+)
+from smilesclickchem.operators.filter.filter_classes.substructure_engine import (
+    get_substructure_filter_engine,
+)
+
+# The comparison operators which can be used in descriptor_thresholds
+THRESHOLD_OPERATORS = {
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+}
+
+
 class ParentFilter(object):
     """
     This is a script containing all of the filters for drug likeliness
@@ -22,7 +41,29 @@ class ParentFilter(object):
         1) PAINSFilter
         2) NIHFilter
         3) BRENKFilter
+
+    Property filters (ie Lipinski) do not implement run_filter. Instead they
+    set descriptor_thresholds and the descriptors are computed once per mol by
+    the descriptor engine, which is shared by all of the chosen filters.
+
+    Substructure filters (ie PAINS) set filter_catalogs instead. The catalogs
+    of all of the chosen substructure filters are merged into a single
+    FilterCatalog by the substructure engine.
     """
+
+    # A list of (descriptor name, operator, value) thresholds a mol must meet
+    # ie) ("exact_mwt", "<=", 500). The descriptor names are those of
+    # descriptor_engine.DESCRIPTOR_NAMES. None if the filter implements
+    # run_filter itself.
+    descriptor_thresholds = None
+
+    # The number of thresholds a mol may fail and still pass the filter
+    max_violations = 0
+
+    # A list of the names of the RDKit FilterCatalogs a mol must not match
+    # ie) ["PAINS"]. None if the filter is not a substructure filter.
+    filter_catalogs = None
+
     def get_name(self):
         """
         Returns the current class name.
@@ -33,12 +74,81 @@ class ParentFilter(object):
 
         return self.__class__.__name__
 
-    def run_filter(self, input_string):
+    def is_property_filter(self):
+        """
+        Returns:
+        :returns: bool bool: True if the filter is defined by
+            descriptor_thresholds
+        """
+
+        return self.descriptor_thresholds is not None
+
+    def is_substructure_filter(self):
+        """
+        Returns:
+        :returns: bool bool: True if the filter is defined by filter_catalogs
+        """
+
+        return self.filter_catalogs is not None
+
+    def get_descriptor_names(self):
+        """
+        Returns:
+        :returns: list descriptor_names: the names of the descriptors tested
+            by descriptor_thresholds
+        """
+
+        descriptor_names = []
+        for name, _, _ in self.descriptor_thresholds:
+            if name not in descriptor_names:
+                descriptor_names.append(name)
+
+        return descriptor_names
+
+    def run_filter_on_descriptors(self, descriptors):
+        """
+        Test the descriptor_thresholds against the descriptors of a batch of
+        mols.
+
+        Inputs:
+        :param numpy.ndarray descriptors: a structured array made by
+            descriptor_engine.compute_descriptors with a field for every
+            descriptor of get_descriptor_names()
+
+        Returns:
+        :returns: numpy.ndarray passed: a bool array which is True for every
+            mol which passes the filter
+        """
+
+        num_violations = np.zeros(len(descriptors), dtype=int)
+        for name, operator, value in self.descriptor_thresholds:
+            num_violations = num_violations + np.logical_not(
+                THRESHOLD_OPERATORS[operator](descriptors[name], value)
+            )
+
+        return num_violations <= self.max_violations
+
+    def run_filter(self, mol):
         """
-        run_filter is needs to be implemented in each class.
+        run_filter is needs to be implemented in each class which does not
+        set descriptor_thresholds or filter_catalogs. For property and
+        substructure filters this runs the filter on a single mol.
 
         Inputs:
-        :param str input_string:  A string to raise an exception
+        :param rdkit.Chem.rdchem.Mol object mol: An rdkit mol object to be
+            tested if it passes the filters
+
+        Returns:
+        :returns: bool bool: True if the mol passes the filter; False if it
+            fails the filter
         """
 
-        raise NotImplementedError("run_filter() not implemented")
+        if self.is_substructure_filter() is True:
+            engine = get_substructure_filter_engine(self.filter_catalogs)
+            return engine.has_match(mol) is False
+
+        if self.is_property_filter() is False:
+            raise NotImplementedError("run_filter() not implemented")
+
+        descriptors = compute_descriptors([mol], self.get_descriptor_names())
+        return bool(self.run_filter_on_descriptors(descriptors)[0])
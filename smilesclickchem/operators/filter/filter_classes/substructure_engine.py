@@ -0,0 +1,151 @@
+"""
+This script runs the substructure filters (ie PAINS, BRENK, NIH) for a mol.
+
+The RDKit FilterCatalogs of every chosen substructure filter are merged into
+a single deduplicated FilterCatalog, so each mol is searched once rather than
+once per catalog. Catalogs contained in another chosen catalog (ie PAINS_A,
+PAINS_B and PAINS_C within PAINS) are dropped.
+"""
+import __future__
+
+from rdkit.Chem import FilterCatalog
+from rdkit.Chem.FilterCatalog import FilterCatalogParams
+
+# Catalogs which contain other catalogs. Keys are the names of the larger
+# catalogs and items are the names of the catalogs they contain.
+CATALOG_SUBSETS = {
+    "PAINS": ["PAINS_A", "PAINS_B", "PAINS_C"],
+    "CHEMBL": [
+        "CHEMBL_Glaxo",
+        "CHEMBL_Dundee",
+        "CHEMBL_BMS",
+        "CHEMBL_SureChEMBL",
+        "CHEMBL_MLSMR",
+        "CHEMBL_Inpharmatica",
+        "CHEMBL_LINT",
+    ],
+    "ALL": [
+        name for name in FilterCatalogParams.FilterCatalogs.names if name != "ALL"
+    ],
+}
+
+# Engines already made in this process. Keys are tuples of catalog names.
+SUBSTRUCTURE_FILTER_ENGINES = {}
+
+
+class SubstructureFilterEngine(object):
+    """
+    This class holds a single FilterCatalog made by merging a set of the RDKit
+    predefined FilterCatalogs.
+
+    Based on the FilterCatalog implementation in RDKit described in
+    http://rdkit.blogspot.com/2016/04/changes-in-201603-release-filtercatalog.html
+    """
+
+    def __init__(self, catalog_names):
+        """
+        init for SubstructureFilterEngine.
+
+        Inputs:
+        :param list catalog_names: the names of the RDKit FilterCatalogs to
+            merge ie) ["PAINS", "BRENK"]
+        """
+        self.catalog_names = get_unique_catalog_names(catalog_names)
+
+        params = FilterCatalogParams()
+        for catalog_name in self.catalog_names:
+            params.AddCatalog(getattr(FilterCatalogParams.FilterCatalogs, catalog_name))
+        self.filter_catalog = FilterCatalog.FilterCatalog(params)
+
+    def has_match(self, mol):
+        """
+        Inputs:
+        :param rdkit.Chem.rdchem.Mol object mol: An rdkit mol object
+
+        Returns:
+        :returns: bool bool: True if any alert of the catalogs matches the mol
+        """
+        return self.filter_catalog.HasMatch(mol)
+
+    def get_first_alert(self, mol):
+        """
+        Find the first alert which matches a mol. This is as fast as
+        has_match, but also says which alert matched.
+
+        Inputs:
+        :param rdkit.Chem.rdchem.Mol object mol: An rdkit mol object
+
+        Returns:
+        :returns: list alert: [filter set, description] of the first alert
+            which matches the mol or None if no alert matches
+        """
+        entry = self.filter_catalog.GetFirstMatch(mol)
+        if entry is None:
+            return None
+
+        return [entry.GetProp("FilterSet"), entry.GetDescription()]
+
+    def get_alerts(self, mol):
+        """
+        Find which alerts match a mol.
+
+        Inputs:
+        :param rdkit.Chem.rdchem.Mol object mol: An rdkit mol object
+
+        Returns:
+        :returns: list alerts: a list of [filter set, description] of every
+            alert which matches the mol ie) [["PAINS_A", "ene_six_het_A(483)"]]
+        """
+        return [
+            [entry.GetProp("FilterSet"), entry.GetDescription()]
+            for entry in self.filter_catalog.GetMatches(mol)
+        ]
+
+
+def get_unique_catalog_names(catalog_names):
+    """
+    Remove duplicate catalog names, and the names of catalogs contained in
+    another of the catalogs.
+
+    Inputs:
+    :param list catalog_names: the names of RDKit FilterCatalogs
+
+    Returns:
+    :returns: list unique_catalog_names: the sorted names of the catalogs to
+        merge
+    """
+    for catalog_name in catalog_names:
+        if catalog_name not in FilterCatalogParams.FilterCatalogs.names:
+            printout = "{} is not an RDKit FilterCatalog.".format(catalog_name)
+            printout = printout + " Please choose from: {}".format(
+                list(FilterCatalogParams.FilterCatalogs.names)
+            )
+            raise Exception(printout)
+
+    unique_catalog_names = set(catalog_names)
+    for catalog_name in list(unique_catalog_names):
+        if catalog_name in CATALOG_SUBSETS:
+            unique_catalog_names = unique_catalog_names - set(
+                CATALOG_SUBSETS[catalog_name]
+            )
+
+    return sorted(unique_catalog_names)
+
+
+def get_substructure_filter_engine(catalog_names):
+    """
+    Get the SubstructureFilterEngine of a set of catalogs. Each engine is
+    only made once per process.
+
+    Inputs:
+    :param list catalog_names: the names of the RDKit FilterCatalogs to
+        merge
+
+    Returns:
+    :returns: SubstructureFilterEngine engine: the engine
+    """
+    key = tuple(get_unique_catalog_names(catalog_names))
+    if key not in SUBSTRUCTURE_FILTER_ENGINES:
+        SUBSTRUCTURE_FILTER_ENGINES[key] = SubstructureFilterEngine(list(key))
+
+    return SUBSTRUCTURE_FILTER_ENGINES[key]
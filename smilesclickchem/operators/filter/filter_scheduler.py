@@ -0,0 +1,540 @@
+"""FilterScheduler Class
+
+Runs the chosen filters as a series of checks, cheapest and most selective
+first, stopping for each mol at the first check it fails. The order adapts to
+the time each check takes and the fraction of mols it rejects during a run,
+and the timing and rejection statistics of every check are recorded.
+"""
+import __future__
+
+import os
+import copy
+import json
+import time
+import multiprocessing.util
+
+import numpy as np
+
+from smilesclickchem.operators.filter.filter_classes.parent_filter_class import (
+    THRESHOLD_OPERATORS,
+)
+from smilesclickchem.operators.filter.filter_classes.descriptor_engine import (
+    DESCRIPTOR_FUNCTIONS,
+    DescriptorBatch,
+)
+from smilesclickchem.operators.filter.filter_classes.substructure_engine import (
+    get_substructure_filter_engine,
+)
+
+# The reason recorded for a ligand which could not be sanitized
+SANITIZATION_FAILURE_REASON = "Failed sanitization"
+
+# The number of mols the prior cost and rejection rate of a check count as.
+# This keeps the order from changing on the first few mols.
+PRIOR_WEIGHT = 10
+
+# The prior rejection rate of every check
+PRIOR_REJECTION_RATE = 0.1
+
+# The prior seconds per mol of each kind of check
+PRIOR_SECONDS_THRESHOLD = 1e-5
+PRIOR_SECONDS_THRESHOLD_WITH_HS = 1e-4
+PRIOR_SECONDS_PROPERTY_FILTER = 1e-4
+PRIOR_SECONDS_SUBSTRUCTURE = 1e-3
+PRIOR_SECONDS_CUSTOM_FILTER = 1e-3
+
+# Name of the file within a Run folder which the filter statistics of every
+# process are appended to
+FILTER_STATISTICS_FILENAME = "filter_statistics.jsonl"
+
+# The FilterSchedulers made in this process. Keys are tuples of the names of
+# the chosen filters.
+FILTER_SCHEDULERS = {}
+
+# The file the statistics of this process are appended to or None if they
+# are not recorded. It is installed in the main process and in every worker
+# by install_filter_statistics.
+FILTER_STATISTICS_FILE = None
+
+# The pid of the process which registered write_filter_statistics to run
+# when it exits. A forked worker registers its own.
+FILTER_STATISTICS_FINALIZER_PID = None
+
+
+class FilterCheck(object):
+    """
+    This is the parent class of the checks run by a FilterScheduler. Each
+    check tests a batch of mols and records how long it took and how many
+    mols it rejected.
+    """
+
+    def __init__(self, name, filter_name, prior_seconds):
+        """
+        init for FilterCheck.
+
+        Inputs:
+        :param str name: the name of the check, which is unique within a
+            FilterScheduler
+        :param str filter_name: the name of the filter the check belongs to
+            ie) GhoseFilter
+        :param float prior_seconds: the expected seconds per mol of the check
+            before it has been run
+        """
+        self.name = name
+        self.filter_name = filter_name
+        self.prior_seconds = prior_seconds
+
+        # Totals for the whole time this process has run the check. These
+        # set the order of the checks.
+        self.num_tested = 0
+        self.num_rejected = 0
+        self.seconds = 0.0
+
+        # Totals not yet written by write_filter_statistics
+        self.unwritten_statistics = [0, 0, 0.0]
+
+    def get_expected_seconds_per_rejection(self):
+        """
+        Estimate how long the check takes to reject a mol. Checks are run in
+        order of this estimate, so cheap checks which reject many mols run
+        first.
+
+        Returns:
+        :returns: float seconds: the expected seconds spent per mol rejected
+        """
+        seconds_per_mol = (self.seconds + self.prior_seconds * PRIOR_WEIGHT) / (
+            self.num_tested + PRIOR_WEIGHT
+        )
+        rejection_rate = (self.num_rejected + PRIOR_REJECTION_RATE * PRIOR_WEIGHT) / (
+            self.num_tested + PRIOR_WEIGHT
+        )
+
+        return seconds_per_mol / max(rejection_rate, 1e-6)
+
+    def record(self, num_tested, num_rejected, seconds):
+        """
+        Record a run of the check.
+
+        Inputs:
+        :param int num_tested: the number of mols tested
+        :param int num_rejected: the number of mols which failed
+        :param float seconds: the time the run took
+        """
+        self.num_tested = self.num_tested + num_tested
+        self.num_rejected = self.num_rejected + num_rejected
+        self.seconds = self.seconds + seconds
+
+        self.unwritten_statistics[0] = self.unwritten_statistics[0] + num_tested
+        self.unwritten_statistics[1] = self.unwritten_statistics[1] + num_rejected
+        self.unwritten_statistics[2] = self.unwritten_statistics[2] + seconds
+
+    def run_check(self, list_of_mols, descriptor_batch, indices):
+        """
+        run_check is implemented by each kind of check.
+
+        Inputs:
+        :param list list_of_mols: a list of rdkit mols
+        :param DescriptorBatch descriptor_batch: the descriptors of the mols
+        :param numpy.ndarray indices: the indices of the mols to test. None
+            of these mols are None.
+
+        Returns:
+        :returns: list failures: a list of (index, reason) for every mol
+            which failed the check
+        """
+        raise NotImplementedError("run_check() not implemented")
+
+
+class ThresholdCheck(FilterCheck):
+    """
+    A single descriptor threshold of a property filter which allows no
+    violations ie) exact_mwt <= 500 of LipinskiStrictFilter. Failing the
+    threshold fails the filter.
+    """
+
+    def __init__(self, filter_object, descriptor_name, operator, value):
+        """
+        init for ThresholdCheck.
+
+        Inputs:
+        :param object filter_object: the property filter
+        :param str descriptor_name: the name of the descriptor
+        :param str operator: the comparison operator ie) "<="
+        :param float value: the threshold
+        """
+        if descriptor_name in DESCRIPTOR_FUNCTIONS:
+            prior_seconds = PRIOR_SECONDS_THRESHOLD
+        else:
+            prior_seconds = PRIOR_SECONDS_THRESHOLD_WITH_HS
+
+        name = "{}: {} {} {}".format(
+            filter_object.get_name(), descriptor_name, operator, value
+        )
+        FilterCheck.__init__(self, name, filter_object.get_name(), prior_seconds)
+
+        self.descriptor_name = descriptor_name
+        self.operator = operator
+        self.value = value
+
+    def run_check(self, list_of_mols, descriptor_batch, indices):
+        """
+        Inputs:
+        :param list list_of_mols: a list of rdkit mols
+        :param DescriptorBatch descriptor_batch: the descriptors of the mols
+        :param numpy.ndarray indices: the indices of the mols to test
+
+        Returns:
+        :returns: list failures: a list of (index, reason) for every mol
+            which failed the check
+        """
+        values = descriptor_batch.get_values(self.descriptor_name, indices)
+        passed = THRESHOLD_OPERATORS[self.operator](values, self.value)
+
+        return [(i, self.filter_name) for i in indices[~passed]]
+
+
+class PropertyFilterCheck(FilterCheck):
+    """
+    A whole property filter which allows some violations
+    ie) LipinskiLenientFilter.
+    """
+
+    def __init__(self, filter_object):
+        """
+        init for PropertyFilterCheck.
+
+        Inputs:
+        :param object filter_object: the property filter
+        """
+        FilterCheck.__init__(
+            self,
+            filter_object.get_name(),
+            filter_object.get_name(),
+            PRIOR_SECONDS_PROPERTY_FILTER,
+        )
+        self.filter_object = filter_object
+
+    def run_check(self, list_of_mols, descriptor_batch, indices):
+        """
+        Inputs:
+        :param list list_of_mols: a list of rdkit mols
+        :param DescriptorBatch descriptor_batch: the descriptors of the mols
+        :param numpy.ndarray indices: the indices of the mols to test
+
+        Returns:
+        :returns: list failures: a list of (index, reason) for every mol
+            which failed the check
+        """
+        descriptors = descriptor_batch.get_descriptors(
+            self.filter_object.get_descriptor_names(), indices
+        )
+        passed = self.filter_object.run_filter_on_descriptors(descriptors)
+
+        return [(i, self.filter_name) for i in indices[~passed]]
+
+
+class SubstructureCheck(FilterCheck):
+    """
+    The merged FilterCatalog of all of the chosen substructure filters
+    ie) PAINSFilter and BRENKFilter.
+    """
+
+    def __init__(self, filter_names, filter_catalog_names):
+        """
+        init for SubstructureCheck.
+
+        Inputs:
+        :param list filter_names: the names of the substructure filters
+        :param list filter_catalog_names: the names of their RDKit
+            FilterCatalogs
+        """
+        name = "+".join(sorted(filter_names))
+        FilterCheck.__init__(self, name, name, PRIOR_SECONDS_SUBSTRUCTURE)
+        self.engine = get_substructure_filter_engine(filter_catalog_names)
+
+    def run_check(self, list_of_mols, descriptor_batch, indices):
+        """
+        Inputs:
+        :param list list_of_mols: a list of rdkit mols
+        :param DescriptorBatch descriptor_batch: the descriptors of the mols
+        :param numpy.ndarray indices: the indices of the mols to test
+
+        Returns:
+        :returns: list failures: a list of (index, reason) for every mol
+            which failed the check. The reason is the first alert which
+            matched ie) "BRENK: Oxygen-nitrogen_single_bond"
+        """
+        failures = []
+        for i in indices:
+            alert = self.engine.get_first_alert(list_of_mols[i])
+            if alert is not None:
+                failures.append((i, "{}: {}".format(alert[0], alert[1])))
+
+        return failures
+
+
+class CustomFilterCheck(FilterCheck):
+    """
+    A filter which implements run_filter itself, such as a custom filter
+    added with alternative_filter.
+    """
+
+    def __init__(self, filter_object):
+        """
+        init for CustomFilterCheck.
+
+        Inputs:
+        :param object filter_object: the filter
+        """
+        FilterCheck.__init__(
+            self,
+            filter_object.get_name(),
+            filter_object.get_name(),
+            PRIOR_SECONDS_CUSTOM_FILTER,
+        )
+        self.filter_object = filter_object
+
+    def run_check(self, list_of_mols, descriptor_batch, indices):
+        """
+        Inputs:
+        :param list list_of_mols: a list of rdkit mols
+        :param DescriptorBatch descriptor_batch: the descriptors of the mols
+        :param numpy.ndarray indices: the indices of the mols to test
+
+        Returns:
+        :returns: list failures: a list of (index, reason) for every mol
+            which failed the check
+        """
+        failures = []
+        for i in indices:
+            # Filters which implement run_filter get their own copy of the mol
+            # in case they alter it
+            mol_copy = copy.deepcopy(list_of_mols[i])
+            if self.filter_object.run_filter(mol_copy) is False:
+                failures.append((i, self.filter_name))
+
+        return failures
+
+
+class FilterScheduler(object):
+    """
+    This class runs a set of filters on batches of mols as a series of
+    checks. Each property filter which allows no violations is split into
+    one check per descriptor threshold, so a cheap threshold
+    (ie exact_mwt <= 500) can reject a mol before the expensive descriptors
+    of the filter are computed. The substructure filters are a single check
+    against their merged FilterCatalog.
+
+    Checks are run in order of their expected time per mol rejected, which
+    is re-estimated from the time and rejection rate of every check as the
+    run goes. Each mol stops at the first check it fails, and the descriptors
+    of a mol are only computed when a check needs them.
+    """
+
+    def __init__(self, child_dict):
+        """
+        init for FilterScheduler.
+
+        Inputs:
+        :param dict child_dict: This dictionary contains all the names of the
+            chosen filters as keys and the the filter objects as the items
+        """
+        self.checks = []
+
+        substructure_filter_names = []
+        filter_catalog_names = []
+        for child in sorted(child_dict.keys()):
+            filter_object = child_dict[child]
+            if filter_object.is_property_filter():
+                if filter_object.max_violations == 0:
+                    for name, operator, value in filter_object.descriptor_thresholds:
+                        self.checks.append(
+                            ThresholdCheck(filter_object, name, operator, value)
+                        )
+                else:
+                    self.checks.append(PropertyFilterCheck(filter_object))
+            elif filter_object.is_substructure_filter():
+                substructure_filter_names.append(child)
+                filter_catalog_names.extend(filter_object.filter_catalogs)
+            else:
+                self.checks.append(CustomFilterCheck(filter_object))
+
+        if len(filter_catalog_names) != 0:
+            self.checks.append(
+                SubstructureCheck(substructure_filter_names, filter_catalog_names)
+            )
+
+    def get_ordered_checks(self):
+        """
+        Returns:
+        :returns: list checks: the checks in the order they are run
+        """
+        return sorted(self.checks, key=lambda x: x.get_expected_seconds_per_rejection())
+
+    def run_filters(self, list_of_mols):
+        """
+        Run a batch of mols through the checks, stopping for each mol at the
+        first check it fails.
+
+        Inputs:
+        :param list list_of_mols: a list of rdkit mols. A mol may be None, in
+            which case it fails.
+
+        Returns:
+        :returns: list list_of_reasons: a list with a list of reasons for
+            every mol. A mol which failed has a single reason describing the
+            check it failed ie) ["LipinskiStrictFilter"] or
+            ["BRENK: Oxygen-nitrogen_single_bond"]. The list is empty if the
+            mol passed all the filters.
+        """
+        list_of_reasons = [
+            [] if mol is not None else [SANITIZATION_FAILURE_REASON]
+            for mol in list_of_mols
+        ]
+        remaining = np.array(
+            [i for i, mol in enumerate(list_of_mols) if mol is not None], dtype=int
+        )
+        descriptor_batch = DescriptorBatch(list_of_mols)
+
+        for check in self.get_ordered_checks():
+            if len(remaining) == 0:
+                break
+
+            start_time = time.perf_counter()
+            failures = check.run_check(list_of_mols, descriptor_batch, remaining)
+            check.record(len(remaining), len(failures), time.perf_counter() - start_time)
+
+            if len(failures) == 0:
+                continue
+            for i, reason in failures:
+                list_of_reasons[i].append(reason)
+            failed = set([i for i, _ in failures])
+            remaining = np.array([i for i in remaining if i not in failed], dtype=int)
+
+        return list_of_reasons
+
+
+def get_filter_scheduler(child_dict):
+    """
+    Get the FilterScheduler of a set of filters. Each scheduler is only made
+    once per process, so the order it learns is kept between batches.
+
+    Inputs:
+    :param dict child_dict: This dictionary contains all the names of the
+        chosen filters as keys and the the filter objects as the items
+
+    Returns:
+    :returns: FilterScheduler filter_scheduler: the scheduler
+    """
+    key = tuple(sorted(child_dict.keys()))
+    if key not in FILTER_SCHEDULERS:
+        FILTER_SCHEDULERS[key] = FilterScheduler(child_dict)
+
+    return FILTER_SCHEDULERS[key]
+
+
+def install_filter_statistics(statistics_file):
+    """
+    Set the file the filter statistics of this process are appended to.
+    They are written when write_filter_statistics is run and when the
+    process exits, as workers which are not kept between parallel steps
+    exit before they can be asked to.
+
+    This is run once in every worker by
+    vars["parallelizer"].install_worker_state
+
+    Inputs:
+    :param str statistics_file: the path to the statistics file
+    """
+    global FILTER_STATISTICS_FILE
+    global FILTER_STATISTICS_FINALIZER_PID
+
+    FILTER_STATISTICS_FILE = statistics_file
+
+    if FILTER_STATISTICS_FINALIZER_PID != os.getpid():
+        multiprocessing.util.Finalize(None, write_filter_statistics, exitpriority=10)
+        FILTER_STATISTICS_FINALIZER_PID = os.getpid()
+
+
+def write_filter_statistics():
+    """
+    Append the statistics of every check run by this process since they
+    were last written to the statistics file, as a single line of JSON:
+        {"check name": [filter name, num tested, num rejected, seconds]}
+
+    This is run once in every worker by
+    vars["parallelizer"].update_worker_state
+    """
+    if FILTER_STATISTICS_FILE is None:
+        return
+
+    statistics = {}
+    for filter_scheduler in FILTER_SCHEDULERS.values():
+        for check in filter_scheduler.checks:
+            if check.unwritten_statistics[0] == 0:
+                continue
+            statistics[check.name] = [check.filter_name] + check.unwritten_statistics
+            check.unwritten_statistics = [0, 0, 0.0]
+
+    if len(statistics) == 0:
+        return
+
+    with open(FILTER_STATISTICS_FILE, "a") as f:
+        f.write(json.dumps(statistics) + "\n")
+
+
+def read_filter_statistics(statistics_file):
+    """
+    Read and total the statistics written by every process.
+
+    Inputs:
+    :param str statistics_file: the path to the statistics file
+
+    Returns:
+    :returns: list statistics: a list of [check name, filter name,
+        num tested, num rejected, seconds] for every check, sorted by seconds
+        with the slowest first
+    """
+    totals = {}
+    if os.path.exists(statistics_file) is False:
+        return []
+
+    with open(statistics_file) as f:
+        for line in f:
+            try:
+                statistics = json.loads(line)
+            except ValueError:
+                # Skip a line left incomplete by a process which was killed
+                continue
+            for check_name, (filter_name, num_tested, num_rejected, seconds) in (
+                statistics.items()
+            ):
+                if check_name not in totals:
+                    totals[check_name] = [check_name, filter_name, 0, 0, 0.0]
+                totals[check_name][2] = totals[check_name][2] + num_tested
+                totals[check_name][3] = totals[check_name][3] + num_rejected
+                totals[check_name][4] = totals[check_name][4] + seconds
+
+    return sorted(totals.values(), key=lambda x: x[4], reverse=True)
+
+
+def print_filter_statistics(statistics_file):
+    """
+    Print the time spent in and the number of mols rejected by every filter
+    check.
+
+    Inputs:
+    :param str statistics_file: the path to the statistics file
+    """
+    statistics = read_filter_statistics(statistics_file)
+    if len(statistics) == 0:
+        return
+
+    print("\nFilter statistics (seconds, mols tested, mols rejected, check):")
+    for check_name, _, num_tested, num_rejected, seconds in statistics:
+        print(
+            "    {:10.3f}  {:10d}  {:10d}  {}".format(
+                seconds, num_tested, num_rejected, check_name
+            )
+        )
+    print("")
@@ -9,7 +9,15 @@ import copy
 
 
 import smilesclickchem.operators.mutation.smiles_click_chem.smiles_click_chem as SmileClickClass
+from smilesclickchem.operators.mutation.smiles_click_chem.product_registry import (
+    ProductRegistry,
+)
 
+# The SmilesClickChem object used by run_smiles_click_for_multithread. It is
+# installed in each worker once per call of generate_mutants by
+# install_smiles_click_chem_object, so jobs only need to carry a SMILES and
+# a random seed rather than a pickled copy of the whole object.
+SMILES_CLICK_CHEM_OBJECT = None
 
 #######################################
 # Functions for creating molecular models
@@ -48,24 +56,116 @@ def make_mutants(vars, generation_num, number_of_processors,
     else:
         new_ligands_list = new_mutation_smiles_list
 
+    num_new_ligands_needed = num_mutants_to_make - len(new_ligands_list)
+    if num_new_ligands_needed <= 0:
+        return new_ligands_list
+
+    # Gather every mutant into a single chunk
+    for chunk_of_new_ligands in generate_mutants(
+            vars, generation_num, num_new_ligands_needed, ligands_list,
+            new_ligands_list, rxn_library_variables, num_new_ligands_needed):
+        new_ligands_list.extend(chunk_of_new_ligands)
+
+    if len(new_ligands_list) < num_mutants_to_make:
+        return None
+
+    # once the number of mutants we need is generated return the list
+    return new_ligands_list
+
+
+def generate_mutants(vars, generation_num, num_mutants_to_make, ligands_list,
+                     list_of_already_made_smiles, rxn_library_variables,
+                     chunk_size):
+    """
+    Generator which makes unique mutant compounds and yields them in chunks.
+
+    Only the current chunk of mutants is held in memory (along with the
+    registry of dedup keys and IDs), so this can be used to enumerate many
+    more compounds than fit in memory. Every mutant yielded has already
+    passed the filters and is unique within the generation.
+
+    Inputs:
+    :param dict vars: a dictionary of all user variables
+    :param int generation_num: generation number
+    :param int num_mutants_to_make: number of new mutants to make
+    :param list ligands_list: list of ligand/name pairs which are the order in
+        which to be sampled
+    :param list list_of_already_made_smiles: list of ligand/name pairs of
+        mutants already made for the current generation. These won't be made
+        again.
+    :param list rxn_library_variables: a list of user variables which define
+        the rxn_library, rxn_library_file, and function_group_library. ie.
+        rxn_library_variables = [vars['rxn_library'], vars['rxn_library_file'],
+        vars['function_group_library']]
+    :param int chunk_size: the number of mutants to yield at a time. The last
+        chunk may be smaller.
+
+    Returns:
+    :returns: list chunk_of_new_ligands: yields lists of ligand/name pairs.
+        Fewer than num_mutants_to_make mutants may be made in total if
+        mutation fails.
+    """
+
     loop_counter = 0
 
     number_of_processors = int(vars["parallelizer"].return_node())
 
     # initialize the smileclickclass
     a_smiles_click_chem_object = SmileClickClass.SmilesClickChem(
-        rxn_library_variables, new_mutation_smiles_list, vars["filter_object_dict"]
+        rxn_library_variables,
+        list_of_already_made_smiles,
+        vars["filter_object_dict"],
+        vars["dedup_by_inchikey"],
     )
 
-    while loop_counter < 2000 and len(new_ligands_list) < num_mutants_to_make:
+    # Registry of every ligand made so far in this generation. This is used
+    # to dedup results and to give each new ligand a unique ID
+    product_registry = ProductRegistry(
+        generation_num, list_of_already_made_smiles, vars["dedup_by_inchikey"]
+    )
+
+    # Ship the smileclickclass, with its reaction library, filters and
+    # complementary molecules, to every worker once. The smileclickclass of
+    # an earlier pass whose generator wasn't run to the end is forgotten
+    # first.
+    vars["parallelizer"].remove_worker_state(install_smiles_click_chem_object)
+    vars["parallelizer"].install_worker_state(
+        install_smiles_click_chem_object, (a_smiles_click_chem_object,)
+    )
+
+    # Ligands made since the workers' list_of_already_made_smiles was last
+    # updated
+    unsynced_ligands = []
+
+    # Ligands made but not yet yielded
+    chunk_of_new_ligands = []
+
+    num_made = 0
+
+    # SMILES of seeds which can't take part in any reaction. These are
+    # dropped from the rotation for the rest of the generation.
+    dropped_seeds = set([])
+
+    while loop_counter < 2000 and num_made < num_mutants_to_make:
 
-        react_list = copy.deepcopy(ligands_list)
+        react_list = [
+            copy.deepcopy(x) for x in ligands_list if x[0] not in dropped_seeds
+        ]
+        if len(react_list) == 0:
+            # No seed can be mutated
+            break
 
-        while len(new_ligands_list) < num_mutants_to_make and len(react_list) > 0:
+        while num_made < num_mutants_to_make and len(react_list) > 0:
 
-            a_smiles_click_chem_object.update_list_of_already_made_smiles(new_ligands_list)
-            num_to_grab = num_mutants_to_make - len(new_ligands_list)
-            num_to_make = num_to_grab
+            # Only send the ligands made since the last batch
+            if len(unsynced_ligands) > 0:
+                vars["parallelizer"].update_worker_state(
+                    update_list_of_already_made_smiles_in_worker,
+                    (unsynced_ligands,),
+                )
+                unsynced_ligands = []
+
+            num_to_make = num_mutants_to_make - num_made
 
             # to minimize a big loop of running a single mutation at a time we
             # will make 1 new lig/processor. This will help to prevent wasting
@@ -80,96 +180,102 @@ def make_mutants(vars, generation_num, number_of_processors,
             smile_inputs = [x[0] for x in smile_pairs]
             smile_names = [x[1] for x in smile_pairs]
 
+            # Each job gets its own seed so that workers started from the
+            # same parent process don't make the same random choices
             job_input = tuple(
-                [tuple([smile, a_smiles_click_chem_object]) for smile in smile_inputs]
+                [tuple([smile, random.getrandbits(32)]) for smile in smile_inputs]
             )
 
             results = vars["parallelizer"].run(
                 job_input, run_smiles_click_for_multithread
             )
 
-            for index, i in enumerate(results):
-                if i is not None:
-
-                    # Get the new molecule's (aka the Child lig) Smile string
-                    child_lig_smile = i[0]
-
-                    # get the reaction id number
-                    reaction_id_number = i[1]
-
-                    # get the ID for the parent of a child mol and the
-                    # complementary parent mol. comp mol could be None or a
-                    # zinc database ID
-                    parent_lig_id = smile_names[index]
-                    zinc_id_comp_mol = i[2]
-
-                    # Make a list of all smiles and smile_id's of all
-                    # previously made smiles in this generation
-                    list_of_already_made_smiles = []
-                    list_of_already_made_id = []
-
-                    # fill lists of all smiles and smile_id's of all
-                    # previously made smiles in this generation
-                    for x in new_ligands_list:
-                        list_of_already_made_smiles.append(x[0])
-                        list_of_already_made_id.append(x[1])
-
-                    if child_lig_smile not in list_of_already_made_smiles:
-                        # if the smiles string is unique to the list of
-                        # previous smile strings in this round of reactions
-                        # then we append it to the list of newly created
-                        # ligands we append it with a unique ID, which also
-                        # tracks the progress of the reactant
-                        is_name_unique = False
-                        while is_name_unique is False:
-                            # make unique ID with the 1st number being the
-                            # parent_lig_id for the derived mol, Followed by
-                            # Mutant, folowed by the generationnumber,
-                            # followed by a unique.
-
-                            # get the unique ID (last few diget ID of the
-                            # parent mol
-                            parent_lig_id = parent_lig_id.split(")")[-1]
-
-                            random_id_num = random.randint(100, 1000000)
-                            if zinc_id_comp_mol is None:
-                                new_lig_id = "({})Gen_{}_Mutant_{}_{}".format(
-                                    parent_lig_id,
-                                    generation_num,
-                                    reaction_id_number,
-                                    random_id_num,
-                                )
-                            else:
-                                new_lig_id = "({}+{})Gen_{}_Mutant_{}_{}".format(
-                                    parent_lig_id,
-                                    zinc_id_comp_mol,
-                                    generation_num,
-                                    reaction_id_number,
-                                    random_id_num,
-                                )
-
-                            # check name is unique
-                            if new_lig_id not in list_of_already_made_id:
-                                is_name_unique = True
-
-                        # make a temporary list containing the smiles string
-                        # of the new product and the unique ID
-                        ligand_info = [child_lig_smile, new_lig_id]
-
-                        # append the new ligand smile and ID to the list of
-                        # all newly made ligands
-                        new_ligands_list.append(ligand_info)
+            for index, (i, seed_has_reactions) in enumerate(results):
+                if seed_has_reactions is False:
+                    dropped_seeds.add(smile_inputs[index])
+
+                if i is None or num_made >= num_mutants_to_make:
+                    continue
+
+                # Get the new molecule's (aka the Child lig) Smile string
+                child_lig_smile = i[0]
+
+                # get the reaction id number
+                reaction_id_number = i[1]
+
+                # get the ID for the parent of a child mol and the
+                # complementary parent mol. comp mol could be None or a
+                # zinc database ID
+                parent_lig_id = smile_names[index]
+                zinc_id_comp_mol = i[2]
+
+                if product_registry.is_already_made(child_lig_smile) is False:
+                    # if the smiles string is unique to the previous
+                    # smile strings in this round of reactions then we
+                    # append it to the list of newly created ligands we
+                    # append it with a unique ID, which also tracks the
+                    # progress of the reactant
+                    new_lig_id = product_registry.make_new_id(
+                        parent_lig_id, reaction_id_number, zinc_id_comp_mol
+                    )
+                    product_registry.add_product(child_lig_smile, new_lig_id)
+
+                    # make a temporary list containing the smiles string
+                    # of the new product and the unique ID
+                    ligand_info = [child_lig_smile, new_lig_id]
+
+                    chunk_of_new_ligands.append(ligand_info)
+                    unsynced_ligands.append(ligand_info)
+                    num_made = num_made + 1
+
+            while len(chunk_of_new_ligands) >= chunk_size:
+                yield chunk_of_new_ligands[:chunk_size]
+                chunk_of_new_ligands = chunk_of_new_ligands[chunk_size:]
 
         loop_counter = loop_counter + 1
 
-    if len(new_ligands_list) < num_mutants_to_make:
-        return None
+    # Workers started from here on don't need the smileclickclass. Only its
+    # initializer is removed, as the filter cache and filter statistics
+    # initializers are needed for the rest of the run.
+    vars["parallelizer"].remove_worker_state(install_smiles_click_chem_object)
 
-    # once the number of mutants we need is generated return the list
-    return new_ligands_list
+    if len(chunk_of_new_ligands) > 0:
+        yield chunk_of_new_ligands
 
 
-def run_smiles_click_for_multithread(smile, a_smiles_click_chem_object):
+def install_smiles_click_chem_object(a_smiles_click_chem_object):
+    """
+    Install the SmilesClickChem object used by
+    run_smiles_click_for_multithread in this process.
+
+    This is run once in every worker by
+    vars["parallelizer"].install_worker_state
+
+    Inputs:
+    :param object a_smiles_click_chem_object: a SmilesClickChem class object
+    """
+
+    global SMILES_CLICK_CHEM_OBJECT
+    SMILES_CLICK_CHEM_OBJECT = a_smiles_click_chem_object
+
+
+def update_list_of_already_made_smiles_in_worker(list_of_new_ligands):
+    """
+    Add newly made ligands to the list_of_already_made_smiles of this
+    process's SmilesClickChem object.
+
+    This is run once in every worker by
+    vars["parallelizer"].update_worker_state
+
+    Inputs:
+    :param list list_of_new_ligands: a list of lists. Each sublist contains
+        the SMILES string and the ID of a ligand made since the last update
+    """
+
+    SMILES_CLICK_CHEM_OBJECT.update_list_of_already_made_smiles(list_of_new_ligands)
+
+
+def run_smiles_click_for_multithread(smile, seed):
     """
     This function takes a single smilestring and performs SmileClick on it.
 
@@ -179,12 +285,28 @@ def run_smiles_click_for_multithread(smile, a_smiles_click_chem_object):
 
     Inputs:
     :param str smile: a SMILES string
+    :param int seed: seed for the random choices made for this SMILES
 
     Returns:
     :returns: str result_of_run: either a smile string of a child mol or None
         if the reactions failed
+    :returns: bool seed_has_reactions: False if the SMILES can't take part in
+        any reaction, so there's no point in trying it again
     """
 
-    result_of_run = a_smiles_click_chem_object.run_smiles_click(smile)
+    if SMILES_CLICK_CHEM_OBJECT is None:
+        printout = "No SmilesClickChem object has been installed in this "
+        printout = printout + "process. Run install_smiles_click_chem_object first."
+        raise Exception(printout)
+
+    # The job may be run in the main process (ie serial mode) so the random
+    # state is restored afterwards
+    random_state = random.getstate()
+    random.seed(seed)
+    result_of_run = SMILES_CLICK_CHEM_OBJECT.run_smiles_click(smile)
+    random.setstate(random_state)
+
+    # The profile of the seed was made and cached by run_smiles_click
+    seed_has_reactions = SMILES_CLICK_CHEM_OBJECT.seed_has_reactions(smile)
 
-    return result_of_run
+    return result_of_run, seed_has_reactions
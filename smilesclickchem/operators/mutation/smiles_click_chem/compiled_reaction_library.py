@@ -0,0 +1,152 @@
+"""CompiledReactionLibrary Class"""
+import __future__
+
+import json
+
+import rdkit
+from rdkit import Chem
+from rdkit.Chem import AllChem
+
+# Disable the unnecessary RDKit warnings
+rdkit.RDLogger.DisableLog("rdApp.*")
+
+# Libraries compiled by this process. Keys are the json of the library's
+# dictionaries and items are tuples of (functional_group_mols,
+# reactions_by_name, reactions_by_num). A long-lived worker, ie one in a
+# persistent worker pool, compiles each library once rather than once per job.
+COMPILED_LIBRARIES_BY_PROCESS = {}
+
+class CompiledReactionLibrary(object):
+    """
+    This class holds precompiled versions of a reaction library and its
+    functional groups. Every reaction SMARTS is converted to an initialized
+    rdkit ChemicalReaction and every functional group SMARTS is converted to
+    a query mol once, rather than reparsing them for every ligand and every
+    reaction attempt.
+    """
+
+    def __init__(self, reaction_dict, functional_group_dict):
+        """
+        init for CompiledReactionLibrary.
+
+        Inputs:
+        :param dict reaction_dict: A dictionary containing all the reactions
+            and all the information required to run the reaction. This is
+            SmilesClickChem.reaction_dict
+        :param dict functional_group_dict: A dictionary containing all SMARTS
+            for identifying the functional groups. This is
+            SmilesClickChem.functional_group_dict
+        """
+        self.reaction_dict = reaction_dict
+        self.functional_group_dict = functional_group_dict
+        self.compile_library()
+
+    def __getstate__(self):
+        """
+        rdkit query mols do not reliably survive pickling, so only the SMARTS
+        dictionaries are pickled. The library is recompiled by the process
+        which unpickles it unless that process has already compiled it.
+
+        Returns:
+        :returns: dict state: the picklable state of the library
+        """
+        return {
+            "reaction_dict": self.reaction_dict,
+            "functional_group_dict": self.functional_group_dict,
+        }
+
+    def __setstate__(self, state):
+        """
+        Restore and recompile a library from its pickled state.
+
+        Inputs:
+        :param dict state: the picklable state of the library
+        """
+        self.reaction_dict = state["reaction_dict"]
+        self.functional_group_dict = state["functional_group_dict"]
+
+        cache_key = json.dumps(state, sort_keys=True)
+        if cache_key in COMPILED_LIBRARIES_BY_PROCESS:
+            (
+                self.functional_group_mols,
+                self.reactions_by_name,
+                self.reactions_by_num,
+            ) = COMPILED_LIBRARIES_BY_PROCESS[cache_key]
+            return
+
+        self.compile_library()
+        COMPILED_LIBRARIES_BY_PROCESS[cache_key] = (
+            self.functional_group_mols,
+            self.reactions_by_name,
+            self.reactions_by_num,
+        )
+
+    def compile_library(self):
+        """
+        Compile every functional group into a query mol and every reaction
+        into an initialized rdkit ChemicalReaction. Reactions are keyed by
+        both their name and their RXN_NUM.
+        """
+        self.functional_group_mols = {}
+        for group_name in self.functional_group_dict.keys():
+            group_smarts = self.functional_group_dict[group_name]
+            group_mol = Chem.MolFromSmarts(group_smarts)
+            if group_mol is None:
+                raise Exception(
+                    "Functional group {} has an invalid SMARTS: {}".format(
+                        group_name, group_smarts
+                    )
+                )
+            self.functional_group_mols[group_name] = group_mol
+
+        self.reactions_by_name = {}
+        self.reactions_by_num = {}
+        for reaction_name in self.reaction_dict.keys():
+            a_reaction_dict = self.reaction_dict[reaction_name]
+            try:
+                rxn = AllChem.ReactionFromSmarts(
+                    str(a_reaction_dict["reaction_string"])
+                )
+                rxn.Initialize()
+            except:
+                raise Exception(
+                    "Reaction {} has an invalid reaction SMARTS: {}".format(
+                        reaction_name, a_reaction_dict["reaction_string"]
+                    )
+                )
+            self.reactions_by_name[reaction_name] = rxn
+            if "RXN_NUM" in a_reaction_dict.keys():
+                self.reactions_by_num[str(a_reaction_dict["RXN_NUM"])] = rxn
+
+    def get_reaction(self, reaction_name):
+        """
+        Inputs:
+        :param str reaction_name: the name of a reaction in the library
+
+        Returns:
+        :returns: rdkit.Chem.rdChemReactions.ChemicalReaction rxn: the
+            initialized reaction object
+        """
+        return self.reactions_by_name[reaction_name]
+
+    def get_reaction_by_num(self, rxn_num):
+        """
+        Inputs:
+        :param str rxn_num: the RXN_NUM of a reaction in the library
+
+        Returns:
+        :returns: rdkit.Chem.rdChemReactions.ChemicalReaction rxn: the
+            initialized reaction object
+        """
+        return self.reactions_by_num[str(rxn_num)]
+
+    def get_functional_group_mol(self, group_name):
+        """
+        Inputs:
+        :param str group_name: the name of a functional group in the library
+
+        Returns:
+        :returns: rdkit.Chem.rdchem.Mol group_mol: the query mol for the
+            functional group
+        """
+        return self.functional_group_mols[group_name]
@@ -0,0 +1,494 @@
+"""ComplementaryMolStore Class"""
+import __future__
+
+import os
+import mmap
+import pickle
+import hashlib
+import random
+from array import array
+
+import rdkit
+from rdkit import Chem
+
+# Disable the unnecessary RDKit warnings
+rdkit.RDLogger.DisableLog("rdApp.*")
+
+# Name of the precomputed reactivity index which is looked for within a
+# complementary_mol_dir. It is built by
+# accessory_scripts/build_complementary_mol_index.py
+COMPLEMENTARY_MOL_INDEX_FILENAME = "complementary_mol_index.pkl"
+COMPLEMENTARY_MOL_INDEX_VERSION = 2
+
+# Groups loaded by this process. Keys are (filepaths, index_file) tuples and
+# items are the loaded_groups and loaded_index_groups of every store made
+# from those files. When the store is unpickled by a long-lived worker, ie a
+# persistent worker pool, it reuses the groups loaded for earlier jobs
+# rather than rereading and reindexing them for every job.
+LOADED_GROUPS_BY_PROCESS = {}
+
+# SHA-256 hashes of .smi files computed by this process. Keys are (path,
+# size, mtime in ns) tuples, so a file is only rehashed if it changes.
+SOURCE_FILE_HASHES = {}
+
+
+class ComplementaryMolStore(object):
+    """
+    This class holds the complementary molecule libraries used by
+    SmilesClickChem. Each functional group's .smi file is memory-mapped once
+    per process and indexed by line offsets. This allows a random
+    complementary molecule to be drawn in O(1) without rereading or
+    reparsing the file for every pick. Lines are only parsed into SMILES/name
+    records when they are drawn.
+
+    If a precomputed reactivity index is provided, groups found in the index
+    are sampled only from the index. Every molecule in the index has already
+    been sanitized, deprotanated and matched to its functional group, so
+    every draw is a valid reactant. A group is only sampled from the index if
+    its SMARTS and the contents of its .smi file are the same as when the
+    index was built.
+    """
+
+    def __init__(self, complementary_mols_dict, index_file=None,
+                 functional_group_dict=None):
+        """
+        init for ComplementaryMolStore. Files are not opened here. Each group
+        is loaded lazily the first time it is sampled, so a store which is
+        pickled to a worker process will load its files once in that worker.
+
+        Inputs:
+        :param dict complementary_mols_dict: a dictionary of complementary
+            molecules. Keys are the functional group names and items are the
+            paths to the .smi files for that group.
+        :param str index_file: the path to a precomputed reactivity index
+            made by accessory_scripts/build_complementary_mol_index.py or None
+            if there is no index.
+        :param dict functional_group_dict: Keys are the functional group
+            names and items are their SMARTS. Only groups whose SMARTS match
+            those the index was built with are sampled from the index. If
+            None no group is sampled from the index.
+        """
+        self.filepaths = dict(complementary_mols_dict)
+        self.index_file = index_file
+        if functional_group_dict is None:
+            functional_group_dict = {}
+        self.functional_group_dict = dict(functional_group_dict)
+
+        self.attach_loaded_groups()
+        self.load_index_header()
+
+    def __getstate__(self):
+        """
+        Only the file paths are pickled. The memory-mapped files and offsets
+        are rebuilt lazily by whichever process unpickles the store.
+
+        Returns:
+        :returns: dict state: the picklable state of the store
+        """
+        return {
+            "filepaths": self.filepaths,
+            "index_file": self.index_file,
+            "functional_group_dict": self.functional_group_dict,
+        }
+
+    def __setstate__(self, state):
+        """
+        Restore a store from its pickled state.
+
+        Inputs:
+        :param dict state: the picklable state of the store
+        """
+        self.filepaths = state["filepaths"]
+        self.index_file = state["index_file"]
+        self.functional_group_dict = state["functional_group_dict"]
+        self.attach_loaded_groups()
+        self.load_index_header()
+
+    def attach_loaded_groups(self):
+        """
+        Share the loaded groups with every other store in this process which
+        was made from the same files.
+
+        This sets:
+            self.loaded_groups: Keys are functional group names and items are
+                tuples of (memory-mapped file, array of line offsets)
+            self.loaded_index_groups: Keys are functional group names and
+                items are the loaded index records for that group
+        """
+        cache_key = (tuple(sorted(self.filepaths.items())), self.index_file)
+        if cache_key not in LOADED_GROUPS_BY_PROCESS:
+            LOADED_GROUPS_BY_PROCESS[cache_key] = ({}, {})
+
+        self.loaded_groups, self.loaded_index_groups = LOADED_GROUPS_BY_PROCESS[
+            cache_key
+        ]
+
+    def load_index_header(self):
+        """
+        Read the table of contents of the reactivity index. Only groups whose
+        SMARTS and .smi file are unchanged since the index was built are used
+        from the index. All other groups, or every group if the index is in an
+        older format, are sampled from their .smi files.
+        """
+        # Keys are functional group names and items are the table of contents
+        # entry for that group within the index file
+        self.indexed_groups = {}
+
+        if self.index_file is None:
+            return
+
+        header, data_start = read_complementary_mol_index_header(self.index_file)
+        self.index_data_start = data_start
+
+        if header.get("format_version") != COMPLEMENTARY_MOL_INDEX_VERSION:
+            print(
+                "The complementary molecule index is in an old format so every "
+                + "group will be sampled from its .smi file. Please rebuild it "
+                + "with accessory_scripts/build_complementary_mol_index.py: "
+                + "{}".format(self.index_file)
+            )
+            return
+
+        stale_groups = []
+        for group in header["groups"].keys():
+            if group not in self.filepaths:
+                continue
+            group_entry = header["groups"][group]
+            if group_entry["smarts"] != self.functional_group_dict.get(group):
+                stale_groups.append(group)
+                continue
+            if is_source_file_unchanged(self.filepaths[group], group_entry) is False:
+                stale_groups.append(group)
+                continue
+            self.indexed_groups[group] = group_entry
+
+        if len(stale_groups) != 0:
+            print(
+                "The complementary molecule index is out of date for the "
+                + "following groups. These will be sampled from their .smi "
+                + "files instead: {}".format(stale_groups)
+            )
+
+    def has_index(self, functional_group):
+        """
+        Inputs:
+        :param str functional_group: the name of the functional group
+
+        Returns:
+        :returns: bool bool: True if the group is sampled from the
+            reactivity index
+        """
+        return functional_group in self.indexed_groups
+
+    def load_index_group(self, functional_group):
+        """
+        Load the records of a single functional group from the reactivity
+        index.
+
+        Inputs:
+        :param str functional_group: the name of the functional group
+
+        Returns:
+        :returns: dict group_records: a dictionary with the lists "smiles",
+            "names", "mol_binaries", and "matched_groups" for every valid
+            molecule in the group
+        """
+        if functional_group in self.loaded_index_groups:
+            return self.loaded_index_groups[functional_group]
+
+        group_entry = self.indexed_groups[functional_group]
+        with open(self.index_file, "rb") as f:
+            f.seek(self.index_data_start + group_entry["offset"])
+            group_records = pickle.loads(f.read(group_entry["length"]))
+
+        self.loaded_index_groups[functional_group] = group_records
+        return group_records
+
+    def keys(self):
+        """
+        Returns:
+        :returns: list keys: the names of all functional groups in the store
+        """
+        return list(self.filepaths.keys())
+
+    def __contains__(self, functional_group):
+        """
+        Inputs:
+        :param str functional_group: the name of a functional group
+
+        Returns:
+        :returns: bool bool: True if the group is in the store
+        """
+        return functional_group in self.filepaths
+
+    def load_group(self, functional_group):
+        """
+        Memory-map a functional group's .smi file and index the offset of
+        the start of every non-blank line.
+
+        Inputs:
+        :param str functional_group: the name of the functional group
+
+        Returns:
+        :returns: tuple group_data: a tuple of the file contents (an mmap or
+            bytes object) and an array of line offsets
+        """
+        if functional_group in self.loaded_groups:
+            return self.loaded_groups[functional_group]
+
+        infile = self.filepaths[functional_group]
+        with open(infile, "rb") as f:
+            if os.path.getsize(infile) == 0:
+                data = b""
+            else:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        offsets = array("q")
+        data_length = len(data)
+        position = 0
+        while position < data_length:
+            line_end = data.find(b"\n", position)
+            if line_end == -1:
+                line_end = data_length
+            if data[position:line_end].strip() != b"":
+                offsets.append(position)
+            position = line_end + 1
+
+        group_data = (data, offsets)
+        self.loaded_groups[functional_group] = group_data
+        return group_data
+
+    def get_number_of_mols(self, functional_group):
+        """
+        Inputs:
+        :param str functional_group: the name of the functional group
+
+        Returns:
+        :returns: int number_of_mols: the number of molecules in the group
+        """
+        if self.has_index(functional_group):
+            return len(self.load_index_group(functional_group)["smiles"])
+
+        return len(self.load_group(functional_group)[1])
+
+    def get_mol_record(self, functional_group, index):
+        """
+        Parse a single line of a functional group's .smi file.
+
+        Inputs:
+        :param str functional_group: the name of the functional group
+        :param int index: the index of the molecule within the group
+
+        Returns:
+        :returns: list mol_record: list with the SMILES string and name of
+            the molecule. ie. ["cccc", "ZINC123"]
+        """
+        if self.has_index(functional_group):
+            group_records = self.load_index_group(functional_group)
+            return [group_records["smiles"][index], group_records["names"][index]]
+
+        data, offsets = self.load_group(functional_group)
+        start = offsets[index]
+        end = data.find(b"\n", start)
+        if end == -1:
+            end = len(data)
+
+        line = data[start:end].decode("utf-8")
+        parts = line.replace("\t", " ").split()
+
+        return [parts[0], parts[1]]
+
+    def get_random_mol(self, functional_group):
+        """
+        Draw a random molecule from a functional group's library.
+
+        Inputs:
+        :param str functional_group: the name of the functional group
+
+        Returns:
+        :returns: list mol_record: list with the SMILES string and name of
+            the randomly chosen molecule. ie. ["cccc", "ZINC123"]
+        """
+        number_of_mols = self.get_number_of_mols(functional_group)
+        if number_of_mols == 0:
+            raise Exception(
+                "The complementary molecule file for {} is empty: {}".format(
+                    functional_group, self.filepaths[functional_group]
+                )
+            )
+
+        return self.get_mol_record(
+            functional_group, random.randrange(number_of_mols)
+        )
+
+    def get_random_reactant(self, functional_group):
+        """
+        Draw a random prevalidated reactant from the reactivity index. The
+        mol has already been sanitized, deprotanated and matched to the
+        functional group, so it can be used directly in a reaction.
+
+        Inputs:
+        :param str functional_group: the name of the functional group. This
+            group must be in the reactivity index.
+
+        Returns:
+        :returns: list reactant: list with the SMILES string, name, and
+            rdkit.Chem.rdchem.Mol of the randomly chosen molecule. returns None
+            if the group has no valid molecules.
+        """
+        group_records = self.load_index_group(functional_group)
+        number_of_mols = len(group_records["smiles"])
+        if number_of_mols == 0:
+            return None
+
+        index = random.randrange(number_of_mols)
+        comp_mol = Chem.Mol(group_records["mol_binaries"][index])
+
+        return [group_records["smiles"][index], group_records["names"][index], comp_mol]
+
+
+def write_complementary_mol_index(index_file, index_by_group):
+    """
+    Write a reactivity index of complementary molecules. The file is a
+    pickled table of contents followed by one pickled block of records per
+    functional group, so a worker only needs to load the groups it samples.
+
+    Inputs:
+    :param str index_file: the path to the index file to write
+    :param dict index_by_group: Keys are functional group names. Items are
+        dictionaries with the lists "smiles", "names", "mol_binaries",
+        "matched_groups", the str "smarts" of the group, and the dict
+        "source_file" (the signature of the .smi file the group was built
+        from, made by get_source_file_signature).
+    """
+    group_blocks = []
+    header = {"format_version": COMPLEMENTARY_MOL_INDEX_VERSION, "groups": {}}
+    offset = 0
+    for group in index_by_group.keys():
+        group_info = index_by_group[group]
+        group_records = {
+            "smiles": group_info["smiles"],
+            "names": group_info["names"],
+            "mol_binaries": group_info["mol_binaries"],
+            "matched_groups": group_info["matched_groups"],
+        }
+        block = pickle.dumps(group_records, protocol=pickle.HIGHEST_PROTOCOL)
+        header["groups"][group] = {
+            "offset": offset,
+            "length": len(block),
+            "num_mols": len(group_info["smiles"]),
+            "smarts": group_info["smarts"],
+            "source_file": group_info["source_file"],
+        }
+        offset = offset + len(block)
+        group_blocks.append(block)
+
+    with open(index_file, "wb") as f:
+        pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+        for block in group_blocks:
+            f.write(block)
+
+
+def read_complementary_mol_index_header(index_file):
+    """
+    Read the table of contents of a reactivity index.
+
+    Inputs:
+    :param str index_file: the path to the index file
+
+    Returns:
+    :returns: dict header: the table of contents. header["groups"] is keyed
+        by functional group name.
+    :returns: int data_start: the byte offset where the group blocks start
+    """
+    with open(index_file, "rb") as f:
+        try:
+            header = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError,
+                ImportError, IndexError):
+            raise Exception(
+                "The complementary molecule index could not be read: {}".format(
+                    index_file
+                )
+            )
+        data_start = f.tell()
+
+    if type(header) != dict or "format_version" not in header.keys():
+        raise Exception(
+            "The complementary molecule index is not a supported format. "
+            + "Please rebuild it with "
+            + "accessory_scripts/build_complementary_mol_index.py: {}".format(
+                index_file
+            )
+        )
+
+    return header, data_start
+
+
+def get_source_file_signature(smi_file):
+    """
+    Get the signature of a .smi file which is saved in the reactivity index.
+
+    Inputs:
+    :param str smi_file: the path to the .smi file
+
+    Returns:
+    :returns: dict signature: the "size" in bytes, "mtime_ns" and "sha256"
+        hash of the contents of the file
+    """
+    stat = os.stat(smi_file)
+
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": get_source_file_hash(smi_file, stat),
+    }
+
+
+def get_source_file_hash(smi_file, stat):
+    """
+    Get the SHA-256 hash of the contents of a .smi file. The hash is
+    remembered by this process until the file's size or mtime changes.
+
+    Inputs:
+    :param str smi_file: the path to the .smi file
+    :param os.stat_result stat: the result of os.stat(smi_file)
+
+    Returns:
+    :returns: str sha256: the hex digest of the file
+    """
+    cache_key = (smi_file, stat.st_size, stat.st_mtime_ns)
+    if cache_key in SOURCE_FILE_HASHES:
+        return SOURCE_FILE_HASHES[cache_key]
+
+    file_hash = hashlib.sha256()
+    with open(smi_file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            file_hash.update(block)
+
+    SOURCE_FILE_HASHES[cache_key] = file_hash.hexdigest()
+    return SOURCE_FILE_HASHES[cache_key]
+
+
+def is_source_file_unchanged(smi_file, group_entry):
+    """
+    Check whether a .smi file has the same contents as when its group was
+    added to the reactivity index. The file is only hashed if its size is the
+    same but its mtime is not (ie it was copied), so an unchanged file is
+    checked without being read.
+
+    Inputs:
+    :param str smi_file: the path to the .smi file
+    :param dict group_entry: the table of contents entry of the group
+
+    Returns:
+    :returns: bool bool: True if the file is unchanged
+    """
+    signature = group_entry["source_file"]
+    stat = os.stat(smi_file)
+    if stat.st_size != signature["size"]:
+        return False
+    if stat.st_mtime_ns == signature["mtime_ns"]:
+        return True
+
+    return get_source_file_hash(smi_file, stat) == signature["sha256"]
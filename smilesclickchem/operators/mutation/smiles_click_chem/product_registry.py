@@ -0,0 +1,164 @@
+"""ProductRegistry Class"""
+import __future__
+
+import rdkit
+from rdkit import Chem
+
+# Disable the unnecessary RDKit warnings
+rdkit.RDLogger.DisableLog("rdApp.*")
+
+
+class ProductRegistry(object):
+    """
+    This class tracks every product made via mutation within a generation.
+    Products are held in a set so checking whether a product has already been
+    made is O(1) rather than a scan of every product made so far.
+
+    It also allocates collision-free IDs for new products from a counter,
+    rather than retrying random numbers until an unused one is found.
+
+    By default products are deduplicated by their SMILES string. If
+    dedup_by_inchikey is True they are deduplicated by their InChIKey, so
+    different SMILES of the same compound (ie. from different reaction paths)
+    count as the same product.
+    """
+
+    def __init__(self, generation_num, list_of_already_made_smiles=None,
+                 dedup_by_inchikey=False):
+        """
+        init for ProductRegistry.
+
+        Inputs:
+        :param int generation_num: the generation number used in new IDs
+        :param list list_of_already_made_smiles: a list of lists. Each
+            sublist contains info about a smiles made in this generation via
+            mutation ie.[['O=C([O-])',
+            '(Gen_3_Mutant_37_747+ZINC51)Gen_4_Mutant_15_52']]. Can be None.
+        :param bool dedup_by_inchikey: if True products are deduplicated by
+            InChIKey rather than by SMILES string
+        """
+        self.generation_num = generation_num
+        self.dedup_by_inchikey = dedup_by_inchikey
+
+        # Set of the dedup keys (SMILES or InChIKeys) of every product
+        self.product_keys = set([])
+
+        # Set of the short IDs (the part of an ID after the last ")") of
+        # every product. PDB files are named by short ID so these must be
+        # unique.
+        self.short_ids = set([])
+
+        # The number used in the next new ID
+        self.id_counter = 1
+
+        if list_of_already_made_smiles is not None:
+            self.add_products(list_of_already_made_smiles)
+
+    def get_product_key(self, smiles_string, mol=None):
+        """
+        Get the key used to deduplicate a product.
+
+        Inputs:
+        :param str smiles_string: the SMILES string of the product
+        :param rdkit.Chem.rdchem.Mol mol: an rdkit mol of the product. This
+            is optional and saves reparsing the SMILES in InChIKey mode.
+
+        Returns:
+        :returns: str product_key: the InChIKey of the product if
+            dedup_by_inchikey is True and the InChIKey can be made; otherwise
+            the SMILES string
+        """
+        if self.dedup_by_inchikey is False:
+            return smiles_string
+
+        if mol is None:
+            mol = Chem.MolFromSmiles(smiles_string)
+        if mol is None:
+            return smiles_string
+
+        try:
+            inchikey = Chem.MolToInchiKey(mol)
+        except:
+            inchikey = ""
+        if inchikey == "":
+            return smiles_string
+
+        return inchikey
+
+    def is_already_made(self, smiles_string, mol=None):
+        """
+        Inputs:
+        :param str smiles_string: the SMILES string of the product
+        :param rdkit.Chem.rdchem.Mol mol: an rdkit mol of the product. This
+            is optional.
+
+        Returns:
+        :returns: bool bool: True if the product has already been made
+        """
+        return self.get_product_key(smiles_string, mol) in self.product_keys
+
+    def add_product(self, smiles_string, lig_id=None):
+        """
+        Record a product as made.
+
+        Inputs:
+        :param str smiles_string: the SMILES string of the product
+        :param str lig_id: the ID of the product or None if it has no ID yet
+        """
+        self.product_keys.add(self.get_product_key(smiles_string))
+        if lig_id is not None:
+            self.short_ids.add(lig_id.split(")")[-1])
+
+    def add_products(self, list_of_new_ligands):
+        """
+        Record many products as made.
+
+        Inputs:
+        :param list list_of_new_ligands: a list of lists. Each sublist
+            contains the SMILES string and the ID of a product
+        """
+        for ligand_info in list_of_new_ligands:
+            self.add_product(ligand_info[0], ligand_info[1])
+
+    def make_new_id(self, parent_lig_id, reaction_id_number, zinc_id_comp_mol):
+        """
+        Make a unique ID for a new product. The ID is the ID of the parent
+        mol (and complementary mol if there was one), followed by the
+        generation number, the reaction number, and a unique number.
+        ie. (Gen_3_Mutant_37_747+ZINC51)Gen_4_Mutant_15_52
+
+        Inputs:
+        :param str parent_lig_id: the ID of the parent mol
+        :param str reaction_id_number: the number of the reaction used
+        :param str zinc_id_comp_mol: the ID of the complementary mol or None
+            if there was none
+
+        Returns:
+        :returns: str new_lig_id: the new unique ID
+        """
+        # get the unique ID (last few diget ID of the parent mol
+        parent_lig_id = parent_lig_id.split(")")[-1]
+
+        short_id = "Gen_{}_Mutant_{}_{}".format(
+            self.generation_num, reaction_id_number, self.id_counter
+        )
+        while short_id in self.short_ids:
+            self.id_counter = self.id_counter + 1
+            short_id = "Gen_{}_Mutant_{}_{}".format(
+                self.generation_num, reaction_id_number, self.id_counter
+            )
+        self.id_counter = self.id_counter + 1
+
+        if zinc_id_comp_mol is None:
+            new_lig_id = "({}){}".format(parent_lig_id, short_id)
+        else:
+            new_lig_id = "({}+{}){}".format(parent_lig_id, zinc_id_comp_mol, short_id)
+
+        return new_lig_id
+
+    def get_number_of_products(self):
+        """
+        Returns:
+        :returns: int number_of_products: the number of unique products
+        """
+        return len(self.product_keys)
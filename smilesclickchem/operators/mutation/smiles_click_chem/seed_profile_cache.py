@@ -0,0 +1,152 @@
+"""SeedProfile and SeedProfileCache Classes"""
+import __future__
+
+from collections import OrderedDict
+
+import rdkit
+from rdkit import Chem
+
+# Disable the unnecessary RDKit warnings
+rdkit.RDLogger.DisableLog("rdApp.*")
+
+# The max number of seed profiles held by each SmilesClickChem object
+SEED_PROFILE_CACHE_SIZE = 50000
+
+
+class SeedProfile(object):
+    """
+    This class holds everything SmilesClickChem.run_smiles_click needs to
+    know about a seed before it picks a reaction: the sanitized deprotanated
+    and reprotanated mols of the seed, which functional groups it has and
+    which reactions it can take part in.
+
+    The mols are stored as rdkit binaries. Each call of get_mol_deprotanated
+    or get_mol_reprotanated returns a new mol, so a reaction may alter it.
+
+    Functional groups are stored as bitmasks, with bit i set for the i-th
+    functional group of the reaction library.
+    """
+
+    def __init__(self, mol_deprotanated, mol_reprotanated, functional_group_mask,
+                 deprotanated_group_mask, reactant_positions):
+        """
+        init for SeedProfile.
+
+        Inputs:
+        :param rdkit.Chem.rdchem.Mol mol_deprotanated: the sanitized and
+            deprotanated mol of the seed or None if the seed failed to
+            sanitize
+        :param rdkit.Chem.rdchem.Mol mol_reprotanated: the sanitized and
+            fully protanated mol of the seed or None if the seed failed to
+            sanitize
+        :param int functional_group_mask: bitmask of the functional groups
+            found in either form of the seed
+        :param int deprotanated_group_mask: bitmask of the functional groups
+            found in the deprotanated form of the seed
+        :param dict reactant_positions: keys are the names of the reactions
+            the seed can take part in and items are the index of the
+            reactant the seed is used as
+        """
+        if mol_deprotanated is None or mol_reprotanated is None:
+            self.mol_deprotanated_binary = None
+            self.mol_reprotanated_binary = None
+        else:
+            self.mol_deprotanated_binary = mol_deprotanated.ToBinary()
+            self.mol_reprotanated_binary = mol_reprotanated.ToBinary()
+
+        self.functional_group_mask = functional_group_mask
+        self.deprotanated_group_mask = deprotanated_group_mask
+        self.reactant_positions = reactant_positions
+
+    def has_reactions(self):
+        """
+        Returns:
+        :returns: bool bool: True if the seed can take part in any reaction
+        """
+        return len(self.reactant_positions) != 0
+
+    def get_reactant_position(self, reaction_name):
+        """
+        Inputs:
+        :param str reaction_name: the name of a reaction
+
+        Returns:
+        :returns: int reactant_position: the index of the reactant the seed
+            is used as in the reaction or None if the seed can not take part
+            in the reaction
+        """
+        return self.reactant_positions.get(reaction_name)
+
+    def is_in_deprotanated_form(self, group_index):
+        """
+        Inputs:
+        :param int group_index: the index of a functional group
+
+        Returns:
+        :returns: bool bool: True if the functional group is found in the
+            deprotanated form of the seed
+        """
+        return (self.deprotanated_group_mask >> group_index) & 1 == 1
+
+    def get_mol_deprotanated(self):
+        """
+        Returns:
+        :returns: rdkit.Chem.rdchem.Mol mol: a new copy of the deprotanated
+            mol of the seed
+        """
+        return Chem.Mol(self.mol_deprotanated_binary)
+
+    def get_mol_reprotanated(self):
+        """
+        Returns:
+        :returns: rdkit.Chem.rdchem.Mol mol: a new copy of the reprotanated
+            mol of the seed
+        """
+        return Chem.Mol(self.mol_reprotanated_binary)
+
+
+class SeedProfileCache(object):
+    """
+    This class is a bounded LRU cache of SeedProfiles keyed by the SMILES
+    string of the seed. The same seed is drawn many times while a generation
+    is made, and its profile only needs to be made once.
+    """
+
+    def __init__(self, max_entries=SEED_PROFILE_CACHE_SIZE):
+        """
+        init for SeedProfileCache.
+
+        Inputs:
+        :param int max_entries: the max number of profiles held
+        """
+        self.max_entries = max_entries
+        self.profiles = OrderedDict()
+
+    def get(self, smiles_string):
+        """
+        Inputs:
+        :param str smiles_string: the SMILES string of a seed
+
+        Returns:
+        :returns: SeedProfile seed_profile: the profile of the seed or None
+            if it is not in the cache
+        """
+        seed_profile = self.profiles.get(smiles_string)
+        if seed_profile is not None:
+            self.profiles.move_to_end(smiles_string)
+
+        return seed_profile
+
+    def put(self, smiles_string, seed_profile):
+        """
+        Add the profile of a seed, evicting the least recently used profile
+        if the cache is full.
+
+        Inputs:
+        :param str smiles_string: the SMILES string of the seed
+        :param SeedProfile seed_profile: the profile of the seed
+        """
+        self.profiles[smiles_string] = seed_profile
+        self.profiles.move_to_end(smiles_string)
+        while len(self.profiles) > self.max_entries:
+            self.profiles.popitem(last=False)
@@ -15,13 +15,27 @@ rdkit.RDLogger.DisableLog("rdApp.*")
 
 import smilesclickchem.operators.convert_files.gypsum_dl.gypsum_dl.MolObjectHandling as MOH
 import smilesclickchem.operators.filter.execute_filters as Filter
+from smilesclickchem.operators.mutation.smiles_click_chem.complementary_mol_store import (
+    ComplementaryMolStore,
+    COMPLEMENTARY_MOL_INDEX_FILENAME,
+)
+from smilesclickchem.operators.mutation.smiles_click_chem.compiled_reaction_library import (
+    CompiledReactionLibrary,
+)
+from smilesclickchem.operators.mutation.smiles_click_chem.product_registry import (
+    ProductRegistry,
+)
+from smilesclickchem.operators.mutation.smiles_click_chem.seed_profile_cache import (
+    SeedProfile,
+    SeedProfileCache,
+)
 
 
 class SmilesClickChem(object):
     """    This class will take a molecule and Mutate it by reacting it.    """
 
     def __init__(self, rxn_library_variables, list_of_already_made_smiles,
-                 filter_object_dict):
+                 filter_object_dict, dedup_by_inchikey=False):
         """
         init for SmilesClickChem. This will set up all the reaction and
         functional dictionaries required to Mutate a molecular
@@ -39,6 +53,8 @@ class SmilesClickChem(object):
             '(Gen_3_Mutant_37_747+ZINC51)Gen_4_Mutant_15_52']]
         :param dict filter_object_dict: a dictionary of all filter objects
             which are to be applied to the newly created ligands.
+        :param bool dedup_by_inchikey: if True products are deduplicated by
+            InChIKey rather than by SMILES string
         """
 
         # Unpackage the rxn_library_variables
@@ -61,8 +77,27 @@ class SmilesClickChem(object):
             rxn_library, complementary_mol_dir
         )
 
-        # List of already predicted smiles
-        self.list_of_already_made_smiles = [x[0] for x in list_of_already_made_smiles]
+        # Compile all reaction and functional group SMARTS once. This object
+        # is shared with the workers rather than reparsing the SMARTS for
+        # every reaction attempt.
+        self.compiled_reaction_library = CompiledReactionLibrary(
+            self.reaction_dict, self.functional_group_dict
+        )
+
+        # The functional groups in the order of the bits of the functional
+        # group bitmasks of the SeedProfiles
+        self.functional_group_names = list(self.functional_group_dict.keys())
+
+        # Profiles of the seeds already seen by this object, so each seed is
+        # sanitized, protanated and searched for functional groups once
+        self.seed_profile_cache = SeedProfileCache()
+
+        # Registry of already predicted smiles. Only the SMILES are tracked
+        # here; IDs are allocated by the main process in make_mutants
+        self.product_registry = ProductRegistry(
+            None, dedup_by_inchikey=dedup_by_inchikey
+        )
+        self.update_list_of_already_made_smiles(list_of_already_made_smiles)
         # Dictionary containing all Filter class
         # objects to be impossed on the ligand
         self.filter_object_dict = filter_object_dict
@@ -78,8 +113,8 @@ class SmilesClickChem(object):
             ie. [['O=C([O-])',
             '(Gen_3_Mutant_37_747+ZINC51)Gen_4_Mutant_15_52']]
         """
-        list_of_already_made_smiles = [x[0] for x in list_of_already_made_smiles]
-        self.list_of_already_made_smiles.extend(list_of_already_made_smiles)
+        for smiles_info in list_of_already_made_smiles:
+            self.product_registry.add_product(smiles_info[0])
 
     def rxn_lib_format_json_dict_of_dict(self, old_dict):
         """
@@ -410,6 +445,10 @@ class SmilesClickChem(object):
         groups. The sorting of a .smi file into this should be handled in the
         user parameter testing when autogrow is initially started.
 
+        If the complementary_mol_dir contains a reactivity index (built by
+        accessory_scripts/build_complementary_mol_index.py) it will be used to
+        sample only prevalidated reactants.
+
         Inputs:
         :param str rxn_library: A string defining the choice of the reaction
             library. ClickChem uses the set of reactions from Autogrow 3.1.2.
@@ -421,7 +460,8 @@ class SmilesClickChem(object):
             rxn_library
 
         Returns:
-        :returns: dict complementary_mols_dict: a dictionary of complementary molecules
+        :returns: ComplementaryMolStore complementary_mol_store: an indexed
+            store of the complementary molecules for every functional group
         """
         script_dir = os.path.dirname(os.path.realpath(__file__))
 
@@ -494,7 +534,15 @@ class SmilesClickChem(object):
                 missing_smi_files,
             )
 
-        return complementary_mols_dict
+        index_file = "{}{}{}".format(
+            complementary_mol_dir, os.sep, COMPLEMENTARY_MOL_INDEX_FILENAME
+        )
+        if os.path.isfile(index_file) is False:
+            index_file = None
+
+        return ComplementaryMolStore(
+            complementary_mols_dict, index_file, self.functional_group_dict
+        )
 
     def make_reactant_order_list(self, substructure_search_result,
                                  has_substructure_matches_count):
@@ -556,26 +604,9 @@ class SmilesClickChem(object):
         :returns: list random_comp_mol: list with the SMILES string and name
             of molecule for the randomly chosen comp mol
         """
-        infile = self.complementary_mol_dict[functional_group]
-
-        with open(infile, "r") as f:
-            random_comp_mol_line = random.choice(f.readlines())
-            random_comp_mol_line = (
-                random_comp_mol_line.replace("\n", "")
-                .replace("\t", " ")
-                .replace("    ", " ")
-            )
-            for i in range(10):
-                random_comp_mol_line.replace("  ", " ")
-            parts = random_comp_mol_line.split(
-                " "
-            )  # split line into parts separated by 4-spaces
-            # parts = [x for x in random_comp_mol_line.split(" ") if x!= ""]
-            # # split line into parts separated by 4-spaces
-
-            smile_list = parts[0]
-            zinc_name_list = parts[1]
-            random_comp_mol = [smile_list, zinc_name_list]
+        random_comp_mol = self.complementary_mol_dict.get_random_mol(
+            functional_group
+        )
 
         return random_comp_mol
 
@@ -598,9 +629,10 @@ class SmilesClickChem(object):
         """
         list_subs_within_mol = []
         functional_group_dict = self.functional_group_dict
+        compiled_reaction_library = self.compiled_reaction_library
 
         for key in list(functional_group_dict.keys()):
-            substructure = Chem.MolFromSmarts(functional_group_dict[key])
+            substructure = compiled_reaction_library.get_functional_group_mol(key)
             if mol_reprotanated.HasSubstructMatch(substructure):
                 list_subs_within_mol.append(key)
             else:
@@ -610,50 +642,74 @@ class SmilesClickChem(object):
                     continue
         return list_subs_within_mol
 
-    def run_smiles_click(self, ligand_smiles_string):
+    def get_seed_profile(self, ligand_smiles_string):
         """
-        This will take the shuffled list of reaction names
-        (self.shuffled_reaction_list) and test the Ligand to see if it is
-        capable of being used in the reaction. If the ligand is unable to be
-        used in the reaction, then we move on to the next reaction in the
-        list. If none work, we return a  None.
+        Get the SeedProfile of a seed, making it if it is not in the
+        seed_profile_cache.
 
         Inputs:
-        :param str ligand_smiles_string: SMILES string of a molecule to be
-            reacted
+        :param str ligand_smiles_string: SMILES string of a seed
 
         Returns:
-        :returns: list product_info: list containing the reaction product, the
-            id_number of the reaction as found in the reaction_dict and the id for
-            the complementary mol (None if it was a single reactant reaction)
-            [reaction_product_smilestring, reaction_id_number,
-            zinc_database_comp_mol_name]. returns None if all reactions failed or
-            input failed to convert to a sanitizable rdkit mol.
+        :returns: SeedProfile seed_profile: the profile of the seed
         """
+        seed_profile = self.seed_profile_cache.get(ligand_smiles_string)
+        if seed_profile is None:
+            seed_profile = self.make_seed_profile(ligand_smiles_string)
+            self.seed_profile_cache.put(ligand_smiles_string, seed_profile)
+
+        return seed_profile
+
+    def seed_has_reactions(self, ligand_smiles_string):
+        """
+        Inputs:
+        :param str ligand_smiles_string: SMILES string of a seed
+
+        Returns:
+        :returns: bool bool: True if the seed sanitizes and can take part in
+            any reaction of the library
+        """
+        return self.get_seed_profile(ligand_smiles_string).has_reactions()
+
+    def make_seed_profile(self, ligand_smiles_string):
+        """
+        Make the SeedProfile of a seed. The seed is sanitized, reprotanated
+        and deprotanated, its functional groups are found, and the reactions
+        it can take part in are listed.
+
+        Inputs:
+        :param str ligand_smiles_string: SMILES string of a seed
+
+        Returns:
+        :returns: SeedProfile seed_profile: the profile of the seed. It has no
+            reactions if the seed failed to sanitize or has no functional
+            group of any reaction.
+        """
+        failed_profile = SeedProfile(None, None, 0, 0, {})
         try:
             mol = Chem.MolFromSmiles(
                 ligand_smiles_string, sanitize=False
             )  # This is the input molecule which serves as the parent molecule
         except:
             # mol object failed to initialize
-            return None
+            return failed_profile
 
         # try sanitizing, which is necessary later
         mol = MOH.check_sanitization(mol)
         if mol is None:
-            return None
+            return failed_profile
 
         # Is important for some functional groups while being deprotanated are
         # useful for other reaction
         mol_reprotanated = copy.deepcopy(mol)
         mol_reprotanated = MOH.try_reprotanation(mol_reprotanated)
         if mol_reprotanated is None:
-            return None
+            return failed_profile
 
         mol_deprotanated = copy.deepcopy(mol)
         mol_deprotanated = MOH.try_deprotanation(mol_deprotanated)
         if mol_deprotanated is None:
-            return None
+            return failed_profile
 
         # Determine which functional groups are within a ligand
         list_subs_within_mol = self.determine_functional_groups_in_mol(
@@ -665,6 +721,59 @@ class SmilesClickChem(object):
                     ligand_smiles_string
                 )
             )
+            return failed_profile
+
+        functional_group_mask = 0
+        deprotanated_group_mask = 0
+        for group_name in list_subs_within_mol:
+            group_index = self.functional_group_names.index(group_name)
+            functional_group_mask = functional_group_mask | (1 << group_index)
+            substructure = self.compiled_reaction_library.get_functional_group_mol(
+                group_name
+            )
+            if mol_deprotanated.HasSubstructMatch(substructure) is True:
+                deprotanated_group_mask = deprotanated_group_mask | (1 << group_index)
+
+        # The seed is used as the first reactant of each reaction which has
+        # one of its functional groups
+        reactant_positions = {}
+        for reaction_name in self.reaction_dict.keys():
+            fun_groups_in_rxn = self.reaction_dict[reaction_name]["functional_groups"]
+            for i in range(0, len(fun_groups_in_rxn)):
+                if fun_groups_in_rxn[i] in list_subs_within_mol:
+                    reactant_positions[reaction_name] = i
+                    break
+
+        return SeedProfile(
+            mol_deprotanated,
+            mol_reprotanated,
+            functional_group_mask,
+            deprotanated_group_mask,
+            reactant_positions,
+        )
+
+    def run_smiles_click(self, ligand_smiles_string):
+        """
+        This will take the shuffled list of reaction names
+        (self.shuffled_reaction_list) and test the Ligand to see if it is
+        capable of being used in the reaction. If the ligand is unable to be
+        used in the reaction, then we move on to the next reaction in the
+        list. If none work, we return a  None.
+
+        Inputs:
+        :param str ligand_smiles_string: SMILES string of a molecule to be
+            reacted
+
+        Returns:
+        :returns: list product_info: list containing the reaction product, the
+            id_number of the reaction as found in the reaction_dict and the id for
+            the complementary mol (None if it was a single reactant reaction)
+            [reaction_product_smilestring, reaction_id_number,
+            zinc_database_comp_mol_name]. returns None if all reactions failed or
+            input failed to convert to a sanitizable rdkit mol.
+        """
+        seed_profile = self.get_seed_profile(ligand_smiles_string)
+        if seed_profile.has_reactions() is False:
             return None
 
         shuffled_reaction_list = self.rand_key_list(
@@ -681,17 +790,10 @@ class SmilesClickChem(object):
             a_reaction_dict = self.reaction_dict[reaction_name]
 
             fun_groups_in_rxn = a_reaction_dict["functional_groups"]
-            contains_group = None
-            for i in range(0, len(fun_groups_in_rxn)):
-                if fun_groups_in_rxn[i] in list_subs_within_mol:
-                    contains_group = i
-                    # The number i which contains_group is now equal to will
-                    # be used to remember the placement of the molecule later
-                    # in the reaction.
-                    break
-
-                continue
 
+            # The number contains_group will be used to remember the placement
+            # of the molecule later in the reaction.
+            contains_group = seed_profile.get_reactant_position(reaction_name)
             if contains_group is None:
                 # Reaction doesn't contain a functional group found in the
                 # reactant molecule. So lets move on to the next molecule
@@ -700,18 +802,15 @@ class SmilesClickChem(object):
 
             # Determine whether to react using the protanated or
             # deprotanated form of the ligand
-            substructure = Chem.MolFromSmarts(
-                self.functional_group_dict[fun_groups_in_rxn[i]]
+            group_index = self.functional_group_names.index(
+                fun_groups_in_rxn[contains_group]
             )
-
-            if mol_deprotanated.HasSubstructMatch(substructure) is True:
-                mol_to_use = copy.deepcopy(mol_deprotanated)
+            if seed_profile.is_in_deprotanated_form(group_index) is True:
+                mol_to_use = seed_profile.get_mol_deprotanated()
             else:
-                mol_to_use = copy.deepcopy(mol_reprotanated)
-            substructure = None
+                mol_to_use = seed_profile.get_mol_reprotanated()
 
-            rxn = AllChem.ReactionFromSmarts(str(a_reaction_dict["reaction_string"]))
-            rxn.Initialize()
+            rxn = self.compiled_reaction_library.get_reaction(reaction_name)
 
             # if the reaction requires only a single reactant we will attempt
             # to run the reaction
@@ -787,10 +886,22 @@ class SmilesClickChem(object):
 
                         # Determine whether to react using the protanated or
                         # deprotanated form of the ligand
-                        substructure = Chem.MolFromSmarts(
-                            self.functional_group_dict[fun_groups_in_rxn[i]]
+                        substructure = self.compiled_reaction_library.get_functional_group_mol(
+                            fun_groups_in_rxn[i]
                         )
 
+                        # If this group has a reactivity index every draw
+                        # is already a sanitized, deprotanated and matching
+                        # reactant
+                        if self.complementary_mol_dict.has_index(functional_group_name):
+                            comp_molecule = self.complementary_mol_dict.get_random_reactant(
+                                functional_group_name
+                            )
+                            if comp_molecule is not None:
+                                list_reactant_mols.append(comp_molecule[2])
+                                comp_mol_id.append(comp_molecule[1])
+                            continue
+
                         # lets give up to 100 tries to find a comp molecule
                         # which is viable
                         for find_mol_tries in range(0, 100):
@@ -937,10 +1048,16 @@ class SmilesClickChem(object):
         This function will test whether the product passes all of the
             requirements:
             1) Mol sanitizes
-            2) It isn't in the self.list_of_already_made_smiles
+            2) It isn't in the self.product_registry
             3) It passes Filters
         Returns the smile if it passes; returns None if it fails.
 
+        The product is sanitized once and then checked in place. Its SMILES
+        string is only made once it is a valid mol, and is used to check the
+        product_registry before the filters are run. The filters are run on
+        the sanitized mol rather than on a mol parsed again from the SMILES
+        string.
+
         Inputs:
         :param rdkit.Chem.rdchem.Mol reaction_product: an rdkit
             molecule to be checked.
@@ -952,6 +1069,7 @@ class SmilesClickChem(object):
         reaction_product = MOH.check_sanitization(reaction_product)
         if reaction_product is None:
             return None
+        sanitized_product = reaction_product
 
         # Remove any fragments incase 1 made it through
         reaction_product = MOH.handle_frag_check(reaction_product)
@@ -964,30 +1082,42 @@ class SmilesClickChem(object):
         if reaction_product is None:
             return None
 
-        reaction_product = MOH.try_reprotanation(reaction_product)
-        if reaction_product is None:
-            return None
-
-        # Remove H's
-        reaction_product = MOH.try_deprotanation(reaction_product)
-        if reaction_product is None:
-            return None
+        # Adding and removing H's resanitizes a fragment and turns any
+        # explicit H atoms into implicit H's. A product which was not
+        # fragmented and has no H atoms is already sanitized and would be
+        # left unchanged, so it skips this.
+        if (
+                reaction_product is not sanitized_product
+                or reaction_product.GetNumAtoms() != reaction_product.GetNumHeavyAtoms()
+        ):
+            reaction_product = MOH.try_reprotanation(reaction_product)
+            if reaction_product is None:
+                return None
 
-        reaction_product = MOH.check_sanitization(reaction_product)
-        if reaction_product is None:
-            return None
+            # Remove H's. This also sanitizes the mol
+            reaction_product = MOH.try_deprotanation(reaction_product)
+            if reaction_product is None:
+                return None
 
         # Check if product SMILE has been made before
         reaction_product_smilestring = Chem.MolToSmiles(
             reaction_product, isomericSmiles=True
         )
-        if reaction_product_smilestring in self.list_of_already_made_smiles:
+        if self.product_registry.is_already_made(
+                reaction_product_smilestring, reaction_product):
             return None
 
-        # Run through filters
-        pass_or_not = Filter.run_filter_on_just_smiles(
-            reaction_product_smilestring, self.filter_object_dict
-        )
+        # Run through filters. A SMILES string with an unspecified bond (~)
+        # may not read back in, so those products are still checked from
+        # their SMILES string.
+        if "~" in reaction_product_smilestring:
+            pass_or_not = Filter.run_filter_on_just_smiles(
+                reaction_product_smilestring, self.filter_object_dict
+            )
+        else:
+            pass_or_not = Filter.run_filter_on_just_smiles(
+                reaction_product_smilestring, self.filter_object_dict, reaction_product
+            )
         if pass_or_not is False:
             return None
         # passes
@@ -20,6 +20,11 @@ import smilesclickchem.operators.filter.execute_filters as Filter
 import smilesclickchem.operators.mutation.execute_mutations as Mutation
 import smilesclickchem.operators.convert_files.conversion_to_3d as conversion_to_3d
 import smilesclickchem.operators.convert_files.gypsum_dl.gypsum_dl.MolObjectHandling as MOH
+from smilesclickchem.operators.convert_files.sdf_shards import (
+    SDFShardReader,
+    SDF_SHARD_FOLDERNAME,
+)
+from smilesclickchem.operators.run_checkpoint import RunCheckpoint
 
 
 def get_usable_format(infile):
@@ -93,10 +98,15 @@ def populate_generation(vars):
     :returns: str full_generation_smiles_file: the name of the .smi file
         containing the new population
     :returns: list full_generation_smiles_list: list with the new population
-        of ligands
+        of ligands. In streaming mode (vars["streaming_chunk_size"] > 0) this
+        is the number of ligands made instead. See
+        populate_generation_streaming
     :returns: bool None: returns None twice if any step failed. This will
         result in the program ending
     """
+    if vars["streaming_chunk_size"] > 0:
+        return populate_generation_streaming(vars)
+
     number_of_processors = int(vars["number_of_processors"])
 
     # Determine which generation it is and how many mutations
@@ -124,61 +134,67 @@ def populate_generation(vars):
         vars["complementary_mol_directory"],
     ]
 
+    # Load the checkpoint if resuming. Otherwise start a new one
+    checkpoint = RunCheckpoint(vars["output_directory"], vars["resume"])
+    resuming = checkpoint.is_resuming()
+
+    seed_list = get_seed_list_from_checkpoint_or_source(vars, checkpoint)
+
     # List of SMILES from mutation
-    new_mutation_smiles_list = []
+    new_mutation_smiles_list = checkpoint.get_mutants()
 
-    seed_list = get_complete_list_prev_gen_or_source_compounds(vars)
-    # Save seed list
-    save_ligand_list(
-        vars["output_directory"],
-        seed_list,
-        "Seed_List",
-    )
+    if resuming is True:
+        checkpoint.restore_rng_state()
 
     seed_list_mutations = copy.deepcopy(seed_list)
 
-    # Make all the required ligands by mutations
-    while len(new_mutation_smiles_list) < num_mutations:
+    # The mutants are appended to this file and checkpointed after every
+    # batch, so a run which crashes during mutation keeps the mutants made so
+    # far. Rewriting it drops any lines written after the last checkpoint.
+    chosen_mutants_file = save_ligand_list(
+        vars["output_directory"],
+        new_mutation_smiles_list,
+        "Chosen_Mutants",
+    )
+
+    # Make all the required ligands by mutations. If a pass can't make
+    # enough, try once more.
+    num_passes = 0
+    while len(new_mutation_smiles_list) < num_mutations and num_passes < 2:
         sys.stdout.flush()
+        num_passes = num_passes + 1
 
         num_mutants_to_make = num_mutations - len(new_mutation_smiles_list)
 
-        # Make all mutants
-        new_mutants = Mutation.make_mutants(
+        # Batches of number_of_processors mutants, as make_mutants makes them
+        mutant_generator = Mutation.generate_mutants(
             vars,
             1,
-            number_of_processors,
             num_mutants_to_make,
             seed_list_mutations,
-            new_mutation_smiles_list,
+            list(new_mutation_smiles_list),
             rxn_library_variables,
+            number_of_processors,
         )
-        if new_mutants is None:
-            # try once more
-            new_mutants = Mutation.make_mutants(
-                vars,
-                1,
-                number_of_processors,
-                num_mutants_to_make,
-                seed_list_mutations,
-                new_mutation_smiles_list,
-                rxn_library_variables,
+        for new_mutants in mutant_generator:
+            # Remove Nones:
+            new_mutants = [x for x in new_mutants if x is not None]
+            new_mutants = new_mutants[
+                : num_mutations - len(new_mutation_smiles_list)
+            ]
+
+            with open(chosen_mutants_file, "a") as f:
+                for ligand_info in new_mutants:
+                    f.write("\t".join(ligand_info) + "\n")
+
+            new_mutation_smiles_list.extend(new_mutants)
+            checkpoint.record_mutants(
+                chosen_mutants_file, len(new_mutation_smiles_list)
             )
-
-        if new_mutants is None:
-            break
-
-        # Remove Nones:
-        new_mutants = [x for x in new_mutants if x is not None]
-
-        for i in new_mutants:
-            new_mutation_smiles_list.append(i)
-            if len(new_mutation_smiles_list) == num_mutations:
-                break
     sys.stdout.flush()
 
     # save new_mutation_smiles_list
-    save_ligand_list(
+    chosen_mutants_file = save_ligand_list(
         vars["output_directory"],
         new_mutation_smiles_list,
         "Chosen_Mutants",
@@ -201,6 +217,9 @@ def populate_generation(vars):
         raise Exception("Mutation failed to make enough new ligands.")
 
     print("FINISHED MAKING MUTATIONS")
+    checkpoint.record_mutants(
+        chosen_mutants_file, len(new_mutation_smiles_list), "conversion"
+    )
 
     sys.stdout.flush()
 
@@ -238,14 +257,27 @@ def populate_generation(vars):
     # original .smi file is saved as .smi.1.sdf and 2nd file is saved as
     # .smi.2.sdf
     if vars["convert_to_3D"] is True:
-        conversion_to_3d.convert_to_3d(vars, smiles_to_convert_file, new_gen_folder_path)
-        get_list_of_3D_SMILES(vars, new_generation_smiles_list)
+        if resuming is True:
+            # Skip ligands which finished 3D conversion before the restart
+            pdb_records_by_ligand = conversion_to_3d.convert_unfinished_to_3d(
+                vars, new_generation_smiles_list, new_gen_folder_path
+            )
+        else:
+            pdb_records_by_ligand = conversion_to_3d.convert_to_3d(
+                vars, smiles_to_convert_file, new_gen_folder_path
+            )
+        get_list_of_3D_SMILES(
+            vars, new_generation_smiles_list,
+            pdb_records_by_ligand=pdb_records_by_ligand
+        )
 
+    checkpoint.record_complete()
     sys.stdout.flush()
 
     return smiles_to_convert_file, full_generation_smiles_list
 
-def get_list_of_3D_SMILES(vars, new_generation_smiles_list):
+def get_list_of_3D_SMILES(vars, new_generation_smiles_list, append=False,
+                          pdb_records_by_ligand=None):
     """
     This will obtain and save the list of SMILES in the same order as
     found in NEW_SMILES.smi but with 3D variant information from PDBS.
@@ -255,11 +287,41 @@ def get_list_of_3D_SMILES(vars, new_generation_smiles_list):
     Inputs:
     :param dict vars: a dictionary of all user variables
     :param list new_generation_smiles_list: list of all 1/2D SMILES
+    :param bool append: if True the SMILES are appended to
+        New_SMILES_After_3D_Conversion.smi rather than overwriting it
+    :param dict pdb_records_by_ligand: the [SMILES, pose name] records
+        returned by the 3D conversion, keyed by the short name of each
+        ligand. Ligands in the records are not looked up in the PDBs folder.
+        Ligands missing from the records (ie those converted before a run was
+        resumed) are found by reading the header of their PDB files, or the
+        shard index if vars["output_format_3d"] is "sharded_sdf".
     """
+    if pdb_records_by_ligand is None:
+        pdb_records_by_ligand = {}
+
+    shard_reader = None
     list_of_3D_SMILES = []
     PDBs_dir = vars["output_directory"] + os.sep + "PDBs" + os.sep
     for mol_info in new_generation_smiles_list:
         short_id = mol_info[1].split(")")[-1]
+        if short_id in pdb_records_by_ligand:
+            for SMILES_string, base_info in pdb_records_by_ligand[short_id]:
+                list_of_3D_SMILES.append(
+                    "\t".join([SMILES_string, mol_info[1], base_info])
+                )
+            continue
+
+        if vars["output_format_3d"] == "sharded_sdf":
+            if shard_reader is None:
+                shard_reader = SDFShardReader(
+                    vars["output_directory"] + SDF_SHARD_FOLDERNAME
+                )
+            for SMILES_string, base_info in shard_reader.get_pose_records(short_id):
+                list_of_3D_SMILES.append(
+                    "\t".join([SMILES_string, mol_info[1], base_info])
+                )
+            continue
+
         pdb_files = glob.glob(PDBs_dir + short_id + "__*.pdb")
         pdb_files.sort()
         for pdb_pose in pdb_files:
@@ -270,13 +332,166 @@ def get_list_of_3D_SMILES(vars, new_generation_smiles_list):
             list_of_3D_SMILES.append("\t".join([SMILES_string, mol_info[1], base_info]))
 
     # Save all info to a .smi file
-    list_of_3D_SMILES = "\n".join(list_of_3D_SMILES)
-    with open(vars["output_directory"] +  "New_SMILES_After_3D_Conversion.smi", "w") as f:
-        f.write(list_of_3D_SMILES)
+    if append is True:
+        write_mode = "a"
+    else:
+        write_mode = "w"
+    with open(vars["output_directory"] +  "New_SMILES_After_3D_Conversion.smi", write_mode) as f:
+        for line in list_of_3D_SMILES:
+            f.write(line + "\n")
+
+def populate_generation_streaming(vars):
+    """
+    This will run all of the mutations and filters for a single generation
+    in streaming mode. Mutants are made in chunks of
+    vars["streaming_chunk_size"]. As each chunk is made it is appended to
+    Chosen_Mutants.smi and New_SMILES.smi and, if vars["convert_to_3D"], it
+    is converted to 3D. Only one chunk is held in memory at a time, and
+    downstream tools can start on the output files before mutation is
+    finished.
+
+    Inputs:
+    :param dict vars: a dictionary of all user variables
+
+    Returns:
+    :returns: str smiles_to_convert_file: the name of the .smi file
+        containing the new population
+    :returns: int num_made: the number of ligands made. The ligands are not
+        kept in memory in streaming mode.
+    """
+    num_mutations = vars["number_of_mutants"]
+    chunk_size = vars["streaming_chunk_size"]
+
+    print("MAKE MUTATIONS IN CHUNKS OF {}".format(chunk_size))
+
+    # Package user vars specifying the Reaction library to use for mutation
+    rxn_library_variables = [
+        vars["rxn_library"],
+        vars["rxn_library_file"],
+        vars["function_group_library"],
+        vars["complementary_mol_directory"],
+    ]
+
+    # Load the checkpoint if resuming. Otherwise start a new one
+    checkpoint = RunCheckpoint(vars["output_directory"], vars["resume"])
+    resuming = checkpoint.is_resuming()
+
+    seed_list = get_seed_list_from_checkpoint_or_source(vars, checkpoint)
+
+    # Mutants made before a restart. Empty if not resuming
+    list_of_made_ligands = checkpoint.get_mutants()
+
+    # Start the output files with the mutants made before a restart. Chunks
+    # are appended as they are made. Rewriting them drops any lines written
+    # after the last checkpoint.
+    chosen_mutants_file = save_ligand_list(
+        vars["output_directory"], list_of_made_ligands, "Chosen_Mutants"
+    )
+    smiles_to_convert_file, new_gen_folder_path = save_generation_smi(
+        vars["output_directory"],
+        list_of_made_ligands,
+        "New_SMILES",
+    )
+    if vars["convert_to_3D"] is True:
+        pdb_records_by_ligand = {}
+        if len(list_of_made_ligands) != 0:
+            pdb_records_by_ligand = conversion_to_3d.convert_unfinished_to_3d(
+                vars, list_of_made_ligands, new_gen_folder_path
+            )
+        get_list_of_3D_SMILES(
+            vars, list_of_made_ligands,
+            pdb_records_by_ligand=pdb_records_by_ligand
+        )
+
+    chunk_folder_path = new_gen_folder_path + "SMILES_Chunks" + os.sep
+    if os.path.isdir(chunk_folder_path) is False:
+        os.makedirs(chunk_folder_path)
+
+    if resuming is True:
+        checkpoint.restore_rng_state()
+
+    num_made = len(list_of_made_ligands)
+    first_chunk_num = (num_made + chunk_size - 1) // chunk_size
+
+    mutant_generator = Mutation.generate_mutants(
+        vars, 1, num_mutations - num_made, seed_list, list_of_made_ligands,
+        rxn_library_variables, chunk_size
+    )
+
+    for chunk_num, chunk_of_new_ligands in enumerate(mutant_generator, first_chunk_num):
+
+        for output_file in [chosen_mutants_file, smiles_to_convert_file]:
+            with open(output_file, "a") as f:
+                for ligand_info in chunk_of_new_ligands:
+                    f.write(ligand_info[0] + "\t" + ligand_info[1] + "\n")
+
+        num_made = num_made + len(chunk_of_new_ligands)
+        print("MADE {} OF {} MUTANTS".format(num_made, num_mutations))
+        checkpoint.record_mutants(chosen_mutants_file, num_made)
+        sys.stdout.flush()
+
+        if vars["convert_to_3D"] is True:
+            chunk_file, _ = save_generation_smi(
+                chunk_folder_path,
+                chunk_of_new_ligands,
+                "New_SMILES_Chunk_{}".format(chunk_num),
+            )
+            pdb_records_by_ligand = conversion_to_3d.convert_to_3d(
+                vars, chunk_file, new_gen_folder_path, only_new_sdfs=True
+            )
+            get_list_of_3D_SMILES(
+                vars, chunk_of_new_ligands, append=True,
+                pdb_records_by_ligand=pdb_records_by_ligand
+            )
+            sys.stdout.flush()
+
+    if num_made < num_mutations:
+        print("")
+        print("")
+        print("We needed to make {} ligands through Mutation".format(num_mutations))
+        print("We only made {} ligands through Mutation".format(num_made))
+        print("")
+        print("")
+        raise Exception("Mutation failed to make enough new ligands.")
+
+    print("FINISHED MAKING MUTATIONS")
+    checkpoint.record_complete()
+    sys.stdout.flush()
+
+    return smiles_to_convert_file, num_made
+
 
 #############
 # Get seeds
 #############
+def get_seed_list_from_checkpoint_or_source(vars, checkpoint):
+    """
+    Get the seed list from the checkpoint if resuming a run. Otherwise get it
+    from the source compounds, save it and checkpoint it.
+
+    Inputs:
+    :param dict vars: a dictionary of all user variables
+    :param RunCheckpoint checkpoint: the checkpoint of the run
+
+    Returns:
+    :returns: list seed_list: a list with SMILES strings, names, and
+        information about the smiles from the source compound list
+    """
+    if checkpoint.has_seeds():
+        return checkpoint.get_seed_list()
+
+    seed_list = get_complete_list_prev_gen_or_source_compounds(vars)
+    # Save seed list
+    seed_list_file = save_ligand_list(
+        vars["output_directory"],
+        seed_list,
+        "Seed_List",
+    )
+    checkpoint.record_seeds(seed_list_file, len(seed_list))
+
+    return seed_list
+
+
 def test_source_smiles_convert(smile_info):
     """
     This attempts to convert a SMILES string to an rdkit.Chem.rdchem.Mol
@@ -544,6 +759,9 @@ def save_ligand_list(output_directory, list_of_chosen_ligands, nomenclature_tag)
             mutations would be the list of mutations generated from the
             seeding_mutations list
         -ie. mutation, crossover
+
+    Returns:
+    :returns: str output_file_name: name of the output file
     """
 
     # make a folder for the Seed files
@@ -566,3 +784,4 @@ def save_ligand_list(output_directory, list_of_chosen_ligands, nomenclature_tag)
             output.write(output_line)
 
     sys.stdout.flush()
+    return output_file_name
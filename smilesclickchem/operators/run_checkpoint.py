@@ -0,0 +1,248 @@
+"""RunCheckpoint Class
+
+Keeps a checkpoint manifest in the Run folder so a run which dies (ie from a
+node preemption during 3D conversion) can be resumed with --resume.
+"""
+import __future__
+
+import os
+import json
+import random
+
+# Name of the checkpoint manifest within a Run folder
+CHECKPOINT_MANIFEST_FILENAME = "checkpoint.json"
+CHECKPOINT_MANIFEST_VERSION = 1
+
+
+class RunCheckpoint(object):
+    """
+    This class reads and writes the checkpoint manifest of a run.
+
+    The seed list and mutants are already saved as .smi files. The manifest
+    records how many entries of those files are complete, so large lists are
+    never rewritten into the manifest. It also records the stage the run had
+    reached and the state of the random number generator at the last
+    checkpoint.
+
+    Completed 3D conversion is not recorded in the manifest. It is determined
+    on resume by checking the 3D_SDFs and PDBs folders for the mutants listed
+    in the manifest.
+    """
+
+    def __init__(self, output_directory, resume=False):
+        """
+        init for RunCheckpoint. If resume is True and a manifest exists in the
+        output_directory it is loaded; otherwise a new manifest is started.
+
+        Inputs:
+        :param str output_directory: the Run folder
+        :param bool resume: if True load the existing manifest
+        """
+        self.output_directory = output_directory
+        self.manifest_file = output_directory + os.sep + CHECKPOINT_MANIFEST_FILENAME
+
+        self.manifest = None
+        if resume is True and os.path.exists(self.manifest_file):
+            self.manifest = read_checkpoint_manifest(self.manifest_file)
+            print("Resuming from checkpoint: {}".format(self.manifest_file))
+            print("\tStage: {}".format(self.manifest["stage"]))
+            print("\tSeeds: {}".format(self.manifest["num_seeds"]))
+            print("\tMutants: {}".format(self.manifest["num_mutants"]))
+
+        if self.manifest is None:
+            self.manifest = {
+                "format_version": CHECKPOINT_MANIFEST_VERSION,
+                "stage": "started",
+                "seed_list_file": None,
+                "num_seeds": 0,
+                "mutants_file": None,
+                "num_mutants": 0,
+                "rng_state": None,
+            }
+
+    def is_resuming(self):
+        """
+        Returns:
+        :returns: bool bool: True if any checkpoint past the start of the run
+            was loaded
+        """
+        return self.manifest["stage"] != "started"
+
+    def has_seeds(self):
+        """
+        Returns:
+        :returns: bool bool: True if the seed list was checkpointed
+        """
+        return self.manifest["seed_list_file"] is not None
+
+    def get_seed_list(self):
+        """
+        Load the checkpointed seed list.
+
+        Returns:
+        :returns: list seed_list: list of ligand/name pairs
+        """
+        return read_checkpointed_smi(
+            self.manifest["seed_list_file"], self.manifest["num_seeds"]
+        )
+
+    def get_mutants(self):
+        """
+        Load the checkpointed mutants. Any lines written to the file after
+        the last checkpoint are ignored.
+
+        Returns:
+        :returns: list list_of_mutants: list of ligand/name pairs
+        """
+        if self.manifest["mutants_file"] is None:
+            return []
+
+        return read_checkpointed_smi(
+            self.manifest["mutants_file"], self.manifest["num_mutants"]
+        )
+
+    def restore_rng_state(self):
+        """
+        Restore the state of the random number generator saved at the last
+        checkpoint.
+        """
+        rng_state = self.manifest["rng_state"]
+        if rng_state is None:
+            return
+        random.setstate((rng_state[0], tuple(rng_state[1]), rng_state[2]))
+
+    def record_seeds(self, seed_list_file, num_seeds):
+        """
+        Checkpoint the seed list.
+
+        Inputs:
+        :param str seed_list_file: the .smi file the seed list was saved to
+        :param int num_seeds: the number of seeds
+        """
+        self.manifest["stage"] = "mutation"
+        self.manifest["seed_list_file"] = seed_list_file
+        self.manifest["num_seeds"] = num_seeds
+        self.save()
+
+    def record_mutants(self, mutants_file, num_mutants, stage="mutation"):
+        """
+        Checkpoint the mutants made so far.
+
+        Inputs:
+        :param str mutants_file: the .smi file the mutants are saved to
+        :param int num_mutants: the number of complete lines in mutants_file
+        :param str stage: the stage the run is at. "mutation" if more mutants
+            are to be made or "conversion" if mutation is finished
+        """
+        self.manifest["stage"] = stage
+        self.manifest["mutants_file"] = mutants_file
+        self.manifest["num_mutants"] = num_mutants
+        self.save()
+
+    def record_complete(self):
+        """
+        Mark the run as complete.
+        """
+        self.manifest["stage"] = "complete"
+        self.save()
+
+    def save(self):
+        """
+        Save the manifest with the current random number generator state.
+        The manifest is written to a temporary file and then moved into place
+        so a run killed mid-write leaves the previous manifest intact.
+        """
+        rng_state = random.getstate()
+        self.manifest["rng_state"] = [rng_state[0], list(rng_state[1]), rng_state[2]]
+
+        temp_file = self.manifest_file + ".tmp"
+        with open(temp_file, "w") as f:
+            json.dump(self.manifest, f, indent=4)
+        os.replace(temp_file, self.manifest_file)
+
+
+def read_checkpoint_manifest(manifest_file):
+    """
+    Read a checkpoint manifest.
+
+    Inputs:
+    :param str manifest_file: the path to the manifest
+
+    Returns:
+    :returns: dict manifest: the manifest
+    """
+    with open(manifest_file) as f:
+        try:
+            manifest = json.load(f)
+        except:
+            raise Exception(
+                "The checkpoint manifest could not be read: {}".format(manifest_file)
+            )
+
+    if manifest.get("format_version") != CHECKPOINT_MANIFEST_VERSION:
+        raise Exception(
+            "The checkpoint manifest is not a supported format: {}".format(
+                manifest_file
+            )
+        )
+
+    return manifest
+
+
+def read_checkpointed_smi(smi_file, num_lines):
+    """
+    Read the first num_lines ligands of a checkpointed .smi file.
+
+    Inputs:
+    :param str smi_file: the path to the .smi file
+    :param int num_lines: the number of complete lines recorded in the
+        manifest
+
+    Returns:
+    :returns: list list_of_ligands: list of ligand/name pairs
+    """
+    list_of_ligands = []
+    if num_lines == 0:
+        return list_of_ligands
+
+    if os.path.exists(smi_file) is False:
+        raise Exception(
+            "A file recorded in the checkpoint manifest is missing: {}".format(
+                smi_file
+            )
+        )
+
+    with open(smi_file) as f:
+        for line in f:
+            if len(list_of_ligands) == num_lines:
+                break
+            parts = line.replace("\n", "").split("\t")
+            if len(parts) < 2:
+                continue
+            list_of_ligands.append(parts)
+
+    if len(list_of_ligands) < num_lines:
+        raise Exception(
+            "{} has fewer ligands than recorded in the checkpoint manifest".format(
+                smi_file
+            )
+        )
+
+    return list_of_ligands
+
+
+def has_unfinished_checkpoint(output_directory):
+    """
+    Inputs:
+    :param str output_directory: a Run folder
+
+    Returns:
+    :returns: bool bool: True if the Run folder has a checkpoint manifest for
+        a run which did not complete
+    """
+    manifest_file = output_directory + os.sep + CHECKPOINT_MANIFEST_FILENAME
+    if os.path.exists(manifest_file) is False:
+        return False
+
+    manifest = read_checkpoint_manifest(manifest_file)
+    return manifest["stage"] != "complete"
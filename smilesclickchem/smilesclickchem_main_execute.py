@@ -8,6 +8,16 @@ import __future__
 import sys
 
 import smilesclickchem.operators.operations as operations
+from smilesclickchem.operators.filter.filter_cache import (
+    install_filter_cache,
+    flush_filter_cache,
+)
+from smilesclickchem.operators.filter.filter_scheduler import (
+    FILTER_STATISTICS_FILENAME,
+    install_filter_statistics,
+    write_filter_statistics,
+    print_filter_statistics,
+)
 
 def main_execute(vars):
     """
@@ -29,10 +39,31 @@ def main_execute(vars):
 
     sys.stdout.flush()
 
+    # Give this process and every worker its own filter result cache
+    vars["parallelizer"].install_worker_state(
+        install_filter_cache,
+        (
+            vars["filter_cache_size"],
+            vars["filter_cache_file"],
+            vars["filter_cache_max_disk_entries"],
+        ),
+    )
+
+    # Every process appends the timing and rejection statistics of the
+    # filters it ran to a single file
+    filter_statistics_file = output_directory + FILTER_STATISTICS_FILENAME
+    vars["parallelizer"].install_worker_state(
+        install_filter_statistics, (filter_statistics_file,)
+    )
 
     smile_file_new_gen, new_gen_ligands_list = operations.populate_generation(vars)
     sys.stdout.flush()
 
+    # Write the filter results still held in memory to filter_cache_file
+    vars["parallelizer"].update_worker_state(flush_filter_cache, ())
+    vars["parallelizer"].update_worker_state(write_filter_statistics, ())
+    print_filter_statistics(filter_statistics_file)
+
     if new_gen_ligands_list is None:
         raise ValueError("Population failed to make enough mutants... \
                             Errors could include not enough diversity, too few seeds to the generation, \
@@ -159,7 +159,10 @@ def multiprocess_handling(vars):
         )
 
         vars["parallelizer"] = Parallelizer(
-            vars["multithread_mode"], vars["number_of_processors"], True
+            vars["multithread_mode"],
+            vars["number_of_processors"],
+            True,
+            persistent_pool=vars["persistent_worker_pool"],
         )
 
     return vars
@@ -369,10 +372,14 @@ def define_defaults():
     # processors
     vars["number_of_processors"] = 1
     vars["multithread_mode"] = "multithreading"
+    vars["persistent_worker_pool"] = False
 
     # Populations settings
     vars["filter_source_compounds"] = True
     vars["number_of_mutants"] = 10
+    vars["dedup_by_inchikey"] = False
+    vars["streaming_chunk_size"] = 0
+    vars["resume"] = False
 
     # Filters
     vars["LipinskiStrictFilter"] = False
@@ -386,6 +393,9 @@ def define_defaults():
     vars["BRENKFilter"] = False
     vars["No_Filters"] = False
     vars["alternative_filter"] = None
+    vars["filter_cache_size"] = 100000
+    vars["filter_cache_file"] = None
+    vars["filter_cache_max_disk_entries"] = 10000000
 
     # gypsum # max variance is the number of conformers made per ligand
     vars["convert_to_3D"] = True
@@ -395,6 +405,12 @@ def define_defaults():
     vars["max_ph"] = 8.4
     vars["pka_precision"] = 1.0
     vars["gypsum_timeout_limit"] = 10
+    vars["gypsum_batch_size"] = 1
+    vars["gypsum_tautomer_backend"] = "molvs"
+    vars["conformer_cache_file"] = None
+    vars["conformer_cache_max_size_mb"] = 1024
+    vars["output_format_3d"] = "pdb"
+    vars["ligands_per_shard"] = 1000
 
     return vars
 
@@ -645,6 +661,56 @@ def load_in_commandline_parameters(argv):
             option for rxn_library"
             )
 
+    if vars["streaming_chunk_size"] < 0:
+        raise ValueError(
+            "streaming_chunk_size must be 0 (to turn off streaming) or a \
+            positive int"
+        )
+
+    if vars["gypsum_batch_size"] < 1:
+        raise ValueError("gypsum_batch_size must be an int greater than 0.")
+
+    if vars["gypsum_tautomer_backend"] not in ["molvs", "rdkit"]:
+        raise ValueError("gypsum_tautomer_backend must be either molvs or rdkit.")
+    if vars["gypsum_tautomer_backend"] == "rdkit":
+        print(
+            "\nWARNING: gypsum_tautomer_backend is rdkit. This is faster but "
+            + "is not equivalent to the default molvs backend. Some ligands "
+            + "will get different tautomers, so 3D models may differ from a "
+            + "molvs run.\n"
+        )
+
+    if vars["conformer_cache_file"] is not None:
+        vars["conformer_cache_file"] = os.path.abspath(vars["conformer_cache_file"])
+        if os.path.isdir(os.path.dirname(vars["conformer_cache_file"])) is False:
+            raise ValueError(
+                "The directory of conformer_cache_file does not exist: {}".format(
+                    vars["conformer_cache_file"]
+                )
+            )
+    if vars["conformer_cache_max_size_mb"] <= 0:
+        raise ValueError("conformer_cache_max_size_mb must be greater than 0.")
+
+    if vars["filter_cache_size"] < 0:
+        raise ValueError(
+            "filter_cache_size must be 0 (to turn off the cache) or a positive int."
+        )
+    if vars["filter_cache_file"] is not None:
+        vars["filter_cache_file"] = os.path.abspath(vars["filter_cache_file"])
+        if os.path.isdir(os.path.dirname(vars["filter_cache_file"])) is False:
+            raise ValueError(
+                "The directory of filter_cache_file does not exist: {}".format(
+                    vars["filter_cache_file"]
+                )
+            )
+    if vars["filter_cache_max_disk_entries"] < 1:
+        raise ValueError("filter_cache_max_disk_entries must be an int greater than 0.")
+
+    if vars["output_format_3d"] not in ["pdb", "sharded_sdf"]:
+        raise ValueError("output_format_3d must be either pdb or sharded_sdf.")
+    if vars["ligands_per_shard"] < 1:
+        raise ValueError("ligands_per_shard must be an int greater than 0.")
+
     # Check if the Operating System is Windows, if so turn off Multiprocessing.
     if os.name == "nt" or os.name == "ce":
         # so it's running under windows. multiprocessing disabled
@@ -670,7 +736,9 @@ def load_in_commandline_parameters(argv):
     # Check if the user wants to continue a run or start a new run.
     # Make new run directory if necessary. return the Run folder path
     # The run folder path will be where we place our generations and output files
-    vars["output_directory"] = set_run_directory(vars["root_output_folder"])
+    vars["output_directory"] = set_run_directory(
+        vars["root_output_folder"], vars["resume"]
+    )
 
     # Save variables in vars dict to a .json file for later usage and reference
     # It saves the file to the output_directory + "vars.json"
@@ -720,17 +788,20 @@ def find_previous_runs(folder_name_path):
     return last_run_number
 
 
-def set_run_directory(root_folder_path):
+def set_run_directory(root_folder_path, resume=False):
     """
     Determine and make the folder for the run directory.
         -If no previous runs exist in the root_folder_path then make a new
             folder named root_folder_path + "Run_0"
+        -If resume is True and the last run in the root_folder_path has a
+            checkpoint for a run which did not complete, then reuse that folder.
         -If there are previous runs in the root_folder_path then make a
             new folder incremental increasing the name by 1 from the last
             run in the same output directory.
     Inputs:
     :param str root_folder_path: is the path of the root output folder. We will
         make a directory within this folder to store our output files
+    :param bool resume: if True resume the last run if it did not complete
     Returns:
     :returns: str folder_path: the string of the newly created directory for
         puting output folders
@@ -752,9 +823,21 @@ def set_run_directory(root_folder_path):
         os.makedirs(folder_path)
 
     else:
-        run_number = last_run_number + 1
-        folder_path = "{}{}{}".format(folder_name_path, run_number, os.sep)
-        os.makedirs(folder_path)
+        from smilesclickchem.operators.run_checkpoint import has_unfinished_checkpoint
+
+        last_folder_path = "{}{}{}".format(folder_name_path, last_run_number, os.sep)
+        if resume is True and has_unfinished_checkpoint(last_folder_path):
+            print("Resuming the unfinished run Run_{}.".format(last_run_number))
+            run_number = last_run_number
+            folder_path = last_folder_path
+        else:
+            if resume is True:
+                print(
+                    "There is no unfinished run to resume. Starting a new run."
+                )
+            run_number = last_run_number + 1
+            folder_path = "{}{}{}".format(folder_name_path, run_number, os.sep)
+            os.makedirs(folder_path)
 
     print("The Run number is: ", run_number)
     print("The Run folder path is: ", folder_path)